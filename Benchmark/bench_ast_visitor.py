@@ -0,0 +1,118 @@
+import os
+import sys
+import time
+import argparse
+import esprima
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Npm_Collector'))
+from ast_visitor import API_FLAGS, might_call_apis, parse_js, visit_calls
+
+
+def recursive_visit(content):
+    """
+    Cách làm cũ: parse mọi tệp rồi duyệt đệ quy tất cả thuộc tính của từng nút bằng getattr.
+    (Bản cũ lặp `for key in node` nên dừng ngay ở nút gốc; ở đây dùng node.keys() để đo đúng chi phí.)
+    """
+    flags = dict.fromkeys(API_FLAGS, 0)
+    try:
+        ast = esprima.parseScript(content, tolerant=True)
+    except Exception:
+        return flags
+
+    def traverse_ast(node):
+        if not node or not isinstance(node, esprima.nodes.Node):
+            return
+        if node.type == 'CallExpression':
+            callee = node.callee
+            if callee.type == 'Identifier' and 'eval' in callee.name:
+                flags['has_eval'] = 1
+        for key in node.keys():
+            value = getattr(node, key)
+            if isinstance(value, list):
+                for child_node in value:
+                    traverse_ast(child_node)
+            else:
+                traverse_ast(value)
+
+    try:
+        traverse_ast(ast)
+    except RecursionError:
+        pass
+    return flags
+
+
+def iterative_visit(content):
+    """Cách làm mới: lọc nhanh bằng token, parse, rồi duyệt bằng stack có cắt tỉa."""
+    flags = dict.fromkeys(API_FLAGS, 0)
+    if not might_call_apis(content):
+        return flags
+    ast = parse_js(content)
+    if ast is None:
+        return flags
+    return visit_calls(ast, flags)
+
+
+def time_call(func, content, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(content)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def collect_js_files(paths):
+    for path in paths:
+        if os.path.isfile(path):
+            yield path
+            continue
+        for root, _, files in os.walk(path):
+            for file in sorted(files):
+                if file.endswith('.js'):
+                    yield os.path.join(root, file)
+
+
+def main(paths, repeat, limit):
+    rows = []
+    for file_path in collect_js_files(paths):
+        try:
+            with open(file_path, 'r', encoding='utf-8') as f:
+                content = f.read()
+        except (OSError, UnicodeDecodeError):
+            continue
+
+        old_time = time_call(recursive_visit, content, repeat)
+        new_time = time_call(iterative_visit, content, repeat)
+        rows.append((file_path, len(content), might_call_apis(content), old_time, new_time))
+        if limit and len(rows) >= limit:
+            break
+
+    if not rows:
+        print("Not found any .js files.")
+        return
+
+    print(f"{'file':<60} {'size':>10} {'parsed':>7} {'old ms':>9} {'new ms':>9} {'speedup':>8}")
+    for file_path, size, parsed, old_time, new_time in rows:
+        name = file_path if len(file_path) <= 60 else '...' + file_path[-57:]
+        speedup = old_time / new_time if new_time > 0 else float('inf')
+        print(f"{name:<60} {size:>10} {str(parsed):>7} {old_time * 1000:>9.2f} {new_time * 1000:>9.2f} {speedup:>7.1f}x")
+
+    total_old = sum(row[3] for row in rows)
+    total_new = sum(row[4] for row in rows)
+    skipped = sum(1 for row in rows if not row[2])
+    print("------------------------------------------------------------")
+    print(f"Files: {len(rows)} (skipped by prefilter: {skipped})")
+    print(f"Total old: {total_old * 1000:.1f} ms, total new: {total_new * 1000:.1f} ms, speedup: {total_old / total_new:.2f}x")
+    print(f"Mean per file: old {total_old / len(rows) * 1000:.2f} ms, new {total_new / len(rows) * 1000:.2f} ms")
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Benchmark the recursive AST traversal against the iterative, pruned visitor.")
+    parser.add_argument("paths", nargs='+', help="JavaScript files or package directories to benchmark.")
+    parser.add_argument("--repeat", type=int, default=3, help="Number of runs per file (the best run is reported).")
+    parser.add_argument("--limit", type=int, default=0, help="Stop after this many files (0 = no limit).")
+
+    args = parser.parse_args()
+
+    main(args.paths, args.repeat, args.limit)
@@ -0,0 +1,329 @@
+import os
+import io
+import sys
+import json
+import time
+import random
+import platform
+import resource
+import argparse
+import tempfile
+import warnings
+import contextlib
+import numpy as np
+import pandas as pd
+import joblib
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BASE_DIR = os.path.join(BENCH_DIR, '..')
+sys.path.append(os.path.join(BASE_DIR, 'Npm_Collector'))
+sys.path.append(os.path.join(BASE_DIR, 'Prediction'))
+from extractor import hash_package, process_package
+from hash_index import build_index as build_hash_index, index_path
+from near_clone import build_index as build_near_clone_index, near_clone_path
+from clone_detector import find_clones_in_files
+from predict import list_model_paths, load_model, model_name_from_path, predict_scaled, prepare_features
+from synthetic_corpus import DEFAULT_SEED, KIND_COUNTS, generate_corpus
+
+DEFAULT_CORPUS_DIR = os.path.join(tempfile.gettempdir(), 'npm_bench_corpus')
+DEFAULT_BASELINE = os.path.join(BENCH_DIR, 'baseline.json')
+DEFAULT_MODELS = os.path.join(BASE_DIR, 'Trained_Model')
+DEFAULT_SCALER = os.path.join(BASE_DIR, 'Trained_Model', 'scaler.joblib')
+STAGES = ('extraction', 'hashing', 'clone_lookup', 'scoring')
+TOLERANCE = 0.25  # Chậm hơn baseline quá 25% thì coi là regression
+NOISE_FLOOR_MS = 0.5  # Chênh lệch độ trễ nhỏ hơn mức này là nhiễu đo, không tính là regression
+NOISE_FLOOR_MB = 5.0  # Chênh lệch bộ nhớ nhỏ hơn mức này cũng là nhiễu đo
+CLONE_REPEAT = 10  # Số lần chạy find_clones_in_files
+SCORING_REPEAT = 20  # Số lần chấm cả lô cho mỗi model
+SINGLE_ROW_REPEAT = 50  # Số lần chấm một dòng (độ trễ cho một gói)
+DECOY_HASHES = 100000  # Hash độc hại ngẫu nhiên thêm vào index để index có kích thước thật
+MALICIOUS_FRACTION = 0.1  # Tỉ lệ gói của corpus được coi là độc hại (bản sao chính xác / gần đúng)
+# Chỉ số được so với baseline: True nếu giá trị càng lớn càng tốt
+COMPARED_METRICS = {'items_per_s': True, 'p50_ms': False, 'p90_ms': False, 'rss_growth_mb': False}
+
+
+def peak_rss_mb():
+    """
+    RSS lớn nhất của process (VmHWM, đặt lại được bằng stage_memory()), hoặc ru_maxrss
+    (KB trên Linux) nếu không có /proc.
+    """
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def current_rss_mb():
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * resource.getpagesize() / 1024 ** 2
+
+
+@contextlib.contextmanager
+def stage_memory():
+    """
+    Đo bộ nhớ của riêng một bước: đặt lại RSS lớn nhất của process (/proc/self/clear_refs)
+    lúc bắt đầu, rồi ghi vào dict trả về RSS lớn nhất trong bước (peak_rss_mb) và phần tăng
+    so với lúc bắt đầu (rss_growth_mb). Không đặt lại được (không phải Linux) thì dict rỗng.
+    """
+    memory = {}
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        start = current_rss_mb()
+    except OSError:
+        yield memory
+        return
+    yield memory
+    peak = peak_rss_mb()
+    memory['peak_rss_mb'] = peak
+    memory['rss_growth_mb'] = max(0.0, peak - start)
+
+
+def summarize(latencies, total_seconds, items, total_bytes=None, **extra):
+    latencies_ms = np.asarray(latencies, dtype=np.float64) * 1000
+    stats = {
+        'count': len(latencies),
+        'total_s': total_seconds,
+        'items_per_s': items / total_seconds if total_seconds else 0.0,
+        'p50_ms': float(np.percentile(latencies_ms, 50)),
+        'p90_ms': float(np.percentile(latencies_ms, 90)),
+        'p99_ms': float(np.percentile(latencies_ms, 99)),
+        'max_ms': float(latencies_ms.max()),
+    }
+    if total_bytes is not None:
+        stats['bytes_per_s'] = total_bytes / total_seconds if total_seconds else 0.0
+    stats.update(extra)
+    return {key: round(value, 4) if isinstance(value, float) else value for key, value in stats.items()}
+
+
+def time_each(func, items):
+    """Gọi func cho từng phần tử; trả về (độ trễ từng lần, kết quả, tổng thời gian)."""
+    latencies = []
+    results = []
+    start = time.perf_counter()
+    for item in items:
+        begin = time.perf_counter()
+        results.append(func(item))
+        latencies.append(time.perf_counter() - begin)
+    return latencies, results, time.perf_counter() - start
+
+
+def bench_extraction(corpus, results):
+    """process_package trên mọi gói, cộng thêm thống kê riêng cho từng loại gói."""
+    with stage_memory() as memory:
+        latencies, features, total = time_each(lambda package: process_package(package['path']), corpus)
+    results['extraction'] = summarize(latencies, total, len(corpus), sum(package['bytes'] for package in corpus), **memory)
+    for kind in KIND_COUNTS:
+        positions = [i for i, package in enumerate(corpus) if package['kind'] == kind]
+        if positions:
+            kind_latencies = [latencies[i] for i in positions]
+            results[f"extraction/{kind}"] = summarize(kind_latencies, sum(kind_latencies), len(positions),
+                                                      sum(corpus[i]['bytes'] for i in positions))
+    rows = []
+    for package, package_features in zip(corpus, features):
+        if package_features:
+            rows.append(dict(package_features, package_name=package['name']))
+    return pd.DataFrame(rows)
+
+
+def bench_hashing(corpus, results):
+    """hash_package ở cả hai chế độ; trả về bảng hash (md5 + file_digests) cho bước tra clone."""
+    total_bytes = sum(package['bytes'] for package in corpus)
+    rows = []
+    for mode in ('md5', 'merkle'):
+        def run(package):
+            file_digests = set()
+            return hash_package(package['path'], mode, None, file_digests), file_digests
+        with stage_memory() as memory:
+            latencies, hashes, total = time_each(run, corpus)
+        results[f"hashing/{mode}"] = summarize(latencies, total, len(corpus), total_bytes, **memory)
+        if mode == 'md5':
+            rows = [{'package_name': package['name'], 'hash': package_hash, 'file_digests': ' '.join(sorted(digests))}
+                    for package, (package_hash, digests) in zip(corpus, hashes)]
+    return pd.DataFrame(rows)
+
+
+def make_malicious_set(hashes_df, seed):
+    """
+    Tập hash độc hại giả lập: một phần gói của corpus (bản sao chính xác), một phần gói đã
+    bỏ bớt một tệp (bản sao gần đúng, hash khác) và DECOY_HASHES hash ngẫu nhiên.
+    """
+    rng = random.Random(seed)
+    count = max(1, int(len(hashes_df) * MALICIOUS_FRACTION))
+    picked = rng.sample(range(len(hashes_df)), 2 * count)
+    exact = hashes_df.iloc[picked[:count]]
+    near = hashes_df.iloc[picked[count:]].copy()
+    near['hash'] = [f"{rng.getrandbits(128):032x}" for _ in range(len(near))]
+    near['file_digests'] = [' '.join(digests.split()[1:]) for digests in near['file_digests']]
+    decoys = pd.DataFrame({'package_name': [f"decoy-{i}" for i in range(DECOY_HASHES)],
+                           'hash': [f"{rng.getrandbits(128):032x}" for _ in range(DECOY_HASHES)],
+                           'file_digests': ''})
+    return pd.concat([exact, near, decoys], ignore_index=True)
+
+
+def bench_clone_lookup(hashes_df, seed, results):
+    """find_clones_in_files (index .idx + .lsh) trên bảng hash của corpus, chạy trong thư mục tạm."""
+    with stage_memory() as memory, tempfile.TemporaryDirectory() as work_dir:
+        malicious_csv = os.path.join(work_dir, 'malicious_hashes.csv')
+        new_csv = os.path.join(work_dir, 'bench_hashes.csv')
+        make_malicious_set(hashes_df, seed).to_csv(malicious_csv, index=False)
+        hashes_df.to_csv(new_csv, index=False)
+        start = time.perf_counter()
+        build_hash_index([malicious_csv], index_path(malicious_csv))
+        build_near_clone_index([malicious_csv], near_clone_path(malicious_csv))
+        build_time = time.perf_counter() - start
+
+        # clone_detector ghi kết quả vào ../Prediction_Result so với thư mục hiện tại
+        run_dir = os.path.join(work_dir, 'run')
+        os.makedirs(run_dir)
+        os.makedirs(os.path.join(work_dir, 'Prediction_Result'))
+        cwd = os.getcwd()
+        os.chdir(run_dir)
+        try:
+            def run(_):
+                with contextlib.redirect_stdout(io.StringIO()):
+                    find_clones_in_files(malicious_csv, new_csv)
+            latencies, _, total = time_each(run, range(CLONE_REPEAT))
+        finally:
+            os.chdir(cwd)
+    results['clone_lookup'] = summarize(latencies, total, len(hashes_df) * CLONE_REPEAT,
+                                        index_build_ms=build_time * 1000, **memory)
+
+
+def bench_scoring(features_df, model_paths, scaler_path, results):
+    """Chấm điểm cả lô và từng dòng bằng từng model (giống predict_unified: load_model + predict_scaled)."""
+    scaler = joblib.load(scaler_path)
+    X = np.asarray(prepare_features(features_df, scaler), dtype=np.float64)
+    for model_path in model_paths:
+        name = model_name_from_path(model_path)
+        with stage_memory() as memory:
+            try:
+                start = time.perf_counter()
+                model, is_keras_model = load_model(model_path)
+                load_time = time.perf_counter() - start
+            except (ImportError, ValueError, OSError) as e:
+                print(f"  Skip model {name}: {e}")
+                continue
+            predict_scaled(model, is_keras_model, X[:1])  # Lần chạy đầu (khởi tạo) không tính
+            latencies, _, total = time_each(lambda _: predict_scaled(model, is_keras_model, X), range(SCORING_REPEAT))
+            single, _, _ = time_each(lambda i: predict_scaled(model, is_keras_model, X[i:i + 1]),
+                                     [i % len(X) for i in range(SINGLE_ROW_REPEAT)])
+        results[f"scoring/{name}"] = summarize(latencies, total, len(X) * SCORING_REPEAT,
+                                               load_ms=load_time * 1000,
+                                               single_row_p50_ms=float(np.percentile(single, 50)) * 1000, **memory)
+
+
+def run_suite(corpus_dir, seed, scale, model_paths, scaler_path, stages=STAGES):
+    start = time.perf_counter()
+    corpus = generate_corpus(corpus_dir, seed, scale)
+    print(f"Corpus: {len(corpus)} packages, {sum(package['bytes'] for package in corpus) / 1024 ** 2:.1f} MB "
+          f"in '{corpus_dir}' (seed {seed}, scale {scale}), ready in {time.perf_counter() - start:.1f}s")
+    results = {}
+    # stage_memory() đặt lại RSS lớn nhất của process: RSS lớn nhất của cả lần chạy là max của các bước
+    peaks = [peak_rss_mb()]
+    # Bước sau dùng kết quả của bước trước nên luôn chạy trích xuất / hash, chỉ bỏ qua phần báo cáo
+    features_df = bench_extraction(corpus, results)
+    hashes_df = bench_hashing(corpus, results)
+    if 'clone_lookup' in stages:
+        bench_clone_lookup(hashes_df, seed, results)
+    if 'scoring' in stages:
+        bench_scoring(features_df, model_paths, scaler_path, results)
+    peaks += [stats['peak_rss_mb'] for stats in results.values() if 'peak_rss_mb' in stats] + [peak_rss_mb()]
+    results = {stage: stats for stage, stats in results.items() if stage.split('/')[0] in stages}
+    return {
+        'meta': {'seed': seed, 'scale': scale, 'packages': len(corpus), 'python': platform.python_version(),
+                 'machine': platform.machine(), 'cpus': os.cpu_count(), 'date': time.strftime('%Y-%m-%d %H:%M:%S')},
+        'stages': results,
+        'peak_rss_mb': round(max(peaks), 1),
+    }
+
+
+def print_results(report):
+    print(f"{'stage':<32} {'items/s':>10} {'MB/s':>8} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'max ms':>9} {'RSS +MB':>8}")
+    for stage, stats in report['stages'].items():
+        mb_per_s = f"{stats['bytes_per_s'] / 1024 ** 2:8.2f}" if 'bytes_per_s' in stats else f"{'':>8}"
+        # Bộ nhớ chỉ đo được cho cả bước (không cho từng loại gói của extraction)
+        growth = f"{stats['rss_growth_mb']:8.1f}" if 'rss_growth_mb' in stats else f"{'':>8}"
+        print(f"{stage:<32} {stats['items_per_s']:>10.1f} {mb_per_s} {stats['p50_ms']:>9.2f} {stats['p90_ms']:>9.2f} "
+              f"{stats['p99_ms']:>9.2f} {stats['max_ms']:>9.2f} {growth}")
+
+
+def compare(report, baseline, tolerance=TOLERANCE):
+    """In thay đổi so với baseline; trả về danh sách (stage, chỉ số) chậm/tốn bộ nhớ hơn quá tolerance."""
+    if (baseline['meta'].get('seed'), baseline['meta'].get('scale')) != (report['meta']['seed'], report['meta']['scale']):
+        print("Warning: baseline was measured on a different corpus (seed/scale), the comparison is not meaningful.")
+    if (baseline['meta'].get('machine'), baseline['meta'].get('cpus')) != (report['meta']['machine'], report['meta']['cpus']):
+        print("Warning: baseline was measured on a different machine.")
+    regressions = []
+    print(f"\n{'stage':<32} {'metric':<12} {'baseline':>10} {'current':>10} {'change':>8}")
+    # RSS lớn nhất của cả lần chạy được so như một bước riêng
+    rows = list(report['stages'].items()) + [('(suite)', {'peak_rss_mb': report['peak_rss_mb']})]
+    old_rows = dict(baseline['stages'], **{'(suite)': {'peak_rss_mb': baseline.get('peak_rss_mb')}})
+    for stage, stats in rows:
+        old_stats = old_rows.get(stage)
+        if old_stats is None:
+            print(f"{stage:<32} (new stage)")
+            continue
+        metrics = {'peak_rss_mb': False} if stage == '(suite)' else COMPARED_METRICS
+        for metric, higher_is_better in metrics.items():
+            old, new = old_stats.get(metric), stats.get(metric)
+            if old is None or new is None:
+                continue
+            # Bước gần như không tăng bộ nhớ: so với NOISE_FLOOR_MB thay vì một số gần 0
+            base = max(old, NOISE_FLOOR_MB) if metric.endswith('_mb') else old
+            if not base:
+                continue
+            change = (new - old) / base
+            worse = -change if higher_is_better else change
+            flag = ''
+            if metric.endswith('_ms') and abs(new - old) < NOISE_FLOOR_MS:
+                worse = 0
+            if metric.endswith('_mb') and abs(new - old) < NOISE_FLOOR_MB:
+                worse = 0
+            if worse > tolerance:
+                flag = 'REGRESSION'
+                regressions.append((stage, metric))
+            print(f"{stage:<32} {metric:<12} {old:>10.2f} {new:>10.2f} {change * 100:>+7.1f}% {flag}")
+    return regressions
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="End-to-end benchmark (extraction, hashing, clone lookup, model scoring) on a seeded synthetic corpus.")
+    parser.add_argument("--corpus_dir", default=DEFAULT_CORPUS_DIR, help="Where the synthetic corpus is generated (reused if it matches).")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    parser.add_argument("--scale", type=float, default=1.0, help="Corpus size multiplier.")
+    parser.add_argument("--models", default=DEFAULT_MODELS, help="Model folder or comma-separated model files.")
+    parser.add_argument("--scaler", default=DEFAULT_SCALER)
+    parser.add_argument("--stages", default=','.join(STAGES), help=f"Comma-separated subset of {', '.join(STAGES)}.")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="Stored results to compare against.")
+    parser.add_argument("--save_baseline", action="store_true", help="Store this run as the new baseline.")
+    parser.add_argument("--output", default=None, help="Also write the results of this run to a JSON file.")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE,
+                        help="Relative slowdown (or memory growth) reported as a regression; exit code 1 if any.")
+    args = parser.parse_args()
+
+    warnings.filterwarnings("ignore")
+    stages = [stage for stage in args.stages.split(',') if stage]
+    report = run_suite(args.corpus_dir, args.seed, args.scale, list_model_paths(args.models), args.scaler, stages)
+    print_results(report)
+    print(f"Peak RSS: {report['peak_rss_mb']:.1f} MB")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=1)
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(report, f, indent=1)
+        print(f"Saved baseline to '{args.baseline}'")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} regressions above {args.tolerance * 100:.0f}%")
+            sys.exit(1)
+        print("\nNo regression against the baseline.")
@@ -0,0 +1,71 @@
+import os
+import sys
+import time
+import argparse
+import warnings
+import numpy as np
+import joblib
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Prediction'))
+from predict import prepare_features
+from storage import read_table
+from tree_engine import TreeEnsemble, compile_model, compiled_path
+
+BASE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+DEFAULT_MODELS = [os.path.join(BASE_DIR, 'Trained_Model', 'random_forest_model.joblib'),
+                  os.path.join(BASE_DIR, 'Trained_Model', 'light_gbm_model.joblib')]
+DEFAULT_SCALER = os.path.join(BASE_DIR, 'Trained_Model', 'scaler.joblib')
+DEFAULT_INPUT = os.path.join(BASE_DIR, 'Features_Extracted', '2025-07-03.csv')
+
+
+def best_time(func, repeat):
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main(model_paths, scaler_path, input_path, sizes, repeat):
+    scaler = joblib.load(scaler_path)
+    base = np.asarray(prepare_features(read_table(input_path), scaler), dtype=np.float64)
+    print(f"Input: {len(base)} rows from '{input_path}' (repeated to reach each batch size)")
+
+    for model_path in model_paths:
+        compiled = compiled_path(model_path) or compile_model(model_path)
+        name = os.path.splitext(os.path.basename(model_path))[0]
+        print("------------------------------------------------------------")
+        print(f"Model: {name}")
+
+        # Cách cũ (predict_unified): joblib.load rồi model.predict
+        old_load, original = best_time(lambda: joblib.load(model_path), repeat)
+        new_load, engine = best_time(lambda: TreeEnsemble(compiled), repeat)
+        print(f"Load: joblib {old_load * 1000:.1f} ms, mmap {new_load * 1000:.2f} ms ({old_load / new_load:.0f}x)")
+
+        print(f"{'rows':>8} {'old ms':>10} {'new ms':>10} {'old rows/s':>12} {'new rows/s':>12} {'speedup':>8} {'identical':>10}")
+        for size in sizes:
+            X = np.resize(base, (size, base.shape[1]))
+            old_time, old_labels = best_time(lambda: original.predict(X), repeat)
+            new_time, new_labels = best_time(lambda: engine.predict(X), repeat)
+            identical = np.array_equal(old_labels, new_labels) and \
+                np.array_equal(original.predict_proba(X), engine.predict_proba(X))
+            print(f"{size:>8} {old_time * 1000:>10.2f} {new_time * 1000:>10.2f} {size / old_time:>12.0f} "
+                  f"{size / new_time:>12.0f} {old_time / new_time:>7.1f}x {str(identical):>10}")
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Benchmark compiled tree ensembles against joblib-loaded sklearn/LightGBM models.")
+    parser.add_argument("models", nargs='*', default=DEFAULT_MODELS, help="Random forest / LightGBM .joblib models.")
+    parser.add_argument("--scaler", default=DEFAULT_SCALER, help="Path to scaler.joblib.")
+    parser.add_argument("--input", default=DEFAULT_INPUT, help="Features file used as benchmark data.")
+    parser.add_argument("--sizes", type=int, nargs='+', default=[1, 100, 10000, 100000], help="Batch sizes to time.")
+    parser.add_argument("--repeat", type=int, default=3, help="Number of runs per measurement (the best run is reported).")
+
+    args = parser.parse_args()
+
+    # sklearn cảnh báo khi nạp model của phiên bản khác
+    warnings.filterwarnings('ignore')
+    main(args.models, args.scaler, args.input, args.sizes, args.repeat)
@@ -0,0 +1,204 @@
+import os
+import json
+import base64
+import random
+import shutil
+import argparse
+
+CORPUS_VERSION = 1  # Tăng khi đổi cách sinh để không dùng lại corpus cũ
+DEFAULT_SEED = 20250703
+# Số gói mỗi loại với scale=1
+KIND_COUNTS = {
+    'tiny': 200,          # package.json + index.js vài trăm byte
+    'deep': 10,           # cây node_modules lồng nhiều tầng, nhiều tệp nhỏ
+    'minified': 4,        # một bundle .min.js rất lớn trên một dòng
+    'obfuscated': 20,     # chuỗi entropy cao, tên biến _0x..., eval/atob
+    'broken_json': 20,    # package.json hỏng
+}
+MINIFIED_BYTES = 512 * 1024  # Kích thước bundle với scale=1
+OBFUSCATED_BYTES = 48 * 1024
+DEEP_LEVELS = 5  # Số tầng node_modules
+DEEP_BRANCHING = 2
+
+MODULES = ['fs', 'path', 'http', 'https', 'os', 'crypto', 'net', 'child_process', 'zlib', 'util']
+CALLS = ['readFileSync', 'writeFileSync', 'request', 'get', 'exec', 'spawn', 'createHash', 'connect', 'homedir']
+HOSTS = ['example.com', 'cdn.example.org', 'api.test.io', 'registry.local', 'files.example.net']
+
+
+def identifier(rng, length=None):
+    length = length or rng.randint(3, 10)
+    first = rng.choice('abcdefghijklmnopqrstuvwxyz_$')
+    return first + ''.join(rng.choice('abcdefghijklmnopqrstuvwxyz0123456789_') for _ in range(length - 1))
+
+
+def readable_js(rng, num_functions):
+    """Mã JS bình thường: require, hàm, URL/IP thỉnh thoảng xuất hiện."""
+    lines = [f"const {module.replace('_', '')} = require('{module}');" for module in rng.sample(MODULES, 3)]
+    for _ in range(num_functions):
+        name, arg = identifier(rng), identifier(rng)
+        body = [f"  const {identifier(rng)} = {arg} + {rng.randint(0, 1000)};"]
+        if rng.random() < 0.3:
+            body.append(f"  fetch('https://{rng.choice(HOSTS)}/{identifier(rng)}');")
+        if rng.random() < 0.1:
+            body.append(f"  const host = '{rng.randint(1, 254)}.{rng.randint(0, 255)}.{rng.randint(0, 255)}.{rng.randint(1, 254)}';")
+        if rng.random() < 0.2:
+            body.append(f"  {rng.choice(['fs', 'os', 'http', 'crypto'])}.{rng.choice(CALLS)}({arg});")
+        lines.append(f"function {name}({arg}) {{\n" + "\n".join(body) + f"\n  return {arg};\n}}")
+    lines.append(f"module.exports = {{ {', '.join(identifier(rng) for _ in range(3))} }};")
+    return "\n".join(lines) + "\n"
+
+
+def minified_js(rng, size):
+    """Bundle đã minify: các câu lệnh ngắn nối liền trên một dòng tới khi đạt size byte."""
+    parts = ["!function(e,t){"]
+    total = len(parts[0])
+    while total < size:
+        a, b, c = identifier(rng, 1), identifier(rng, 1), identifier(rng, 2)
+        statement = rng.choice([
+            f"var {a}=function({b},{c}){{return {b}+{c}*{rng.randint(0, 99)}}};",
+            f"{a}.{c}=function(){{return this.{b}||{rng.randint(0, 9)}}};",
+            f"for(var {b}=0;{b}<{rng.randint(2, 64)};{b}++){a}[{b}]={c}({b});",
+            f"if({a}&&{b}){{{c}=\"{identifier(rng)}\"}}else{{{c}=null}};",
+        ])
+        parts.append(statement)
+        total += len(statement)
+    parts.append("}(this);")
+    return "".join(parts)
+
+
+def obfuscated_js(rng, size):
+    """Mã bị làm rối: mảng chuỗi base64/hex entropy cao, tên _0x..., eval(atob(...))."""
+    names = [f"_0x{rng.getrandbits(24):06x}" for _ in range(8)]
+    strings = []
+    total = 0
+    while total < size:
+        blob = base64.b64encode(rng.randbytes(rng.randint(32, 256))).decode('ascii')
+        if rng.random() < 0.3:
+            blob = ''.join(f"\\x{byte:02x}" for byte in rng.randbytes(rng.randint(16, 64)))
+        strings.append(blob)
+        total += len(blob) + 3
+    array = ','.join("'" + blob + "'" for blob in strings)
+    return (f"var {names[0]}=[{array}];"
+            f"(function({names[1]},{names[2]}){{var {names[3]}=function({names[4]}){{while(--{names[4]}){{"
+            f"{names[1]}['push']({names[1]}['shift']())}}}};{names[3]}(++{names[2]})}}({names[0]},0x{rng.getrandbits(8):x}));"
+            f"var {names[5]}=function({names[6]}){{return {names[0]}[{names[6]}-0x0]}};"
+            f"eval(atob({names[5]}('0x0')));require('child_process')['exec']({names[5]}('0x1'));\n")
+
+
+def package_json(rng, name, broken=False):
+    data = {
+        'name': name,
+        'version': f"{rng.randint(0, 9)}.{rng.randint(0, 20)}.{rng.randint(0, 50)}",
+        'description': ' '.join(identifier(rng) for _ in range(rng.randint(0, 8))),
+        'main': 'index.js',
+        'scripts': {'test': 'echo ok'},
+        'dependencies': {identifier(rng): f"^{rng.randint(0, 5)}.0.0" for _ in range(rng.randint(0, 5))},
+    }
+    if rng.random() < 0.2:
+        data['scripts']['postinstall'] = f"node {identifier(rng)}.js"
+    text = json.dumps(data, indent=2)
+    if broken:
+        # Các kiểu hỏng hay gặp: cắt cụt, dấu phẩy thừa, không phải JSON
+        text = rng.choice([text[:rng.randint(1, len(text) - 1)], text.replace('}', ',}', 1), "not json {", ""])
+    return text
+
+
+def write_file(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(content)
+
+
+def make_tiny(rng, path, name):
+    write_file(os.path.join(path, 'package.json'), package_json(rng, name))
+    write_file(os.path.join(path, 'index.js'), readable_js(rng, rng.randint(1, 4)))
+
+
+def make_deep(rng, path, name, level=0):
+    write_file(os.path.join(path, 'package.json'), package_json(rng, name))
+    write_file(os.path.join(path, 'index.js'), readable_js(rng, rng.randint(2, 6)))
+    for i in range(rng.randint(1, 3)):
+        write_file(os.path.join(path, 'lib', f"{identifier(rng)}.js"), readable_js(rng, rng.randint(1, 5)))
+    write_file(os.path.join(path, 'README.md'), f"# {name}\n" + ' '.join(identifier(rng) for _ in range(50)))
+    if level < DEEP_LEVELS:
+        for _ in range(DEEP_BRANCHING):
+            dependency = identifier(rng)
+            make_deep(rng, os.path.join(path, 'node_modules', dependency), dependency, level + 1)
+
+
+def make_minified(rng, path, name, scale):
+    write_file(os.path.join(path, 'package.json'), package_json(rng, name))
+    write_file(os.path.join(path, 'dist', 'bundle.min.js'), minified_js(rng, int(MINIFIED_BYTES * scale)))
+    write_file(os.path.join(path, 'index.js'), "module.exports = require('./dist/bundle.min.js');\n")
+
+
+def make_obfuscated(rng, path, name, scale):
+    write_file(os.path.join(path, 'package.json'), package_json(rng, name))
+    write_file(os.path.join(path, 'index.js'), obfuscated_js(rng, int(OBFUSCATED_BYTES * scale)))
+
+
+def make_broken_json(rng, path, name):
+    write_file(os.path.join(path, 'package.json'), package_json(rng, name, broken=True))
+    write_file(os.path.join(path, 'index.js'), readable_js(rng, rng.randint(1, 3)))
+
+
+def directory_bytes(path):
+    return sum(os.path.getsize(os.path.join(root, file)) for root, _, files in os.walk(path) for file in files)
+
+
+def generate_corpus(out_dir, seed=DEFAULT_SEED, scale=1.0, counts=None):
+    """
+    Sinh corpus gói npm giả lập trong out_dir (mỗi gói một thư mục <loại>-<i>). Cùng seed và
+    scale luôn cho cùng nội dung; corpus đã có với cùng tham số được dùng lại.
+    Trả về danh sách {'name', 'kind', 'path', 'bytes'}.
+    """
+    counts = counts or {kind: max(1, round(count * scale)) for kind, count in KIND_COUNTS.items()}
+    params = {'version': CORPUS_VERSION, 'seed': seed, 'scale': scale, 'counts': counts}
+    manifest_path = os.path.join(out_dir, 'manifest.json')
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        if manifest.get('params') == params:
+            for package in manifest['packages']:
+                package['path'] = os.path.join(out_dir, package['name'])
+            return manifest['packages']
+        shutil.rmtree(out_dir)
+
+    packages = []
+    for kind, count in counts.items():
+        for i in range(count):
+            # Mỗi gói có seed riêng: thêm/bớt gói của loại khác không làm đổi nội dung gói này
+            rng = random.Random(f"{seed}-{kind}-{i}")
+            name = f"{kind}-{i}"
+            path = os.path.join(out_dir, name)
+            if kind == 'tiny':
+                make_tiny(rng, path, name)
+            elif kind == 'deep':
+                make_deep(rng, path, name)
+            elif kind == 'minified':
+                make_minified(rng, path, name, scale)
+            elif kind == 'obfuscated':
+                make_obfuscated(rng, path, name, scale)
+            else:
+                make_broken_json(rng, path, name)
+            packages.append({'name': name, 'kind': kind, 'bytes': directory_bytes(path)})
+
+    with open(manifest_path, 'w') as f:
+        json.dump({'params': params, 'packages': packages}, f, indent=1)
+    for package in packages:
+        package['path'] = os.path.join(out_dir, package['name'])
+    return packages
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Generate a reproducible synthetic corpus of npm package folders.")
+    parser.add_argument("out_dir", help="Folder to write the packages into.")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED, help="Same seed and scale always give the same corpus.")
+    parser.add_argument("--scale", type=float, default=1.0, help="Multiplies the number of packages and the bundle sizes.")
+    args = parser.parse_args()
+
+    corpus = generate_corpus(args.out_dir, args.seed, args.scale)
+    for kind in KIND_COUNTS:
+        items = [package for package in corpus if package['kind'] == kind]
+        print(f"{kind:>12}: {len(items):>5} packages, {sum(package['bytes'] for package in items) / 1024 ** 2:8.2f} MB")
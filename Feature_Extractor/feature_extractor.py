@@ -1,20 +1,13 @@
 import os
+import sys
 import json
 import re
-import math
-import esprima 
 import pandas as pd
-from collections import Counter
 
-
-def calculate_entropy(s):
-    """Tính toán entropy của một chuỗi ký tự."""
-    if not s:
-        return 0
-    # Đếm tần suất xuất hiện của mỗi ký tự
-    p, lns = Counter(s), float(len(s))
-    # Công thức Shannon entropy
-    return -sum(count / lns * math.log(count / lns, 2) for count in p.values())
+# Dùng chung module entropy và bộ duyệt AST với Npm_Collector
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Npm_Collector'))
+from entropy import calculate_entropy, window_entropy_stats
+from ast_visitor import scan_api_usage
 
 
 # --- Các hàm trích xuất đặc tính chính ---
@@ -64,6 +57,8 @@ def extract_static_code_features(package_path):
         'total_code_size': 0,
         'avg_entropy': 0.0,
         'max_entropy': 0.0,
+        'max_window_entropy': 0.0,
+        'p95_window_entropy': 0.0,
         'num_urls': 0,
         'num_ips': 0,
         # Các hàm API đáng ngờ
@@ -100,35 +95,20 @@ def extract_static_code_features(package_path):
                     total_entropy += entropy
                     if entropy > features['max_entropy']:
                         features['max_entropy'] = entropy
+
+                    # Entropy theo cửa sổ trượt trên bytes của tệp
+                    window_max, window_p95 = window_entropy_stats(content.encode('utf-8'))
+                    features['max_window_entropy'] = max(features['max_window_entropy'], window_max)
+                    features['p95_window_entropy'] = max(features['p95_window_entropy'], window_p95)
                     
                     # Tìm URL và IP bằng regex
                     features['num_urls'] += len(url_pattern.findall(content))
                     features['num_ips'] += len(ip_pattern.findall(content))
                     
                     # Phân tích AST để tìm các lệnh gọi hàm nguy hiểm
-                    ast = esprima.parseScript(content, tolerant=True)
-                    for node in ast.body:
-                        if hasattr(node, 'type') and node.type == 'ExpressionStatement':
-                            expr = node.expression
-                            if hasattr(expr, 'type') and expr.type == 'CallExpression':
-                                callee = expr.callee
-                                if hasattr(callee, 'name'):
-                                    if 'eval' in callee.name:
-                                        features['has_eval'] = 1
-                                elif hasattr(callee, 'type') and callee.type == 'MemberExpression':
-                                    obj_name = callee.object.name if hasattr(callee.object, 'name') else ''
-                                    prop_name = callee.property.name if hasattr(callee.property, 'name') else ''
-                                    
-                                    if obj_name == 'require':
-                                        arg = expr.arguments[0].value if expr.arguments else ''
-                                        if arg == 'child_process':
-                                            features['has_child_process'] = 1
-                                        elif arg == 'fs' or arg == 'fs-extra':
-                                            features['has_fs_access'] = 1
-                                        elif arg == 'http' or arg == 'https' or arg == 'net':
-                                            features['has_network_access'] = 1
-                                        elif arg == 'os':
-                                            features['has_os_access'] = 1
+                    for flag, value in scan_api_usage(content).items():
+                        if value:
+                            features[flag] = 1
 
             except Exception:
                 # Bỏ qua các tệp không thể đọc hoặc phân tích cú pháp
@@ -0,0 +1,188 @@
+import re
+import esprima
+
+
+API_FLAGS = ('has_eval', 'has_child_process', 'has_fs_access', 'has_network_access', 'has_os_access')
+
+# Module được require/import -> đặc tính tương ứng
+SUSPICIOUS_MODULES = {
+    'child_process': 'has_child_process',
+    'fs': 'has_fs_access',
+    'fs-extra': 'has_fs_access',
+    'http': 'has_network_access',
+    'https': 'has_network_access',
+    'net': 'has_network_access',
+    'os': 'has_os_access',
+}
+
+# Nếu tệp không chứa token nào trong số này thì không thể có lời gọi cần tìm.
+# '\\u' được giữ vì esprima giải mã escape trong tên định danh (ví dụ eval).
+PREFILTER_TOKENS = ('eval', 'require', 'import', '\\u')
+PREFILTER_TOKENS_BYTES = tuple(token.encode('ascii') for token in PREFILTER_TOKENS)
+
+# Dùng khi không parse được tệp (quá giới hạn kích thước/thời gian): tìm lời gọi theo mẫu
+# văn bản. Kém chính xác hơn AST (có thể khớp cả trong chuỗi/comment) nhưng không bỏ sót tín hiệu.
+EVAL_PATTERN = re.compile(r'\beval\s*\(')
+MODULE_PATTERN = re.compile(r'''(?:\brequire\s*\(\s*|\bimport\s*\(\s*|\bfrom\s*|\bimport\s+)(['"`])([^'"`\n]{1,214})\1''')
+
+# Các thuộc tính con có thể chứa CallExpression, theo từng loại nút.
+# Những loại nút không có trong bảng (Literal, Identifier, ThisExpression, ...)
+# không thể chứa lời gọi hàm nên không cần duyệt xuống.
+CHILD_KEYS = {
+    'Program': ('body',),
+    'ArrayExpression': ('elements',),
+    'ArrayPattern': ('elements',),
+    'ArrowFunctionExpression': ('params', 'body'),
+    'AssignmentExpression': ('left', 'right'),
+    'AssignmentPattern': ('left', 'right'),
+    'AwaitExpression': ('argument',),
+    'BinaryExpression': ('left', 'right'),
+    'LogicalExpression': ('left', 'right'),
+    'BlockStatement': ('body',),
+    'CallExpression': ('callee', 'arguments'),
+    'NewExpression': ('callee', 'arguments'),
+    'CatchClause': ('param', 'body'),
+    'ClassBody': ('body',),
+    'ClassDeclaration': ('superClass', 'body'),
+    'ClassExpression': ('superClass', 'body'),
+    'MemberExpression': ('object', 'property'),
+    'ConditionalExpression': ('test', 'consequent', 'alternate'),
+    'IfStatement': ('test', 'consequent', 'alternate'),
+    'DoWhileStatement': ('body', 'test'),
+    'WhileStatement': ('test', 'body'),
+    'ExportDefaultDeclaration': ('declaration',),
+    'ExportNamedDeclaration': ('declaration',),
+    'ExpressionStatement': ('expression',),
+    'ForInStatement': ('left', 'right', 'body'),
+    'ForOfStatement': ('left', 'right', 'body'),
+    'ForStatement': ('init', 'test', 'update', 'body'),
+    'FunctionDeclaration': ('params', 'body'),
+    'FunctionExpression': ('params', 'body'),
+    'ImportDeclaration': ('source',),
+    'LabeledStatement': ('body',),
+    'MethodDefinition': ('key', 'value'),
+    'FieldDefinition': ('key', 'value'),
+    'ObjectExpression': ('properties',),
+    'ObjectPattern': ('properties',),
+    'Property': ('key', 'value'),
+    'RestElement': ('argument',),
+    'ReturnStatement': ('argument',),
+    'SequenceExpression': ('expressions',),
+    'SpreadElement': ('argument',),
+    'SwitchCase': ('test', 'consequent'),
+    'SwitchStatement': ('discriminant', 'cases'),
+    'TaggedTemplateExpression': ('tag', 'quasi'),
+    'TemplateLiteral': ('expressions',),
+    'ThrowStatement': ('argument',),
+    'TryStatement': ('block', 'handler', 'finalizer'),
+    'UnaryExpression': ('argument',),
+    'UpdateExpression': ('argument',),
+    'VariableDeclaration': ('declarations',),
+    'VariableDeclarator': ('id', 'init'),
+    'WithStatement': ('object', 'body'),
+    'YieldExpression': ('argument',),
+}
+
+
+def might_call_apis(content):
+    """Lọc nhanh trên chuỗi/bytes: False nếu chắc chắn không cần parse tệp."""
+    tokens = PREFILTER_TOKENS_BYTES if isinstance(content, (bytes, bytearray, memoryview)) else PREFILTER_TOKENS
+    return any(token in content for token in tokens)
+
+
+def module_flag(name):
+    """'node:fs/promises' -> 'has_fs_access'."""
+    if not isinstance(name, str):
+        return None
+    if name.startswith('node:'):
+        name = name[5:]
+    if not name.startswith('@'):
+        name = name.split('/', 1)[0]
+    return SUSPICIOUS_MODULES.get(name)
+
+
+def parse_js(content):
+    """Parse mã nguồn dạng script, nếu lỗi thì thử lại dạng ES module. Trả về None nếu không parse được."""
+    try:
+        return esprima.parseScript(content, tolerant=True)
+    except Exception:
+        if 'import' not in content and 'export' not in content:
+            return None
+    try:
+        return esprima.parseModule(content, tolerant=True)
+    except Exception:
+        return None
+
+
+def visit_calls(ast, flags):
+    """
+    Duyệt cây AST bằng stack (không đệ quy) và bật các cờ trong flags khi gặp
+    lời gọi eval, require(...)/import(...) hoặc câu lệnh import của module đáng ngờ.
+    """
+    stack = [ast]
+    remaining = sum(1 for flag in API_FLAGS if not flags[flag])
+
+    while stack and remaining:
+        node = stack.pop()
+        node_type = node.type
+
+        if node_type == 'CallExpression':
+            callee = node.callee
+            callee_type = callee.type
+            flag = None
+            if callee_type == 'Identifier':
+                if 'eval' in callee.name:
+                    flag = 'has_eval'
+                elif callee.name == 'require' and node.arguments:
+                    flag = module_flag(node.arguments[0].value)
+            elif callee_type == 'Import' and node.arguments:
+                flag = module_flag(node.arguments[0].value)
+            if flag and not flags[flag]:
+                flags[flag] = 1
+                remaining -= 1
+        elif node_type == 'ImportDeclaration':
+            flag = module_flag(node.source.value)
+            if flag and not flags[flag]:
+                flags[flag] = 1
+                remaining -= 1
+
+        child_keys = CHILD_KEYS.get(node_type)
+        if not child_keys:
+            continue
+        attributes = node.__dict__
+        for key in child_keys:
+            child = attributes.get(key)
+            if child is None:
+                continue
+            if isinstance(child, list):
+                stack.extend(item for item in child if item is not None)
+            else:
+                stack.append(child)
+
+    return flags
+
+
+def scan_api_usage(content):
+    """Trả về dict các cờ API đáng ngờ (has_eval, has_child_process, ...) của một tệp JavaScript."""
+    flags = dict.fromkeys(API_FLAGS, 0)
+    if not might_call_apis(content):
+        return flags
+
+    ast = parse_js(content)
+    if ast is None:
+        return flags
+    return visit_calls(ast, flags)
+
+
+def scan_api_usage_regex(content):
+    """Cờ API đáng ngờ tìm bằng biểu thức chính quy, không cần parse (cùng dạng kết quả với scan_api_usage)."""
+    flags = dict.fromkeys(API_FLAGS, 0)
+    if not might_call_apis(content):
+        return flags
+    if EVAL_PATTERN.search(content):
+        flags['has_eval'] = 1
+    for match in MODULE_PATTERN.finditer(content):
+        flag = module_flag(match.group(2))
+        if flag:
+            flags[flag] = 1
+    return flags
@@ -0,0 +1,311 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import sqlite3
+import argparse
+from collections import deque
+from datetime import datetime
+from collector import (CONCURRENCY, OUTPUT_ROOT, REGISTRY_URL, Collector, RegistryClient, RegistryError,
+                       aiohttp)
+from package_index import DEFAULT_INDEX_PATH, PackageIndex
+
+
+CHANGES_URL = "https://replicate.npmjs.com/registry"  # Cơ sở dữ liệu CouchDB có endpoint _changes
+STATE_NAME = "changes_state.sqlite"  # Nằm trong OUTPUT_ROOT: seq đã xử lý xong và các phiên bản đã tải
+QUEUE_SIZE = 64  # Số change chờ xử lý tối đa; đầy thì ngừng đọc feed (backpressure)
+HEARTBEAT_MS = 30000  # Registry gửi dòng trống định kỳ để giữ kết nối
+RECONNECT_DELAY = 5  # Giây chờ trước khi kết nối lại feed
+CHECKPOINT_EVERY = 100  # Lưu seq sau mỗi chừng này change đã xong ...
+CHECKPOINT_INTERVAL = 10  # ... hoặc sau chừng này giây
+MAX_BACKLOG = 0  # Số gói đã tải nhưng data_processing.py chưa xử lý tối đa (0: không giới hạn)
+BACKLOG_WAIT = 10  # Giây chờ giữa hai lần kiểm tra backlog
+MAX_CHANGE_ATTEMPTS = 5  # Số lần xử lý một change lỗi trước khi bỏ qua hẳn
+RETRY_DELAY = 10  # Giây chờ trước lần thử lại đầu tiên, gấp đôi sau mỗi lần
+
+
+def parse_time(value):
+    try:
+        return datetime.fromisoformat(value.replace('Z', '+00:00')).timestamp()
+    except (AttributeError, ValueError):
+        return None
+
+
+class FollowerState:
+    """
+    Trạng thái (SQLite) của follower: seq cuối cùng mà mọi change trước nó đã xử lý xong,
+    thời điểm bắt đầu theo dõi, và các phiên bản đã tải (để change lặp lại của cùng một gói
+    không tải lại các phiên bản cũ).
+    """
+
+    def __init__(self, path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.conn = sqlite3.connect(path, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS emitted (
+                spec TEXT PRIMARY KEY,
+                reason TEXT NOT NULL,
+                emitted_at REAL NOT NULL
+            )""")
+
+    def get(self, key, default=None):
+        row = self.conn.execute("SELECT value FROM state WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def set(self, key, value):
+        with self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO state VALUES (?, ?)", (key, json.dumps(value)))
+
+    def emitted(self, specs):
+        """Tập con của specs đã được tải (hoặc đã thất bại hẳn) trước đó."""
+        found = set()
+        specs = list(specs)
+        for i in range(0, len(specs), 500):
+            chunk = specs[i:i + 500]
+            placeholders = ','.join('?' * len(chunk))
+            found.update(row[0] for row in self.conn.execute(
+                f"SELECT spec FROM emitted WHERE spec IN ({placeholders})", chunk))
+        return found
+
+    def mark_emitted(self, spec, reason):
+        with self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO emitted VALUES (?, ?, ?)", (spec, reason, time.time()))
+
+
+class SequenceTracker:
+    """
+    Các change được xử lý song song nên xong không theo thứ tự. Seq đã xử lý chỉ tiến tới
+    change cuối cùng mà mọi change đọc trước nó đều đã xong, nên khởi động lại từ seq đó
+    không bỏ sót change nào (change đang xử lý dở sẽ được đọc lại).
+    """
+
+    def __init__(self, committed):
+        self.committed = committed
+        self.pending = deque()
+        self.completed = 0
+
+    def add(self, seq):
+        entry = [seq, False]
+        self.pending.append(entry)
+        return entry
+
+    def done(self, entry):
+        entry[1] = True
+        while self.pending and self.pending[0][1]:
+            self.committed = self.pending.popleft()[0]
+            self.completed += 1
+
+
+class ChangesFollower:
+    """
+    Theo dõi _changes (feed=continuous) của registry: mỗi change là một gói vừa thay đổi;
+    các phiên bản publish sau thời điểm bắt đầu theo dõi và chưa tải được đưa cho collector.
+    Hàng đợi có giới hạn tạo backpressure: khi việc tải (hoặc data_processing.py, với
+    max_backlog) chậm lại thì follower ngừng đọc feed thay vì giữ change trong bộ nhớ.
+    """
+
+    def __init__(self, client, collector, changes_url=CHANGES_URL, state_path=None, concurrency=CONCURRENCY,
+                 queue_size=QUEUE_SIZE, index=None, max_backlog=MAX_BACKLOG, heartbeat_ms=HEARTBEAT_MS):
+        self.client = client
+        self.collector = collector
+        self.changes_url = changes_url.rstrip('/')
+        self.state = FollowerState(state_path or os.path.join(collector.output_root, STATE_NAME))
+        self.concurrency = concurrency
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.index = index
+        self.max_backlog = max_backlog
+        self.heartbeat_ms = heartbeat_ms
+        self.counts = {}
+        self.saved_at = (0, time.monotonic())
+        self.retries = set()
+
+    def new_versions(self, name, packument):
+        """Các (spec, manifest) được publish sau thời điểm bắt đầu theo dõi và chưa được tải."""
+        started_at = self.state.get('started_at')
+        times = packument.get('time', {})
+        candidates = {}
+        for version, manifest in packument.get('versions', {}).items():
+            published = parse_time(times.get(version))
+            if published is not None and published >= started_at:
+                candidates[f"{name}@{version}"] = manifest
+        done = self.state.emitted(candidates)
+        return [(spec, manifest) for spec, manifest in candidates.items() if spec not in done]
+
+    async def wait_for_backlog(self):
+        """Chờ khi số gói đã tải mà data_processing.py chưa xử lý vượt max_backlog."""
+        if not self.index or not self.max_backlog:
+            return
+        while len(self.collector.seen) - self.index.count(self.collector.date) > self.max_backlog:
+            await asyncio.sleep(BACKLOG_WAIT)
+
+    def checkpoint(self, force=False):
+        completed, saved_time = self.saved_at
+        if self.tracker.completed == completed:
+            return
+        if force or self.tracker.completed - completed >= CHECKPOINT_EVERY or time.monotonic() - saved_time >= CHECKPOINT_INTERVAL:
+            self.state.set('seq', self.tracker.committed)
+            self.saved_at = (self.tracker.completed, time.monotonic())
+
+    async def process_change(self, entry, name):
+        """Tải các phiên bản mới của gói; lỗi tạm thời (mạng, 5xx, tải hỏng) được ném ra để thử lại cả change."""
+        try:
+            packument = await self.client.packument(name, full=True)
+        except RegistryError as e:
+            if e.status != 404:
+                raise
+            # Gói đã bị gỡ khỏi registry: không còn phiên bản nào để tải
+            packument = {}
+        # Ngày hiện tại được tính tại lúc tải (theo dõi liên tục qua nửa đêm)
+        self.collector.start_day(datetime.now().strftime('%Y-%m-%d'))
+        failed = []
+        for spec, manifest in self.new_versions(name, packument):
+            if spec in self.collector.seen:
+                reason = 'ok'
+            else:
+                reason = await self.collector.fetch_package(spec, manifest)
+                print(f"    -> {spec}: {'Successfull' if reason == 'ok' else reason}")
+            self.counts[reason] = self.counts.get(reason, 0) + 1
+            # Lỗi mạng được thử lại cùng change (phiên bản đã tải không bị tải lại); lỗi integrity thì không
+            if reason == 'error':
+                failed.append(spec)
+            else:
+                self.state.mark_emitted(spec, reason)
+        if failed:
+            raise RegistryError(f"Failed to download {', '.join(failed)}")
+        self.tracker.done(entry)
+        self.checkpoint()
+
+    def retry_later(self, entry, name, attempt, delay):
+        """Đưa change vào lại hàng đợi sau delay giây, không giữ worker trong lúc chờ."""
+        async def retry():
+            await asyncio.sleep(delay)
+            await self.queue.put((entry, name, attempt))
+            # task_done của lần thử trước chỉ được gọi lúc này, nên queue.join() chờ cả lần thử lại
+            self.queue.task_done()
+        task = asyncio.create_task(retry())
+        self.retries.add(task)
+        task.add_done_callback(self.retries.discard)
+
+    async def worker(self):
+        while True:
+            entry, name, attempt = await self.queue.get()
+            try:
+                await self.process_change(entry, name)
+            except Exception as e:
+                if attempt < MAX_CHANGE_ATTEMPTS:
+                    # Chưa đánh dấu xong: seq dừng trước change này cho tới khi nó xong
+                    delay = RETRY_DELAY * 2 ** (attempt - 1)
+                    print(f"    -> {name}: {e!r}, retrying in {delay}s ({attempt}/{MAX_CHANGE_ATTEMPTS})")
+                    self.retry_later(entry, name, attempt + 1, delay)
+                    continue
+                # Bỏ qua hẳn để seq đã xử lý tiếp tục tiến và hàng chờ của tracker không lớn mãi
+                print(f"    -> {name}: ERROR, dropped after {attempt} attempts: {e!r}")
+                self.counts['dropped'] = self.counts.get('dropped', 0) + 1
+                self.tracker.done(entry)
+                self.checkpoint()
+            self.queue.task_done()
+
+    async def read_changes(self, once):
+        """Đọc feed từ seq đã đọc cuối cùng, kết nối lại khi mất kết nối. once: dừng khi đã đọc tới hiện tại."""
+        since = self.tracker.committed
+        while True:
+            url = f"{self.changes_url}/_changes?feed=continuous&since={since}&heartbeat={self.heartbeat_ms}"
+            if once:
+                # Feed tự đóng (kèm last_seq) khi không có change mới trong một chu kỳ heartbeat
+                url += f"&timeout={self.heartbeat_ms}"
+            try:
+                async for line in self.client.stream_lines(url, self.heartbeat_ms / 1000 * 2):
+                    line = line.strip()
+                    if not line:
+                        continue
+                    change = json.loads(line)
+                    if 'last_seq' in change:
+                        since = change['last_seq']
+                        break
+                    since = change['seq']
+                    entry = self.tracker.add(change['seq'])
+                    name = change.get('id', '')
+                    if change.get('deleted') or not name or name.startswith('_design/'):
+                        self.tracker.done(entry)
+                        continue
+                    await self.wait_for_backlog()
+                    # Chờ khi hàng đợi đầy: feed chỉ được đọc tiếp khi có worker rảnh
+                    await self.queue.put((entry, name, 1))
+                else:
+                    print("  Changes feed closed, reconnecting...")
+            except (RegistryError, aiohttp.ClientError, asyncio.TimeoutError, ValueError, KeyError) as e:
+                print(f"  Changes feed error: {e}, reconnecting in {RECONNECT_DELAY}s...")
+                await asyncio.sleep(RECONNECT_DELAY)
+                continue
+            if once:
+                return
+            await asyncio.sleep(RECONNECT_DELAY)
+
+    async def run(self, since=None, once=False):
+        if self.state.get('started_at') is None:
+            # Lần chạy đầu: từ một seq cụ thể thì lấy mọi phiên bản, ngược lại ('now') chỉ phiên bản publish từ bây giờ
+            from_seq = since is not None and str(since) != 'now'
+            self.state.set('started_at', 0 if from_seq else time.time())
+        start_seq = since if since is not None else self.state.get('seq', 'now')
+        self.tracker = SequenceTracker(start_seq)
+        self.collector.start_day(datetime.now().strftime('%Y-%m-%d'))
+        print(f"Following '{self.changes_url}/_changes' since {start_seq}")
+        workers = [asyncio.create_task(self.worker()) for _ in range(self.concurrency)]
+        try:
+            await self.read_changes(once)
+            await self.queue.join()
+        finally:
+            # Change đang chờ thử lại chưa xong: seq đã lưu dừng trước nó, lần chạy sau đọc lại
+            tasks = workers + list(self.retries)
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            self.checkpoint(force=True)
+        return self.counts
+
+
+async def follow(registry, changes_url, output_root, keep_tarballs, concurrency, since=None, once=False,
+                 index_path=None, max_backlog=MAX_BACKLOG, state_path=None, heartbeat_ms=HEARTBEAT_MS):
+    index = PackageIndex(index_path) if max_backlog else None
+    async with RegistryClient(registry, concurrency + 1) as client:
+        collector = Collector(client, output_root, keep_tarballs, concurrency)
+        follower = ChangesFollower(client, collector, changes_url, state_path, concurrency,
+                                   index=index, max_backlog=max_backlog, heartbeat_ms=heartbeat_ms)
+        counts = await follower.run(since, once)
+    summary = ', '.join(f"{reason}: {count}" for reason, count in sorted(counts.items()))
+    print(f"Stopped at seq {follower.tracker.committed} ({summary or 'no new versions'})")
+    return counts
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Follow the registry _changes feed and collect every newly published version.")
+    parser.add_argument("--registry", default=REGISTRY_URL, help="Registry base URL for packuments and tarballs.")
+    parser.add_argument("--changes_url", default=CHANGES_URL, help="CouchDB database that serves _changes.")
+    parser.add_argument("--output_root", default=OUTPUT_ROOT, help="Dataset root: packages go to date-<date>/, the log to date-<date>.log.")
+    parser.add_argument("--state_path", default=None, help=f"SQLite file with the last sequence (defaults to <output_root>/{STATE_NAME}).")
+    parser.add_argument("--keep_tarballs", action="store_true", help="Keep each package as a .tgz file instead of extracting it.")
+    parser.add_argument("--concurrency", type=int, default=CONCURRENCY, help="Changes processed at the same time.")
+    parser.add_argument("--since", default=None, help="Start from this sequence instead of the saved one ('now' or 0 for the beginning).")
+    parser.add_argument("--once", action="store_true", help="Stop after catching up with the feed.")
+    parser.add_argument("--max_backlog", type=int, default=MAX_BACKLOG,
+                        help="Pause the feed while more than this many downloaded packages wait for data_processing.py (0: no limit).")
+    parser.add_argument("--heartbeat_ms", type=int, default=HEARTBEAT_MS,
+                        help="Heartbeat of the feed; with --once, also how long the feed waits for new changes.")
+    parser.add_argument("--index_path", default=DEFAULT_INDEX_PATH, help="Package index of data_processing.py (used with --max_backlog).")
+    args = parser.parse_args()
+
+    since = args.since
+    if since is not None and since.isdigit():
+        since = int(since)
+    try:
+        asyncio.run(follow(args.registry, args.changes_url, args.output_root, args.keep_tarballs, max(1, args.concurrency),
+                           since, args.once, args.index_path, args.max_backlog, args.state_path, args.heartbeat_ms))
+    except KeyboardInterrupt:
+        sys.exit(0)
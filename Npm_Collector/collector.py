@@ -0,0 +1,305 @@
+import os
+import sys
+import json
+import time
+import base64
+import shutil
+import asyncio
+import hashlib
+import tarfile
+import argparse
+from datetime import datetime
+from urllib.parse import quote
+from extractor import strip_first_component
+from package_index import package_entry_name
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+
+REGISTRY_URL = "https://registry.npmjs.org"
+OUTPUT_ROOT = "/home/kali/Documents/npm/dataset"
+SLEEP_INTERVAL = 3600
+MAX_PACKAGES_PER_CHECK = 2000
+CONCURRENCY = 16  # Số gói tải cùng lúc (cũng là số kết nối tối đa tới registry)
+REQUEST_TIMEOUT = 120  # Giây tối đa cho một request (kể cả tải tarball)
+RETRIES = 3  # Số lần thử lại khi lỗi mạng / 429 / 5xx
+DOWNLOAD_CHUNK = 64 * 1024
+# Thuật toán trong trường integrity (SRI) theo thứ tự từ yếu tới mạnh
+INTEGRITY_ALGORITHMS = ('sha1', 'sha256', 'sha384', 'sha512')
+PACKUMENT_ACCEPT = "application/vnd.npm.install-v1+json; q=1.0, application/json; q=0.8"
+
+
+class RegistryError(Exception):
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status  # Mã HTTP khi registry trả lời lỗi, None với lỗi mạng / hết lượt thử
+
+
+def parse_integrity(dist):
+    """
+    Các digest mong đợi của tarball từ dist của packument: chỉ giữ thuật toán mạnh nhất
+    có trong dist.integrity (giống npm), nếu không có thì dùng dist.shasum (sha1 hex).
+    Trả về (thuật toán, [digest bytes]) hoặc None.
+    """
+    expected = {}
+    for item in (dist.get('integrity') or '').split():
+        algorithm, _, value = item.partition('-')
+        if algorithm in INTEGRITY_ALGORITHMS:
+            try:
+                expected.setdefault(algorithm, []).append(base64.b64decode(value.split('?')[0]))
+            except ValueError:
+                continue
+    if expected:
+        algorithm = max(expected, key=INTEGRITY_ALGORITHMS.index)
+        return algorithm, expected[algorithm]
+    if dist.get('shasum'):
+        return 'sha1', [bytes.fromhex(dist['shasum'])]
+    return None
+
+
+def extract_tarball(tgz_path, dest):
+    """Giải nén tarball vào dest, bỏ thư mục đầu (như tar --strip-components=1); bỏ qua member không an toàn."""
+    os.makedirs(dest, exist_ok=True)
+    with tarfile.open(tgz_path, 'r:*') as tar:
+        for member in tar.getmembers():
+            name = strip_first_component(member.name)
+            if name is None:
+                continue
+            member.name = name
+            if member.islnk():
+                member.linkname = strip_first_component(member.linkname) or ''
+            try:
+                tar.extract(member, dest, filter='data')
+            except (tarfile.FilterError, OSError, KeyError):
+                continue
+
+
+def load_log(log_path):
+    """Các gói đã tải trong ngày (file log của collector), đọc một lần thay vì grep cho từng gói."""
+    if not os.path.exists(log_path):
+        return set()
+    with open(log_path) as f:
+        return {line.strip() for line in f if line.strip()}
+
+
+class RegistryClient:
+    """
+    HTTP client dùng chung cho mọi request tới registry: các kết nối (TLS) được giữ lại và
+    dùng lại giữa các gói, tối đa concurrency kết nối cùng lúc. Dùng trong `async with`.
+    """
+
+    def __init__(self, registry=REGISTRY_URL, concurrency=CONCURRENCY, timeout=REQUEST_TIMEOUT):
+        if aiohttp is None:
+            raise ImportError("The collector needs aiohttp. Install it with: pip install aiohttp")
+        self.registry = registry.rstrip('/')
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.session = None
+
+    async def __aenter__(self):
+        connector = aiohttp.TCPConnector(limit=self.concurrency, ttl_dns_cache=300)
+        self.session = aiohttp.ClientSession(connector=connector,
+                                             timeout=aiohttp.ClientTimeout(total=self.timeout),
+                                             headers={'User-Agent': 'npm-collector'})
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.session.close()
+
+    async def _request(self, url, handle, headers=None):
+        """Gọi handle(response) với response 200; thử lại khi lỗi mạng, 429 hoặc 5xx."""
+        for attempt in range(RETRIES + 1):
+            try:
+                async with self.session.get(url, headers=headers) as response:
+                    if response.status == 200:
+                        return await handle(response)
+                    if response.status != 429 and response.status < 500:
+                        raise RegistryError(f"HTTP {response.status} for {url}", response.status)
+                    error = RegistryError(f"HTTP {response.status} for {url}")
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                error = e
+            if attempt < RETRIES:
+                await asyncio.sleep(2 ** attempt)
+        raise RegistryError(f"Failed after {RETRIES + 1} attempts: {error}")
+
+    async def get_json(self, url, headers=None):
+        async def handle(response):
+            return json.loads(await response.read())
+        return await self._request(url, handle, headers)
+
+    async def search_created(self, date, size=MAX_PACKAGES_PER_CHECK):
+        """Các gói 'name@version' được tạo trong ngày date (API search của registry)."""
+        data = await self.get_json(f"{self.registry}/-/v1/search?text=created:{date}..{date}&size={size}")
+        return [f"{obj['package']['name']}@{obj['package']['version']}" for obj in data.get('objects', [])]
+
+    async def packument(self, name, full=False):
+        """Packument rút gọn (chỉ thông tin cần để cài) của gói; full=True để có cả thời điểm publish (time)."""
+        headers = {'Accept': 'application/json'} if full else {'Accept': PACKUMENT_ACCEPT}
+        return await self.get_json(f"{self.registry}/{quote(name, safe='@')}", headers)
+
+    async def stream_lines(self, url, read_timeout):
+        """Đọc từng dòng của một response dài (vd. _changes?feed=continuous) khi dữ liệu tới."""
+        timeout = aiohttp.ClientTimeout(total=None, sock_read=read_timeout)
+        async with self.session.get(url, timeout=timeout) as response:
+            if response.status != 200:
+                raise RegistryError(f"HTTP {response.status} for {url}", response.status)
+            async for line in response.content:
+                yield line
+
+    async def download(self, url, path, algorithm):
+        """Tải url vào path theo từng khối; trả về digest (algorithm) của nội dung đã tải."""
+        async def handle(response):
+            hasher = hashlib.new(algorithm)
+            with open(path, 'wb') as f:
+                async for chunk in response.content.iter_chunked(DOWNLOAD_CHUNK):
+                    hasher.update(chunk)
+                    f.write(chunk)
+            return hasher.digest()
+        return await self._request(url, handle)
+
+
+class Collector:
+    """
+    Tải các gói mới trong ngày: packument -> tarball (kiểm tra integrity) -> thư mục ngày,
+    tối đa concurrency gói cùng lúc. Gói đã có trong file log của ngày bị bỏ qua; file log
+    chỉ được đọc một lần mỗi ngày và được ghi thêm sau khi gói đã nằm đúng chỗ.
+    """
+
+    def __init__(self, client, output_root=OUTPUT_ROOT, keep_tarballs=False, concurrency=CONCURRENCY):
+        self.client = client
+        self.output_root = output_root
+        self.keep_tarballs = keep_tarballs
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.staging_dir = os.path.join(output_root, ".staging")
+        self.date = None
+        self.seen = set()
+
+    def start_day(self, date):
+        if date != self.date:
+            self.date = date
+            self.daily_dir = os.path.join(self.output_root, f"date-{date}")
+            self.log_path = os.path.join(self.output_root, f"date-{date}.log")
+            os.makedirs(self.daily_dir, exist_ok=True)
+            os.makedirs(self.staging_dir, exist_ok=True)
+            self.seen = load_log(self.log_path)
+
+    def _place(self, tgz_path, entry_name):
+        """Chuyển gói đã kiểm tra vào thư mục ngày; os.replace nên data_processing.py không thấy gói dở dang."""
+        if self.keep_tarballs:
+            os.replace(tgz_path, os.path.join(self.daily_dir, f"{entry_name}.tgz"))
+            return
+        staging_dest = f"{tgz_path}.dir"
+        shutil.rmtree(staging_dest, ignore_errors=True)
+        try:
+            extract_tarball(tgz_path, staging_dest)
+            dest = os.path.join(self.daily_dir, entry_name)
+            shutil.rmtree(dest, ignore_errors=True)
+            os.replace(staging_dest, dest)
+        finally:
+            shutil.rmtree(staging_dest, ignore_errors=True)
+            os.remove(tgz_path)
+
+    async def fetch_package(self, spec, manifest=None):
+        """
+        Tải một gói 'name@version'. Trả về 'ok' hoặc lý do thất bại.
+        manifest: thông tin phiên bản đã có trong packument (bỏ qua request packument).
+        """
+        name, _, version = spec.rpartition('@')
+        entry_name = package_entry_name(spec)
+        tgz_path = os.path.join(self.staging_dir, f"{entry_name}.{os.getpid()}.tgz")
+        async with self.semaphore:
+            try:
+                if manifest is None:
+                    packument = await self.client.packument(name)
+                    manifest = packument.get('versions', {}).get(version)
+                if manifest is None:
+                    return 'version_not_found'
+                dist = manifest.get('dist', {})
+                expected = parse_integrity(dist)
+                if expected is None or not dist.get('tarball'):
+                    return 'no_integrity'
+                algorithm, digests = expected
+                if await self.client.download(dist['tarball'], tgz_path, algorithm) not in digests:
+                    return 'integrity_mismatch'
+                await asyncio.to_thread(self._place, tgz_path, entry_name)
+            except (RegistryError, ValueError, OSError, tarfile.TarError) as e:
+                print(f"      Download error: {spec}: {e}")
+                return 'error'
+            finally:
+                if os.path.exists(tgz_path):
+                    os.remove(tgz_path)
+        # Ghi log trong event loop (một luồng) nên các dòng không chen nhau
+        with open(self.log_path, 'a') as f:
+            f.write(f"{spec}\n")
+        self.seen.add(spec)
+        return 'ok'
+
+    async def collect(self, date, max_packages=MAX_PACKAGES_PER_CHECK):
+        """Một lượt kiểm tra: tìm gói mới trong ngày và tải các gói chưa có. Trả về {lý do: số gói}."""
+        self.start_day(date)
+        specs = await self.client.search_created(date, max_packages)
+        if not specs:
+            print("  Not found any packages this time.")
+            return {}
+        new_specs = [spec for spec in dict.fromkeys(specs) if spec not in self.seen]
+        print(f"  Found {len(specs)} packages, {len(new_specs)} new. Start downloading...")
+
+        async def fetch(spec):
+            reason = await self.fetch_package(spec)
+            print(f"    -> {spec}: {'Successfull' if reason == 'ok' else reason}")
+            return reason
+
+        counts = {}
+        for reason in await asyncio.gather(*(fetch(spec) for spec in new_specs)):
+            counts[reason] = counts.get(reason, 0) + 1
+        return counts
+
+
+async def run(registry, output_root, keep_tarballs, concurrency, interval, max_packages, date=None, once=False):
+    async with RegistryClient(registry, concurrency) as client:
+        collector = Collector(client, output_root, keep_tarballs, concurrency)
+        while True:
+            current_date = date or datetime.now().strftime('%Y-%m-%d')
+            print("------------------------------------------------------------")
+            print(f"Start collecting at: {datetime.now()}")
+            print(f"Working at folder: '{os.path.join(output_root, f'date-{current_date}')}'")
+            start = time.monotonic()
+            try:
+                counts = await collector.collect(current_date, max_packages)
+            except RegistryError as e:
+                print(f"  Search error: {e}")
+                counts = {}
+            if counts:
+                summary = ', '.join(f"{reason}: {count}" for reason, count in sorted(counts.items()))
+                print(f"  {summary} in {time.monotonic() - start:.1f}s")
+            if once:
+                return counts
+            print(f"  Finish scanning. Continuous after {interval // 60} mins.")
+            await asyncio.sleep(interval)
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Collect newly published npm packages from the registry.")
+    parser.add_argument("--registry", default=REGISTRY_URL, help="Registry base URL (e.g. a local fake_registry.py).")
+    parser.add_argument("--output_root", default=OUTPUT_ROOT, help="Dataset root: packages go to date-<date>/, the log to date-<date>.log.")
+    parser.add_argument("--keep_tarballs", action="store_true",
+                        help="Keep each package as a .tgz file instead of extracting it.")
+    parser.add_argument("--concurrency", type=int, default=CONCURRENCY,
+                        help="Packages downloaded at the same time (and pooled connections to the registry).")
+    parser.add_argument("--interval", type=int, default=SLEEP_INTERVAL, help="Seconds between two checks.")
+    parser.add_argument("--max_packages", type=int, default=MAX_PACKAGES_PER_CHECK, help="Search results per check.")
+    parser.add_argument("--date", default=None, help="Collect packages created on this date (YYYY-MM-DD) instead of today.")
+    parser.add_argument("--once", action="store_true", help="Run a single check and exit.")
+    args = parser.parse_args()
+
+    print("--- Start collecting NPM packages ---")
+    print("--- Click Ctrl+C to stop ---")
+    try:
+        asyncio.run(run(args.registry, args.output_root, args.keep_tarballs, max(1, args.concurrency),
+                        args.interval, args.max_packages, args.date, args.once))
+    except KeyboardInterrupt:
+        sys.exit(0)
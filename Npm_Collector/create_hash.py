@@ -1,52 +1,31 @@
 import os
-import hashlib
-import json
 import pandas as pd
+from extractor import hash_package as hash_package_path
+from merkle import DEFAULT_CACHE_PATH, DigestCache
+
+def hash_package(root, file_digests=None, mode='md5', cache=None):
+    # file_digests: nếu truyền vào một set, dấu vân tay của từng tệp được thêm vào đó
+    # mode='md5' cho hash cũ (khớp malicious_hashes.csv đã có), 'merkle' cho gốc cây Merkle
+    return hash_package_path(root, mode, cache, file_digests)
+
+def process_malicious_directory(directory, output_csv, mode='md5', cache=None):
 
-def hash_package(root):
-
-    m = hashlib.md5()
-   
-    for dirpath, dirnames, filenames in sorted(os.walk(root)):
-        dirnames.sort()
-        for filename in sorted(filenames):
-            path = os.path.join(dirpath, filename)
-            
-            m.update(f"{os.path.relpath(path, root)}\n".encode("utf-8"))
-            
-            if filename == "package.json":
-                try:
-                    with open(path, "r", encoding='utf-8') as f:
-                        pkg = json.load(f)
-                  
-                    pkg["name"] = ""
-                    pkg["version"] = ""
-                    m.update(json.dumps(pkg, sort_keys=True).encode("utf-8"))
-                except (json.JSONDecodeError, UnicodeDecodeError):
-                  
-                    with open(path, "rb") as f:
-                        m.update(f.read())
-            else:
-                with open(path, "rb") as f:
-                    m.update(f.read())
-    return m.hexdigest()
-
-def process_malicious_directory(directory, output_csv):
-    
     print(f"Start hashing npm packages: '{directory}'")
     all_hashes = []
-    
+
 
     for package_name in os.listdir(directory):
         package_path = os.path.join(directory, package_name)
         if os.path.isdir(package_path):
             print(f"  -> Processing: {package_name}")
-            package_hash = hash_package(package_path)
+            file_digests = set()
+            package_hash = hash_package(package_path, file_digests, mode, cache)
             all_hashes.append({
                 "package_name": package_name,
-                "hash": package_hash
+                "hash": package_hash,
+                "file_digests": ' '.join(sorted(file_digests))
             })
-            
+
     if not all_hashes:
         print("Not found any packages")
         return
@@ -59,4 +38,7 @@ def process_malicious_directory(directory, output_csv):
 if __name__ == "__main__":
     MALICIOUS_DIR = 'dataset/malicious'
     OUTPUT_FILE = 'malicious_hashes.csv'
-    process_malicious_directory(MALICIOUS_DIR, OUTPUT_FILE)
+    # 'md5' giữ tương thích với các hash đã có; 'merkle' dùng cache nên lần chạy sau chỉ hash lại tệp đã đổi
+    HASH_MODE = 'md5'
+    cache = DigestCache(DEFAULT_CACHE_PATH) if HASH_MODE == 'merkle' else None
+    process_malicious_directory(MALICIOUS_DIR, OUTPUT_FILE, HASH_MODE, cache)
@@ -1,28 +1,390 @@
 import os
-import pandas as pd
+import argparse
 import time
-from datetime import datetime
-from extractor import hash_package, process_package
+from collections import deque
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta
+import metrics
+from extractor import is_tarball, package_name_from_path, scan_package
+from feature_cache import FeatureCache
+from merkle import HASH_MODES
+from package_index import PackageIndex, package_entry_name
+from parse_worker import DEFAULT_BUDGET, MAX_FILE_PARSE_BYTES, MAX_PACKAGE_PARSE_BYTES, PARSE_TIMEOUT, ParseBudget
+from storage import STORAGE_BACKENDS, append_rows, output_target, read_table
+from watcher import DirectoryWatcher
 
 
 INPUT_ROOT_DIR = "/home/kali/Documents/npm/dataset"
 FEATURES_OUTPUT_DIR = "/home/kali/Documents/npm/Features_Extracted"
 HASHES_OUTPUT_DIR = "/home/kali/Documents/npm/Hash_File"
+FEATURE_CACHE_PATH = "/home/kali/Documents/npm/cache/file_features.sqlite"
+INDEX_PATH = "/home/kali/Documents/npm/cache/processed_packages.sqlite"
 SLEEP_INTERVAL = 3600  # Nghỉ 1 giờ (3600 giây) giữa các lần quét
+WATCH_TIMEOUT = 60  # Chế độ --watch: kiểm tra lại log ít nhất mỗi phút (kể cả khi không có sự kiện)
+NUM_WORKERS = os.cpu_count() or 1
+MAX_IN_FLIGHT_PER_WORKER = 4  # Số gói tối đa đang chờ kết quả cho mỗi worker
+WRITE_BATCH_SIZE = 50  # Ghi ra CSV sau mỗi 50 gói
+STORAGE_BACKEND = 'csv'  # 'csv' (<date>.csv) hoặc 'parquet' (thư mục date=YYYY-MM-DD/)
+MAX_CRASH_RETRIES = 2  # Số lần chạy lại một gói khi process con bị crash
+MAX_PACKAGE_CRASHES = 3  # Số lần quét một gói vẫn làm crash process con trước khi bị đánh dấu lỗi
+HASH_MODE = 'md5'  # 'md5' khớp với malicious_hashes.csv hiện có; 'merkle' cho gốc cây Merkle
+REPORT_TOP = 10  # Số gói chậm nhất in ra sau mỗi lần xử lý khi bật đo đạc
 
-def main():
+
+_feature_caches = {}
+
+
+def get_feature_cache(cache_path):
+    """Mỗi process giữ một đối tượng cache (và một kết nối SQLite) riêng."""
+    if cache_path not in _feature_caches:
+        _feature_caches[cache_path] = FeatureCache(cache_path)
+    return _feature_caches[cache_path]
+
+
+def process_one(pkg_path, cache_path=None, hash_mode=HASH_MODE, measure=False, profile=False, budget=DEFAULT_BUDGET):
+    """
+    Trích xuất đặc tính, hash và digest từng tệp của một gói (chạy trong process con).
+    budget (ParseBudget): giới hạn byte/thời gian parse, gói vượt giới hạn có cờ has_truncated_parse/has_parse_timeout.
+    Khi measure=True, số liệu đo được của gói (metrics.drain()) được trả về cùng kết quả
+    để process chính gộp lại; profile=True bật profiler lấy mẫu trong process con.
+    """
+    metrics.enable(measure)
+    if profile:
+        metrics.start_profiler()
+    pkg_name = package_name_from_path(pkg_path)
+    cache = get_feature_cache(cache_path) if cache_path else None
+
+    # Trích xuất đặc tính và tạo hash trong cùng một lần duyệt gói
+    file_digests = set()
+    with metrics.package(pkg_name):
+        features_dict, package_hash = scan_package(pkg_path, cache, file_digests, hash_mode, budget)
+    if features_dict:
+        features_dict['package_name'] = pkg_name
+    return pkg_name, features_dict, package_hash, ' '.join(sorted(file_digests)), metrics.drain() if measure else None
+
+
+def list_packages(input_dir):
+    """Các gói trong thư mục ngày: thư mục đã giải nén hoặc tarball .tgz (tên gói -> đường dẫn)."""
+    packages = {}
+    for entry in os.scandir(input_dir):
+        if entry.is_dir():
+            packages[entry.name] = entry.path
+        elif entry.is_file() and is_tarball(entry.path):
+            packages[package_name_from_path(entry.path)] = entry.path
+    return packages
+
+
+def iter_results_sequential(pkg_paths, worker):
+    for pkg_path in pkg_paths:
+        try:
+            yield worker(pkg_path)
+        except Exception as e:
+            print(f"    -> Error processing {os.path.basename(pkg_path)}: {e}")
+
+
+def iter_results_parallel(pkg_paths, num_workers, worker, crashed=None):
+    """
+    Chạy worker (process_one) trên một pool process và trả kết quả theo đúng thứ tự đầu vào.
+    Số gói đang xử lý được giới hạn để không giữ quá nhiều kết quả trong bộ nhớ.
+    Nếu một worker bị crash (segfault, OOM, ...), pool được tạo lại; kết quả đã xong được
+    giữ nguyên, các gói chưa xong được chạy lại từng gói một cho tới khi tìm ra gói gây crash.
+    Chỉ gói đó bị tính một lần crash; gói crash quá MAX_CRASH_RETRIES lần bị bỏ qua và được
+    thêm vào crashed (nếu có).
+    """
+    max_in_flight = num_workers * MAX_IN_FLIGHT_PER_WORKER
+    pending = deque(pkg_paths)
+    # [đường dẫn, future]; future là None: gói bị nghi gây crash, chờ chạy riêng khi tới lượt
+    in_flight = deque()
+    crash_count = {}
+    executor = ProcessPoolExecutor(max_workers=num_workers)
+
+    try:
+        while pending or in_flight:
+            isolating = any(entry[1] is None for entry in in_flight)
+            while not isolating and pending and len(in_flight) < max_in_flight:
+                pkg_path = pending.popleft()
+                in_flight.append([pkg_path, executor.submit(worker, pkg_path)])
+
+            entry = in_flight[0]
+            if entry[1] is None:
+                # Các gói khác đều đã xong: gói này chạy một mình
+                entry[1] = executor.submit(worker, entry[0])
+            pkg_path, future = entry
+            try:
+                result = future.result()
+            except BrokenProcessPool:
+                print("    -> Worker process crashed. Restarting pool...")
+                executor.shutdown(wait=False, cancel_futures=True)
+                executor = ProcessPoolExecutor(max_workers=num_workers)
+
+                # Giữ lại kết quả đã hoàn thành; các gói còn dở (kể cả gói chỉ đang xếp hàng) chưa bị tính crash
+                unfinished = [item for item in in_flight
+                              if item[1] is not None and not (item[1].done() and not isinstance(item[1].exception(), BrokenProcessPool))]
+                if len(unfinished) > 1:
+                    for item in unfinished:
+                        item[1] = None
+                    continue
+
+                # Chỉ một gói đang chạy: chính nó gây crash
+                culprit = unfinished[0]
+                crash_count[culprit[0]] = crash_count.get(culprit[0], 0) + 1
+                if crash_count[culprit[0]] > MAX_CRASH_RETRIES:
+                    print(f"    -> Skipped {os.path.basename(culprit[0])}: worker crashed {crash_count[culprit[0]]} times")
+                    in_flight.remove(culprit)
+                    if crashed is not None:
+                        crashed.append(culprit[0])
+                else:
+                    culprit[1] = None
+                continue
+            except Exception as e:
+                print(f"    -> Error processing {os.path.basename(pkg_path)}: {e}")
+                in_flight.popleft()
+                continue
+
+            in_flight.popleft()
+            yield result
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def process_packages(pkg_paths, features_target, hashes_target, num_workers=NUM_WORKERS, batch_size=WRITE_BATCH_SIZE, cache_path=None, on_saved=None, hash_mode=HASH_MODE, budget=DEFAULT_BUDGET,
+                     crashed=None):
+    """
+    Xử lý danh sách gói và ghi kết quả theo từng lô (file CSV hoặc partition Parquet).
+    on_saved(names) được gọi sau mỗi lần ghi với tên các gói vừa được lưu.
+    crashed (list): nhận đường dẫn các gói bị bỏ qua vì làm process con crash nhiều lần.
+    """
+    new_features_list = []
+    new_hashes_list = []
+    batch_names = []
+
+    def flush():
+        # Ghi các kết quả mới
+        with metrics.stage('append'):
+            append_rows(new_features_list, features_target)
+            append_rows(new_hashes_list, hashes_target)
+        if on_saved and batch_names:
+            on_saved(list(batch_names))
+        new_features_list.clear()
+        new_hashes_list.clear()
+        batch_names.clear()
+
+    # Process con không dùng chung trạng thái với process chính: truyền cờ đo đạc theo từng gói
+    worker = partial(process_one, cache_path=cache_path, hash_mode=hash_mode,
+                     measure=metrics.enabled(), profile=metrics.profiling(), budget=budget)
+    if num_workers > 1:
+        results = iter_results_parallel(pkg_paths, num_workers, worker, crashed)
+    else:
+        results = iter_results_sequential(pkg_paths, worker)
+
+    try:
+        for pkg_name, features_dict, package_hash, file_digests, package_metrics in results:
+            print(f"    -> Processed: {pkg_name}")
+            metrics.merge(package_metrics)
+            if features_dict:
+                new_features_list.append(features_dict)
+            if package_hash:
+                # file_digests: digest của từng tệp, dùng cho phát hiện bản sao gần đúng (near_clone.py)
+                new_hashes_list.append({'package_name': pkg_name, 'hash': package_hash, 'file_digests': file_digests})
+            if features_dict or package_hash:
+                batch_names.append(pkg_name)
+
+            if len(new_features_list) >= batch_size or len(new_hashes_list) >= batch_size:
+                flush()
+    finally:
+        # Luôn lưu những kết quả đã có, kể cả khi bị dừng giữa chừng
+        flush()
+
+
+def print_cache_stats(cache_path):
+    stats = FeatureCache(cache_path).stats()
+    print(f"  File cache: {stats['entries']} entries, {stats['hits']} hits, {stats['misses']} misses (hit rate {stats['hit_rate']:.1%})")
+
+
+def format_budget(budget):
+    if budget is None:
+        return "unlimited"
+    limits = [f"{budget.max_file_bytes / 1024 ** 2:g} MB/file" if budget.max_file_bytes else "any file size",
+              f"{budget.max_package_bytes / 1024 ** 2:g} MB/package" if budget.max_package_bytes else "any package size",
+              f"{budget.timeout:g}s timeout" if budget.timeout else "no timeout"]
+    return ', '.join(limits)
+
+
+def report_metrics(metrics_path=None, profile_path=None, top=REPORT_TOP):
+    """In thời gian từng bước và các gói chậm nhất, ghi số liệu / mẫu profiler ra file (nếu bật đo đạc)."""
+    if not metrics.enabled():
+        return
+    metrics.print_report(top)
+    if metrics_path:
+        metrics.write_metrics(metrics_path)
+        print(f"  Metrics saved to '{metrics_path}'")
+    if profile_path:
+        samples = metrics.write_profile(profile_path)
+        print(f"  {samples} profiler samples saved to '{profile_path}'")
+
+
+def output_paths(date, storage_backend=STORAGE_BACKEND):
+    return (output_target(FEATURES_OUTPUT_DIR, date, storage_backend),
+            output_target(HASHES_OUTPUT_DIR, date, storage_backend))
+
+
+def seed_index_from_csv(index, date, features_target):
+    """Lần đầu gặp một ngày: đưa các gói đã có trong dữ liệu đặc tính của ngày đó vào chỉ mục."""
+    if index.is_seeded(date):
+        return
+    try:
+        names = read_table(features_target, columns=['package_name'])['package_name']
+    except FileNotFoundError:
+        names = []
+    index.seed_from_names(date, names)
+
+
+def process_new_packages(index, date, packages, num_workers, batch_size, cache_path, specs=None, storage_backend=STORAGE_BACKEND, hash_mode=HASH_MODE, budget=DEFAULT_BUDGET):
+    """Xử lý các gói (tên -> đường dẫn) chưa có trong chỉ mục và ghi nhận kết quả vào chỉ mục."""
+    features_target, hashes_target = output_paths(date, storage_backend)
+    seed_index_from_csv(index, date, features_target)
+
+    processed_packages_set = index.processed_names(packages)
+    packages_to_process = sorted(set(packages) - processed_packages_set)
+
+    if not packages_to_process:
+        print("  Dont have new folder to process.")
+        return 0
+
+    print(f"  Find {len(packages_to_process)} new packages. Start processing...")
+    pkg_paths = [packages[pkg_name] for pkg_name in packages_to_process]
+    saved = set()
+
+    def on_saved(names):
+        index.mark_processed(names, date, specs=specs)
+        saved.update(names)
+
+    crashed = []
+    process_packages(pkg_paths, features_target, hashes_target, num_workers, batch_size, cache_path, on_saved, hash_mode, budget, crashed)
+
+    # Gói lỗi được đánh dấu để không bị xử lý lại mãi. Gói làm crash process con thì chưa:
+    # lỗi có thể do môi trường (hết bộ nhớ, ...) nên gói được thử lại ở các lần quét sau,
+    # tối đa MAX_PACKAGE_CRASHES lần rồi mới bị đánh dấu lỗi
+    crashed_paths = set(crashed)
+    crashed_names = [pkg_name for pkg_name in packages_to_process if packages[pkg_name] in crashed_paths]
+    attempts = index.mark_crashed(crashed_names, date, specs=specs)
+    given_up = {pkg_name for pkg_name, count in attempts.items() if count >= MAX_PACKAGE_CRASHES}
+    retried = set(crashed_names) - given_up
+    if retried:
+        print(f"    -> {len(retried)} packages crashed the worker, retrying them on the next scan")
+    failed = [pkg_name for pkg_name in packages_to_process if pkg_name not in saved and pkg_name not in retried]
+    index.mark_processed(failed, date, status='failed', specs=specs)
+    if cache_path:
+        print_cache_stats(cache_path)
+    return len(packages_to_process)
+
+
+def read_new_log_lines(index, log_path):
+    """Đọc các dòng hoàn chỉnh mới được ghi vào log kể từ vị trí đã lưu. Trả về (các dòng, vị trí mới)."""
+    offset = index.get_offset(log_path)
+    try:
+        size = os.path.getsize(log_path)
+    except FileNotFoundError:
+        return [], offset
+    if size < offset:
+        # File log bị tạo lại: đọc từ đầu
+        offset = 0
+    if size == offset:
+        return [], offset
+
+    with open(log_path, 'rb') as f:
+        f.seek(offset)
+        data = f.read(size - offset)
+    end = data.rfind(b'\n') + 1
+    lines = [line.strip() for line in data[:end].decode('utf-8', 'replace').splitlines()]
+    return [line for line in lines if line], offset + end
+
+
+def process_log(index, date, num_workers, batch_size, cache_path, storage_backend=STORAGE_BACKEND, hash_mode=HASH_MODE, budget=DEFAULT_BUDGET):
+    """Xử lý các gói mà collector vừa ghi vào log date-YYYY-MM-DD.log."""
+    log_path = os.path.join(INPUT_ROOT_DIR, f"date-{date}.log")
+    specs, new_offset = read_new_log_lines(index, log_path)
+    # Dòng log của gói làm crash process con đã được đọc qua: lấy lại từ chỉ mục để thử lại
+    retry_specs = index.crashed_specs(date)
+    if not specs and not retry_specs:
+        return 0
+
+    input_dir = os.path.join(INPUT_ROOT_DIR, f"date-{date}")
+    print("------------------------------------------------------------")
+    print(f"Start new process: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+    print(f"  {len(specs)} new entries in '{log_path}'")
+    if retry_specs:
+        print(f"  {len(retry_specs)} packages to retry after a worker crash")
+
+    packages = {}
+    spec_by_name = {}
+    entries = [(package_entry_name(spec), spec) for spec in specs] + list(retry_specs.items())
+    for pkg_name, spec in entries:
+        if spec is not None:
+            spec_by_name[pkg_name] = spec
+        for candidate in (os.path.join(input_dir, pkg_name), os.path.join(input_dir, f"{pkg_name}.tgz")):
+            if os.path.isdir(candidate) or is_tarball(candidate):
+                packages[pkg_name] = candidate
+                break
+        else:
+            print(f"    -> Not found package for {spec or pkg_name}")
+    # Gói chờ thử lại mà đã bị xoá khỏi đĩa thì không thử lại nữa
+    index.mark_processed([pkg_name for pkg_name in retry_specs if pkg_name not in packages], date, status='failed', specs=retry_specs)
+
+    count = process_new_packages(index, date, packages, num_workers, batch_size, cache_path, spec_by_name, storage_backend, hash_mode, budget)
+    # Chỉ lưu vị trí đọc sau khi các gói đã được xử lý và ghi nhận
+    index.set_offset(log_path, new_offset)
+    return count
+
+
+def watch(num_workers=NUM_WORKERS, batch_size=WRITE_BATCH_SIZE, cache_path=FEATURE_CACHE_PATH, index_path=INDEX_PATH, storage_backend=STORAGE_BACKEND, hash_mode=HASH_MODE, report=report_metrics, budget=DEFAULT_BUDGET):
+    """
+    Chế độ theo sự kiện: chờ collector ghi thêm vào log của ngày và xử lý ngay các
+    gói mới. Log của hôm qua cũng được kiểm tra để không bỏ sót gói lúc qua nửa đêm.
+    """
+    os.makedirs(INPUT_ROOT_DIR, exist_ok=True)
+    index = PackageIndex(index_path)
+    watcher = DirectoryWatcher(INPUT_ROOT_DIR)
+    print(f"--- Watching '{INPUT_ROOT_DIR}' ({watcher.mode}) ---")
+
+    while True:
+        now = datetime.now()
+        count = 0
+        for date in ((now - timedelta(days=1)).strftime('%Y-%m-%d'), now.strftime('%Y-%m-%d')):
+            count += process_log(index, date, num_workers, batch_size, cache_path, storage_backend, hash_mode, budget)
+        if count:
+            report()
+        watcher.wait(WATCH_TIMEOUT)
+
+
+def main(num_workers=NUM_WORKERS, batch_size=WRITE_BATCH_SIZE, cache_path=FEATURE_CACHE_PATH, index_path=INDEX_PATH, watch_mode=False, storage_backend=STORAGE_BACKEND, hash_mode=HASH_MODE,
+         metrics_path=None, profile_path=None, top=REPORT_TOP, budget=DEFAULT_BUDGET):
 
     print("--- Start processing dataset ---")
+    print(f"--- Workers: {num_workers} ---")
+    print(f"--- File cache: {cache_path or 'disabled'} ---")
+    print(f"--- Storage: {storage_backend} ---")
+    print(f"--- Hash: {hash_mode} ---")
+    print(f"--- Parse budget: {format_budget(budget)} ---")
+    if metrics.enabled():
+        print(f"--- Metrics: {metrics_path or 'report only'}{', profiling' if profile_path else ''} ---")
     print("--- Click Ctrl+C to stop ---")
 
     os.makedirs(FEATURES_OUTPUT_DIR, exist_ok=True)
     os.makedirs(HASHES_OUTPUT_DIR, exist_ok=True)
 
+    report = partial(report_metrics, metrics_path, profile_path, top)
+    if watch_mode:
+        watch(num_workers, batch_size, cache_path, index_path, storage_backend, hash_mode, report, budget)
+        return
+
+    index = PackageIndex(index_path)
+
     while True:
         current_date = datetime.now().strftime('%Y-%m-%d')
         input_dir = os.path.join(INPUT_ROOT_DIR, f"date-{current_date}")
-        features_csv_path = os.path.join(FEATURES_OUTPUT_DIR, f"{current_date}.csv")
-        hashes_csv_path = os.path.join(HASHES_OUTPUT_DIR, f"{current_date}.csv")
 
         print("------------------------------------------------------------")
         print(f"Start new process: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
@@ -31,55 +393,54 @@ def main():
         if not os.path.exists(input_dir):
             print("  Not found input file.")
         else:
-  
-            try:
-                processed_packages_set = set(pd.read_csv(features_csv_path)['package_name'])
-            except FileNotFoundError:
-                processed_packages_set = set()
-
-  
-            current_packages_in_dir = set(f for f in os.listdir(input_dir) if os.path.isdir(os.path.join(input_dir, f)))
-            
- 
-            packages_to_process = list(current_packages_in_dir - processed_packages_set)
-
-            if not packages_to_process:
-                print("  Dont have new folder to process.")
-            else:
-                print(f"  Find {len(packages_to_process)} new packages. Start processing...")
-                new_features_list = []
-                new_hashes_list = []
-
-                for pkg_name in packages_to_process:
-                    print(f"    -> Processing: {pkg_name}")
-                    pkg_path = os.path.join(input_dir, pkg_name)
-                    
-                    # 1. Trích xuất đặc tính
-                    features_dict = process_package(pkg_path)
-                    if features_dict:
-                        features_dict['package_name'] = pkg_name
-                        new_features_list.append(features_dict)
-                    
-                    # 2. Tạo hash
-                    package_hash = hash_package(pkg_path)
-                    if package_hash:
-                        new_hashes_list.append({'package_name': pkg_name, 'hash': package_hash})
-
-                # Ghi các kết quả mới vào file CSV
-                if new_features_list:
-                    final_features_df = pd.DataFrame(new_features_list)
-                    write_header = not os.path.exists(features_csv_path)
-                    final_features_df.to_csv(features_csv_path, mode='a', header=write_header, index=False)
-                    print(f"    -> Saved {len(final_features_df)} samples to '{features_csv_path}'")
-                
-                if new_hashes_list:
-                    final_hashes_df = pd.DataFrame(new_hashes_list)
-                    write_header = not os.path.exists(hashes_csv_path)
-                    final_hashes_df.to_csv(hashes_csv_path, mode='a', header=write_header, index=False)
-                    print(f"    -> Saved {len(final_hashes_df)} samples to '{hashes_csv_path}'")
+            if process_new_packages(index, current_date, list_packages(input_dir), num_workers, batch_size, cache_path, storage_backend=storage_backend, hash_mode=hash_mode, budget=budget):
+                report()
         
         print(f"Finish processing. Continuous {SLEEP_INTERVAL // 60} mins.")
         time.sleep(SLEEP_INTERVAL)
 
 if __name__ == "__main__":
-    main()
+
+    parser = argparse.ArgumentParser(description="Extract features and hashes from newly collected npm packages.")
+    parser.add_argument("--workers", type=int, default=NUM_WORKERS,
+                        help="Number of worker processes (1 = process packages in the main process).")
+    parser.add_argument("--batch_size", type=int, default=WRITE_BATCH_SIZE,
+                        help="Number of packages buffered before appending to the output files.")
+    parser.add_argument("--cache_path", default=FEATURE_CACHE_PATH,
+                        help="SQLite file used to cache per-file analysis results by content digest.")
+    parser.add_argument("--no_cache", action="store_true",
+                        help="Analyse every file even if the same content was seen before.")
+    parser.add_argument("--index_path", default=INDEX_PATH,
+                        help="SQLite index of processed packages and collector log offsets.")
+    parser.add_argument("--watch", action="store_true",
+                        help="Process packages as soon as the collector logs them instead of scanning every hour.")
+    parser.add_argument("--storage", choices=STORAGE_BACKENDS, default=STORAGE_BACKEND,
+                        help="Output format: one CSV per day, or date-partitioned Parquet directories.")
+    parser.add_argument("--hash_mode", choices=HASH_MODES, default=HASH_MODE,
+                        help="Package hash: legacy md5 (matches the existing malicious_hashes.csv) or a Merkle root.")
+
+    parser.add_argument("--max_parse_file_mb", type=float, default=MAX_FILE_PARSE_BYTES / 1024 ** 2,
+                        help="Larger .js files are not parsed with esprima (regex/entropy only, flagged has_truncated_parse); 0 = no limit.")
+    parser.add_argument("--max_parse_package_mb", type=float, default=MAX_PACKAGE_PARSE_BYTES / 1024 ** 2,
+                        help="Parse at most this much code per package, the rest is regex/entropy only; 0 = no limit.")
+    parser.add_argument("--parse_timeout", type=float, default=PARSE_TIMEOUT,
+                        help="Seconds before a parse is killed (it runs in a separate process, flagged has_parse_timeout); 0 = parse in-process without a timeout.")
+    parser.add_argument("--measure", action="store_true",
+                        help="Time each stage (read, parse, entropy, regex, hashing, append) and print the slowest packages after each run.")
+    parser.add_argument("--metrics", default=None,
+                        help="Also write the metrics after each run: Prometheus text if the file ends with .prom, otherwise appended JSON lines (implies --measure).")
+    parser.add_argument("--profile", default=None,
+                        help="Run a sampling profiler in every process and write collapsed stacks (flamegraph.pl/speedscope) to this file (implies --measure).")
+    parser.add_argument("--top", type=int, default=REPORT_TOP,
+                        help="Number of slowest packages shown in the report.")
+
+    args = parser.parse_args()
+
+    if args.measure or args.metrics or args.profile:
+        metrics.enable()
+    if args.profile:
+        metrics.start_profiler()
+    budget = ParseBudget(int(args.max_parse_file_mb * 1024 ** 2) or None, int(args.max_parse_package_mb * 1024 ** 2) or None,
+                         args.parse_timeout or None)
+    main(args.workers, args.batch_size, None if args.no_cache else args.cache_path, args.index_path, args.watch, args.storage, args.hash_mode,
+         args.metrics, args.profile, args.top, budget)
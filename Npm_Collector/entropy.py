@@ -0,0 +1,96 @@
+import numpy as np
+
+
+WINDOW_SIZE = 2048  # Kích thước cửa sổ trượt (bytes)
+WINDOW_STEP = 512  # Bước trượt, phải chia hết WINDOW_SIZE
+WINDOW_PERCENTILE = 95
+BLOCKS_PER_CHUNK = 2048  # Số block được đếm cùng lúc, giới hạn bộ nhớ tạm
+
+
+def _to_array(data):
+    if isinstance(data, np.ndarray):
+        return data
+    return np.frombuffer(data, dtype=np.uint8)
+
+
+def _entropy_from_counts(counts, total):
+    """Shannon entropy (bit) của từng hàng trong ma trận tần suất."""
+    p = counts / total
+    with np.errstate(divide='ignore', invalid='ignore'):
+        plogp = np.where(p > 0, p * np.log2(np.where(p > 0, p, 1)), 0.0)
+    return -plogp.sum(axis=-1)
+
+
+def symbol_counts(s):
+    """
+    Tần suất xuất hiện của các ký hiệu trong s.
+    bytes: histogram 256 giá trị bằng np.bincount.
+    str: với chuỗi ASCII thì mỗi ký tự là một byte; nếu không thì đếm theo code point
+    để cho kết quả giống hệt Counter(s).
+    """
+    if isinstance(s, str):
+        if s.isascii():
+            return np.bincount(_to_array(s.encode('ascii')), minlength=256)
+        code_points = np.frombuffer(s.encode('utf-32-le'), dtype='<u4')
+        return np.unique(code_points, return_counts=True)[1]
+    return np.bincount(_to_array(s), minlength=256)
+
+
+def calculate_entropy(s):
+    """Tính toán entropy của một chuỗi ký tự hoặc một dãy bytes."""
+    if not len(s):
+        return 0
+    counts = symbol_counts(s)
+    counts = counts[counts > 0]
+    return float(_entropy_from_counts(counts, float(len(s))))
+
+
+def window_entropies(data, window=WINDOW_SIZE, step=WINDOW_STEP):
+    """
+    Entropy của từng cửa sổ trượt (độ dài window, bước step) trên dãy bytes.
+    Cửa sổ cuối luôn được căn về cuối dữ liệu để không bỏ sót phần đuôi.
+    Dữ liệu ngắn hơn một cửa sổ được tính như một cửa sổ duy nhất.
+    """
+    if window % step != 0:
+        raise ValueError("window must be a multiple of step")
+
+    arr = _to_array(data)
+    n = len(arr)
+    if n == 0:
+        return np.zeros(0)
+    if n <= window:
+        counts = np.bincount(arr, minlength=256)
+        return _entropy_from_counts(counts[None, :], float(n))
+
+    k = window // step
+    num_blocks = n // step
+    offsets = np.arange(BLOCKS_PER_CHUNK + k, dtype=np.int64)[:, None] * 256
+    results = []
+
+    # Đếm theo block (step bytes), rồi cộng k block liên tiếp thành một cửa sổ.
+    # Mỗi chunk đếm lại k - 1 block trước đó để nối các cửa sổ qua ranh giới chunk.
+    for first_window_end in range(k, num_blocks + 1, BLOCKS_PER_CHUNK):
+        last_window_end = min(first_window_end + BLOCKS_PER_CHUNK, num_blocks + 1)
+        start_block = first_window_end - k
+        blocks = arr[start_block * step:(last_window_end - 1) * step].reshape(-1, step)
+        nb = len(blocks)
+        idx = (blocks + offsets[:nb]).ravel()
+        block_counts = np.bincount(idx, minlength=nb * 256).reshape(nb, 256)
+        cumulative = np.zeros((nb + 1, 256), dtype=np.int64)
+        np.cumsum(block_counts, axis=0, out=cumulative[1:])
+        window_counts = cumulative[k:] - cumulative[:-k]
+        results.append(_entropy_from_counts(window_counts, float(window)))
+
+    if (n - window) % step != 0:
+        tail = np.bincount(arr[n - window:], minlength=256)
+        results.append(_entropy_from_counts(tail[None, :], float(window)))
+
+    return np.concatenate(results)
+
+
+def window_entropy_stats(data, window=WINDOW_SIZE, step=WINDOW_STEP, percentile=WINDOW_PERCENTILE):
+    """Trả về (max, percentile) của entropy theo cửa sổ trượt."""
+    entropies = window_entropies(data, window, step)
+    if len(entropies) == 0:
+        return 0.0, 0.0
+    return float(entropies.max()), float(np.percentile(entropies, percentile))
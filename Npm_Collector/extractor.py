@@ -2,52 +2,57 @@
 import os
 import hashlib
 import json
-import re
 import math
+import posixpath
+import shutil
+import tarfile
+import tempfile
 import pandas as pd
-from collections import Counter
-import esprima 
+import metrics
+from entropy import calculate_entropy, window_entropy_stats
+from ast_visitor import API_FLAGS, might_call_apis, scan_api_usage, scan_api_usage_regex
+from merkle import CHUNK_SIZE, canonical_package_json, content_digest, directory_digest, merkle_root, read_chunks, short_digest, stream_digest
+from parse_worker import DEFAULT_BUDGET
+from indicator_scanner import DEFAULT_SCANNER, INDICATORS
 
 
-def hash_package(package_path):
+# Số lần khớp của mỗi chỉ dấu: num_urls, num_ips, num_webhooks, ...
+INDICATOR_FEATURES = tuple(f"num_{name}" for name in INDICATORS)
+TARBALL_SUFFIXES = ('.tgz', '.tar.gz')
+SPOOL_MAX_BYTES = 1024 * 1024  # Tệp không cần phân tích lớn hơn trong tarball được tạm ghi ra đĩa thay vì giữ trong bộ nhớ
 
-    m = hashlib.md5()
+
+def file_digest(data):
+    """Dấu vân tay nội dung của một tệp (hex), không phụ thuộc tên/đường dẫn tệp."""
+    return short_digest(content_digest(data))
+
+
+@metrics.timed('hash_package')
+def hash_package(package_path, mode='md5', cache=None, file_digests=None):
+    """
+    Hash của gói (thư mục hoặc tarball), đọc từng tệp theo khối.
+    mode='md5' cho hash cũ; mode='merkle' cho gốc cây Merkle (cache: DigestCache cho thư mục).
+    """
+    if is_tarball(package_path):
+        if mode == 'merkle':
+            return tarball_merkle_root(package_path, file_digests)
+        return scan_files(iter_tarball_files(package_path), file_digests=file_digests)[1]
     if not os.path.isdir(package_path):
         return None
-        
-    for dirpath, dirnames, filenames in sorted(os.walk(package_path)):
-        dirnames.sort()
-        for filename in sorted(filenames):
-            path = os.path.join(dirpath, filename)
-            m.update(f"{os.path.relpath(path, package_path)}\n".encode("utf-8"))
-            
-            if filename == "package.json":
-                try:
-                    with open(path, "r", encoding='utf-8') as f:
-                        pkg = json.load(f)
-                    pkg["name"] = ""
-                    pkg["version"] = ""
-                    m.update(json.dumps(pkg, sort_keys=True).encode("utf-8"))
-                except:
-                    # Nếu file json lỗi, hash nội dung gốc
-                    with open(path, "rb") as f:
-                        m.update(f.read())
-            else:
-                with open(path, "rb") as f:
-                    m.update(f.read())
-    return m.hexdigest()
-
-
-
-def calculate_entropy(s):
-    """Tính toán entropy của một chuỗi ký tự."""
-    if not s:
-        return 0
-    p, lns = Counter(s), float(len(s))
-    return -sum(count / lns * math.log2(count / lns) for count in p.values())
+    return directory_digest(package_path, mode, cache, file_digests)
 
-def extract_metadata_features(package_path):
-    """Trích xuất đặc tính từ file package.json."""
+
+
+def decode_js(data):
+    """Giải mã bytes giống open(..., 'r', encoding='utf-8').read() (gồm cả chuẩn hoá xuống dòng)."""
+    content = data.decode('utf-8')
+    if '\r' in content:
+        content = content.replace('\r\n', '\n').replace('\r', '\n')
+    return content
+
+
+def metadata_features_from_bytes(data):
+    """Trích xuất đặc tính từ nội dung file package.json."""
     features = {
         'has_install_scripts': 0,
         'has_dependencies': 0,
@@ -55,13 +60,11 @@ def extract_metadata_features(package_path):
         'num_dependencies': 0,
         'num_dev_dependencies': 0,
     }
-    pkg_json_path = os.path.join(package_path, 'package.json')
-    if not os.path.exists(pkg_json_path):
+    if data is None:
         return features
 
     try:
-        with open(pkg_json_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
+        data = json.loads(data.decode('utf-8'))
             
         if 'scripts' in data and data['scripts'] and ('preinstall' in data['scripts'] or 'postinstall' in data['scripts']):
             features['has_install_scripts'] = 1
@@ -79,15 +82,25 @@ def extract_metadata_features(package_path):
         
     return features
 
-def extract_static_code_features(package_path):
-    """
-    Trích xuất các đặc tính từ mã nguồn JavaScript bằng cách phân tích tĩnh.
-    """
+
+def extract_metadata_features(package_path):
+    """Trích xuất đặc tính từ file package.json."""
+    pkg_json_path = os.path.join(package_path, 'package.json')
+    if not os.path.exists(pkg_json_path):
+        return metadata_features_from_bytes(None)
+
+    with open(pkg_json_path, 'rb') as f:
+        return metadata_features_from_bytes(f.read())
+
+
+def empty_code_features():
     features = {
         'num_js_files': 0,
         'total_code_size': 0,
         'avg_entropy': 0.0,
         'max_entropy': 0.0,
+        'max_window_entropy': 0.0,
+        'p95_window_entropy': 0.0,
         'num_urls': 0,
         'num_ips': 0,
         'has_eval': 0,
@@ -95,13 +108,120 @@ def extract_static_code_features(package_path):
         'has_fs_access': 0,
         'has_network_access': 0,
         'has_os_access': 0,
+        # Có tệp không được parse vì vượt giới hạn byte / quá thời gian (cờ API tìm bằng regex)
+        'has_truncated_parse': 0,
+        'has_parse_timeout': 0,
+        # Tệp .js không phải UTF-8 (được phân tích theo từng byte)
+        'num_undecodable_files': 0,
     }
+    features.update(dict.fromkeys(INDICATOR_FEATURES, 0))
+    return features
+
+
+def analyze_js_content(content, budget=None, parse=True, data=None):
+    """
+    Phân tích nội dung một tệp .js và trả về kết quả của riêng tệp đó
+    (kích thước, entropy, số lần khớp của từng chỉ dấu, các cờ API đáng ngờ).
+    parse=False: tệp vượt giới hạn parse, cờ API được tìm bằng regex.
+    budget (ParseBudget): parse trong process riêng có timeout.
+    data: bytes của tệp không phải UTF-8 (content khi đó là bản giải mã latin-1).
+    """
+    raw = data if data is not None else content.encode('utf-8')
+    with metrics.stage('entropy'):
+        # Entropy theo cửa sổ trượt: phát hiện payload nén/mã hoá nằm trong một tệp bình thường
+        window_max, window_p95 = window_entropy_stats(raw)
+        entropy = calculate_entropy(content)
+
+    with metrics.stage('regex'):
+        # Mọi chỉ dấu được tìm trong một lượt quét trên bytes. Chuỗi có ký tự ngoài ASCII được
+        # quét dạng str để \w, \d, \b giữ nghĩa Unicode (số URL/IP không đổi so với trước)
+        counts = DEFAULT_SCANNER.count(raw if data is not None or content.isascii() else content)
+
+    result = {
+        'size': len(content),
+        'entropy': entropy,
+        'max_window_entropy': window_max,
+        'p95_window_entropy': window_p95,
+    }
+    result.update((f"num_{name}", count) for name, count in counts.items())
+    # Phân tích AST để tìm các lệnh gọi hàm nguy hiểm
+    timed_out = False
+    with metrics.stage('parse'):
+        if not parse:
+            flags = scan_api_usage_regex(content)
+        elif budget is not None:
+            flags, timed_out = budget.scan(content)
+        else:
+            flags = scan_api_usage(content)
+    result.update(flags)
+    result['truncated'] = int(not parse)
+    result['timed_out'] = int(timed_out)
+    if not parse:
+        metrics.count('parse_truncated')
+    if timed_out:
+        metrics.count('parse_timeouts')
+    return result
+
+
+def analyze_js_bytes(data, cache=None, budget=None):
+    """
+    Phân tích một tệp .js từ bytes. Tệp không phải UTF-8 (thường là mã bị làm rối) vẫn
+    được phân tích, mỗi byte là một ký tự (kết quả có 'undecodable' = 1).
+    Nếu có cache thì chỉ phân tích những nội dung chưa từng gặp.
+    budget: hạn mức parse của gói (ParseBudget.for_package()), None = không giới hạn.
+    """
+    # Quyết định parse hay không chỉ phụ thuộc nội dung và các tệp trước đó (không phụ thuộc cache)
+    parse = budget is None or not might_call_apis(data) or budget.allow(len(data))
+    if cache is not None:
+        digest = cache.digest(data) if parse else f"{cache.digest(data)}:noparse"
+        found, result = cache.get(digest)
+        if found:
+            metrics.count('feature_cache_hits')
+            return result
+
+    try:
+        result = analyze_js_content(decode_js(data), budget, parse)
+        result['undecodable'] = 0
+    except UnicodeDecodeError:
+        result = analyze_js_content(data.decode('latin-1'), budget, parse, data)
+        result['undecodable'] = 1
+
+    # Kết quả khi parse quá thời gian phụ thuộc tải máy: không lưu vào cache
+    if cache is not None and not result['timed_out']:
+        cache.put(digest, result)
+    return result
+
+
+def add_file_result(features, result):
+    """Cộng dồn kết quả của một tệp vào đặc tính của cả gói."""
+    features['total_code_size'] += result['size']
+    if result['entropy'] > features['max_entropy']:
+        features['max_entropy'] = result['entropy']
+    for key in ('max_window_entropy', 'p95_window_entropy'):
+        if result[key] > features[key]:
+            features[key] = result[key]
+    for key in INDICATOR_FEATURES:
+        features[key] += result[key]
+    for flag in API_FLAGS:
+        if result[flag]:
+            features[flag] = 1
+    if result['truncated']:
+        features['has_truncated_parse'] = 1
+    if result['timed_out']:
+        features['has_parse_timeout'] = 1
+    features['num_undecodable_files'] += result['undecodable']
+
+
+def extract_static_code_features(package_path, cache=None, budget=DEFAULT_BUDGET):
+    """
+    Trích xuất các đặc tính từ mã nguồn JavaScript bằng cách phân tích tĩnh.
+    """
+    features = empty_code_features()
+    budget = budget.for_package() if budget is not None else None
     
-    total_entropy = 0
+    # Cộng bằng math.fsum để kết quả không phụ thuộc thứ tự duyệt tệp
+    file_entropies = []
     file_count = 0
-    
-    url_pattern = re.compile(r'https?://(?:[-\w.]|(?:%[\da-fA-F]{2}))+')
-    ip_pattern = re.compile(r'\b(?:\d{1,3}\.){3}\d{1,3}\b')
 
     for root, _, files in os.walk(package_path):
         for file in files:
@@ -111,69 +231,248 @@ def extract_static_code_features(package_path):
             file_count += 1
             file_path = os.path.join(root, file)
             try:
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    content = f.read()
-                    
-                features['total_code_size'] += len(content)
-                
-                entropy = calculate_entropy(content)
-                total_entropy += entropy
-                if entropy > features['max_entropy']:
-                    features['max_entropy'] = entropy
-                
-                features['num_urls'] += len(url_pattern.findall(content))
-                features['num_ips'] += len(ip_pattern.findall(content))
-                
-                ast = esprima.parseScript(content, tolerant=True)
-                # Dùng một hàm đệ quy để duyệt cây AST hiệu quả hơn
-                def traverse_ast(node):
-                    if not node or not isinstance(node, esprima.nodes.Node):
-                        return
-
-                    if node.type == 'CallExpression':
-                        callee = node.callee
-                        if hasattr(callee, 'name') and 'eval' in callee.name:
-                            features['has_eval'] = 1
-                        
-                        if callee.type == 'MemberExpression' and hasattr(callee.object, 'name') and callee.object.name == 'require':
-                            if node.arguments and hasattr(node.arguments[0], 'value'):
-                                arg = node.arguments[0].value
-                                if arg == 'child_process': features['has_child_process'] = 1
-                                elif arg in ['fs', 'fs-extra']: features['has_fs_access'] = 1
-                                elif arg in ['http', 'https', 'net']: features['has_network_access'] = 1
-                                elif arg == 'os': features['has_os_access'] = 1
-
-                    # Duyệt các nút con
-                    for key in node:
-                        if isinstance(getattr(node, key), list):
-                            for child_node in getattr(node, key):
-                                traverse_ast(child_node)
-                        else:
-                            traverse_ast(getattr(node, key))
-                
-                traverse_ast(ast)
-            except Exception:
+                with open(file_path, 'rb') as f:
+                    data = f.read()
+            except OSError:
+                metrics.count('unreadable_files')
                 continue
 
+            result = analyze_js_bytes(data, cache, budget)
+            add_file_result(features, result)
+            file_entropies.append(result['entropy'])
+
+    if cache is not None:
+        cache.flush()
+
     if file_count > 0:
         features['num_js_files'] = file_count
-        features['avg_entropy'] = total_entropy / file_count
+        features['avg_entropy'] = math.fsum(file_entropies) / file_count
         
     return features
 
 
-def process_package(package_path):
+@metrics.timed('process_package')
+def process_package(package_path, cache=None, budget=DEFAULT_BUDGET):
     """
     Hàm tổng hợp để trích xuất tất cả đặc tính từ một gói và trả về một dictionary.
     """
+    if is_tarball(package_path):
+        return scan_files(iter_tarball_files(package_path), cache, budget=budget)[0]
     if not os.path.isdir(package_path):
         return None
         
     all_features = {}
     metadata_features = extract_metadata_features(package_path)
-    code_features = extract_static_code_features(package_path)
+    code_features = extract_static_code_features(package_path, cache, budget)
     
     all_features.update(metadata_features)
     all_features.update(code_features)
     
     return all_features
+
+
+def is_tarball(package_path):
+    return os.path.isfile(package_path) and package_path.endswith(TARBALL_SUFFIXES)
+
+
+def package_name_from_path(package_path):
+    """Tên gói từ đường dẫn thư mục hoặc tarball (bỏ đuôi .tgz/.tar.gz)."""
+    name = os.path.basename(package_path.rstrip(os.sep))
+    for suffix in TARBALL_SUFFIXES:
+        if name.endswith(suffix):
+            return name[:-len(suffix)]
+    return name
+
+
+def reads_whole(relpath):
+    """Chỉ tệp .js (phân tích mã) và package.json (metadata) cần cả nội dung; tệp khác chỉ cần hash."""
+    filename = posixpath.basename(relpath)
+    return filename.endswith('.js') or filename == "package.json"
+
+
+def iter_directory_files(package_path):
+    """
+    Sinh (đường dẫn tương đối, nội dung) theo đúng thứ tự của hash_package. Nội dung là bytes
+    với tệp .js/package.json, còn lại là file object đang mở để scan_files đọc theo khối.
+    """
+    # Thứ tự của hash_package: sắp xếp theo thư mục rồi theo tên tệp
+    for dirpath, _, filenames in sorted(os.walk(package_path)):
+        for filename in sorted(filenames):
+            path = os.path.join(dirpath, filename)
+            with open(path, "rb") as f:
+                yield os.path.relpath(path, package_path), f.read() if reads_whole(filename) else f
+
+
+def strip_first_component(name):
+    """Đường dẫn của member sau khi bỏ thành phần đầu (như tar --strip-components=1)."""
+    parts = [part for part in name.split('/') if part not in ('', '.')]
+    if len(parts) < 2 or '..' in parts:
+        return None
+    return '/'.join(parts[1:])
+
+
+def read_tarball_files(tgz_path, reader=None):
+    """
+    Đọc toàn bộ tệp trong tarball bằng một lượt đọc tuần tự (không giải nén ra đĩa).
+    Link trỏ tới một tệp trong gói được thay bằng nội dung của tệp đó, giống cây
+    thư mục mà tar -x tạo ra; link trỏ ra ngoài hoặc tới thư mục bị bỏ qua.
+    reader(name, fileobj) thay cho việc đọc cả nội dung (vd. chỉ giữ digest của tệp).
+    """
+    files = {}
+    links = {}
+    with tarfile.open(tgz_path, 'r|*') as tar:
+        for member in tar:
+            name = strip_first_component(member.name)
+            if name is None:
+                continue
+            if member.isfile():
+                fileobj = tar.extractfile(member)
+                files[name] = reader(name, fileobj) if reader else fileobj.read()
+                links.pop(name, None)
+            elif member.issym():
+                target = posixpath.normpath(posixpath.join(posixpath.dirname(name), member.linkname))
+                links[name] = target
+                files.pop(name, None)
+            elif member.islnk():
+                links[name] = strip_first_component(member.linkname)
+                files.pop(name, None)
+
+    for name, target in links.items():
+        # Đi theo chuỗi link (giới hạn số bước để tránh vòng lặp)
+        for _ in range(40):
+            if target not in links:
+                break
+            target = links[target]
+        if target in files:
+            files[name] = files[target]
+    return files
+
+
+def tarball_content_reader(name, fileobj):
+    """Giữ nội dung tệp .js/package.json; tệp khác được chép vào file tạm (trên đĩa nếu lớn)."""
+    if reads_whole(name):
+        return fileobj.read()
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES)
+    shutil.copyfileobj(fileobj, spool, CHUNK_SIZE)
+    return spool
+
+
+def iter_tarball_files(tgz_path):
+    """
+    Sinh (đường dẫn tương đối, nội dung) của tarball theo đúng thứ tự của hash_package, như
+    iter_directory_files: bytes với tệp .js/package.json, file object với các tệp khác.
+    """
+    files = read_tarball_files(tgz_path, tarball_content_reader)
+    try:
+        # hash_package sắp xếp theo đường dẫn thư mục (thư mục gốc đứng đầu) rồi theo tên tệp
+        for name in sorted(files, key=lambda name: posixpath.split(name)):
+            data = files[name]
+            if not isinstance(data, bytes):
+                # Một tệp có thể được nhiều link trỏ tới: luôn đọc lại từ đầu
+                data.seek(0)
+                if reads_whole(name):
+                    data = data.read()
+            yield name, data
+    finally:
+        for data in files.values():
+            if not isinstance(data, bytes):
+                data.close()
+
+
+def tarball_digest_reader(name, fileobj):
+    if posixpath.basename(name) == "package.json":
+        return content_digest(canonical_package_json(fileobj.read()))
+    return stream_digest(fileobj)
+
+
+def tarball_merkle_root(tgz_path, file_digests=None):
+    """Gốc cây Merkle của tarball; mỗi tệp chỉ được đọc theo khối để tính digest."""
+    digests = read_tarball_files(tgz_path, tarball_digest_reader)
+    if file_digests is not None:
+        file_digests.update(short_digest(digest) for digest in digests.values())
+    return merkle_root(digests.items())
+
+
+def scan_files(files, cache=None, file_digests=None, hash_mode='md5', budget=DEFAULT_BUDGET):
+    """
+    Tính đặc tính và hash của gói từ dãy (đường dẫn tương đối, nội dung) đã sắp
+    theo thứ tự của hash_package. Mỗi tệp chỉ được xử lý một lần.
+    Nếu truyền vào một set file_digests, dấu vân tay của từng tệp được thêm vào đó.
+    hash_mode='merkle' trả về gốc cây Merkle thay cho md5 cũ.
+    budget (ParseBudget) giới hạn số byte/thời gian parse; None = không giới hạn.
+    """
+    budget = budget.for_package() if budget is not None else None
+    m = hashlib.md5()
+    entries = []
+    metadata_bytes = None
+    code_features = empty_code_features()
+    file_entropies = []
+    file_count = 0
+    total_files = 0
+    total_bytes = 0
+
+    # Thời gian lấy từng tệp (đọc đĩa / giải nén tarball) được tính vào bước 'read'; tệp
+    # chỉ cần hash (file object) được đọc theo khối trong bước 'hashing'
+    for relpath, data in metrics.timed_iter('read', files):
+        filename = posixpath.basename(relpath)
+        total_files += 1
+        with metrics.stage('hashing'):
+            m.update(f"{relpath}\n".encode("utf-8"))
+
+            if not isinstance(data, bytes):
+                if file_digests is not None or hash_mode == 'merkle':
+                    digest = stream_digest(data, m)
+                    entries.append((relpath, digest))
+                    if file_digests is not None:
+                        file_digests.add(short_digest(digest))
+                else:
+                    for chunk in read_chunks(data):
+                        m.update(chunk)
+                total_bytes += data.tell()
+                continue
+
+            total_bytes += len(data)
+            content = canonical_package_json(data) if filename == "package.json" else data
+            m.update(content)
+            if relpath == "package.json":
+                metadata_bytes = data
+            if file_digests is not None or hash_mode == 'merkle':
+                digest = content_digest(content)
+                entries.append((relpath, digest))
+                if file_digests is not None:
+                    file_digests.add(short_digest(digest))
+
+        if filename.endswith('.js'):
+            file_count += 1
+            result = analyze_js_bytes(data, cache, budget)
+            add_file_result(code_features, result)
+            file_entropies.append(result['entropy'])
+
+    if cache is not None:
+        cache.flush()
+
+    if file_count > 0:
+        code_features['num_js_files'] = file_count
+        code_features['avg_entropy'] = math.fsum(file_entropies) / file_count
+
+    metrics.package_size(total_files, total_bytes)
+    all_features = {}
+    all_features.update(metadata_features_from_bytes(metadata_bytes))
+    all_features.update(code_features)
+
+    return all_features, merkle_root(entries) if hash_mode == 'merkle' else m.hexdigest()
+
+
+def scan_package(package_path, cache=None, file_digests=None, hash_mode='md5', budget=DEFAULT_BUDGET):
+    """
+    Duyệt gói đúng một lần: mỗi tệp chỉ được đọc một lần và nội dung được dùng
+    cho cả hash của gói lẫn trích xuất đặc tính.
+    package_path có thể là thư mục đã giải nén hoặc tarball .tgz của npm pack;
+    hai dạng cho cùng kết quả.
+    Trả về (features, package_hash), giống process_package và hash_package.
+    """
+    if is_tarball(package_path):
+        return scan_files(iter_tarball_files(package_path), cache, file_digests, hash_mode, budget)
+    if not os.path.isdir(package_path):
+        return None, None
+    return scan_files(iter_directory_files(package_path), cache, file_digests, hash_mode, budget)
@@ -0,0 +1,230 @@
+import os
+import io
+import json
+import time
+import base64
+import hashlib
+import tarfile
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from datetime import datetime, timezone
+from urllib.parse import parse_qs, unquote, urlparse
+
+
+def make_fixture(fixture_dir, name, version, files=None):
+    """Tạo tarball giống `npm pack` (các tệp nằm trong package/) cho gói name@version."""
+    os.makedirs(fixture_dir, exist_ok=True)
+    files = dict(files or {'index.js': f"module.exports = '{name}@{version}';\n"})
+    files['package.json'] = json.dumps({'name': name, 'version': version, 'main': 'index.js'}, indent=2)
+    path = os.path.join(fixture_dir, f"{name.replace('/', '-')}-{version}.tgz")
+    with tarfile.open(path, 'w:gz') as tar:
+        for relpath, content in sorted(files.items()):
+            data = content.encode('utf-8') if isinstance(content, str) else content
+            info = tarfile.TarInfo(f"package/{relpath}")
+            info.size = len(data)
+            info.mtime = 499162500  # Cùng mtime cố định như npm pack
+            tar.addfile(info, io.BytesIO(data))
+    return path
+
+
+def read_fixture(path):
+    """(name, version, nội dung tarball) đọc từ package/package.json trong tarball."""
+    with open(path, 'rb') as f:
+        data = f.read()
+    with tarfile.open(fileobj=io.BytesIO(data), mode='r:*') as tar:
+        pkg = json.load(tar.extractfile('package/package.json'))
+    return pkg['name'], pkg['version'], data
+
+
+class FakeRegistry:
+    """
+    Registry npm giả lập (HTTP/1.1 keep-alive) phục vụ các tarball trong fixture_dir:
+    API search, packument và tarball có integrity/shasum như registry thật. Các gói trong
+    corrupt được trả về nội dung sai để kiểm tra bước kiểm tra integrity. Đếm số request
+    và số kết nối để kiểm tra client có dùng lại kết nối hay không.
+    /_changes giả lập feed của CouchDB (normal/continuous, since, heartbeat, timeout): mỗi
+    gói trong fixture là một change, add_fixture() thêm change mới khi đang chạy.
+    """
+
+    def __init__(self, fixture_dir, host='127.0.0.1', port=0, corrupt=()):
+        self.packages = {}
+        self.tarballs = {}
+        self.corrupt = set(corrupt)
+        self.requests = 0
+        self.connections = 0
+        self.lock = threading.Lock()
+        self.changed = threading.Condition(self.lock)
+        self.changes = []
+        self.published = {}
+        for filename in sorted(os.listdir(fixture_dir)):
+            if filename.endswith('.tgz'):
+                self._add(os.path.join(fixture_dir, filename))
+        self.server = ThreadingHTTPServer((host, port), self._handler_class())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    def _add(self, path):
+        name, version, data = read_fixture(path)
+        self.packages.setdefault(name, {})[version] = data
+        self.published[(name, version)] = datetime.now(timezone.utc).isoformat().replace('+00:00', 'Z')
+        served = data if f"{name}@{version}" not in self.corrupt else data[:-1] + bytes([data[-1] ^ 1])
+        self.tarballs[self.tarball_path(name, version)] = served
+        self.changes.append({'seq': len(self.changes) + 1, 'id': name, 'changes': [{'rev': f"{len(self.changes) + 1}-fake"}]})
+
+    def add_fixture(self, path):
+        """Publish thêm một tarball khi registry đang chạy (xuất hiện trong feed _changes)."""
+        with self.changed:
+            self._add(path)
+            self.changed.notify_all()
+
+    def delete(self, name):
+        with self.changed:
+            self.packages.pop(name, None)
+            self.changes.append({'seq': len(self.changes) + 1, 'id': name, 'deleted': True, 'changes': [{'rev': f"{len(self.changes) + 1}-fake"}]})
+            self.changed.notify_all()
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def tarball_path(self, name, version):
+        return f"/{name}/-/{name.split('/')[-1]}-{version}.tgz"
+
+    def packument(self, name):
+        versions = {}
+        for version, data in self.packages[name].items():
+            versions[version] = {
+                'name': name,
+                'version': version,
+                'dist': {
+                    'tarball': f"{self.url}{self.tarball_path(name, version)}",
+                    'shasum': hashlib.sha1(data).hexdigest(),
+                    'integrity': "sha512-" + base64.b64encode(hashlib.sha512(data).digest()).decode('ascii'),
+                },
+            }
+        times = {version: self.published[(name, version)] for version in versions}
+        times['created'] = min(times.values())
+        times['modified'] = max(times.values())
+        return {'name': name, 'dist-tags': {'latest': max(versions)}, 'versions': versions, 'time': times}
+
+    def search(self, size):
+        objects = [{'package': {'name': name, 'version': version}}
+                   for name, versions in sorted(self.packages.items()) for version in versions]
+        return {'objects': objects[:size], 'total': len(objects)}
+
+    def _handler_class(self):
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def setup(self):
+                super().setup()
+                with registry.lock:
+                    registry.connections += 1
+
+            def log_message(self, *args):
+                pass
+
+            def send_body(self, status, body, content_type='application/json'):
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def send_changes(self, query):
+                """Feed _changes: các change sau since; continuous thì giữ kết nối và gửi change mới khi có."""
+                since = query.get('since', ['0'])[0]
+                with registry.lock:
+                    since = len(registry.changes) if since == 'now' else int(since)
+                if query.get('feed', ['normal'])[0] != 'continuous':
+                    with registry.lock:
+                        results = registry.changes[since:]
+                    body = {'results': results, 'last_seq': since + len(results)}
+                    return self.send_body(200, json.dumps(body).encode('utf-8'))
+                heartbeat = int(query.get('heartbeat', ['60000'])[0]) / 1000
+                timeout = int(query.get('timeout', ['60000'])[0]) / 1000
+                deadline = time.monotonic() + timeout
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Connection', 'close')
+                self.end_headers()
+                self.close_connection = True
+                while True:
+                    with registry.changed:
+                        if len(registry.changes) <= since:
+                            registry.changed.wait(min(heartbeat, max(0, deadline - time.monotonic())))
+                        results = registry.changes[since:]
+                    for change in results:
+                        self.wfile.write(json.dumps(change).encode('utf-8') + b"\n")
+                    since += len(results)
+                    if results:
+                        # timeout tính từ change cuối cùng, như CouchDB
+                        deadline = time.monotonic() + timeout
+                    if time.monotonic() >= deadline:
+                        self.wfile.write(json.dumps({'last_seq': since}).encode('utf-8') + b"\n")
+                        return
+                    if not results:
+                        self.wfile.write(b"\n")  # heartbeat
+                    self.wfile.flush()
+
+            def do_GET(self):
+                with registry.lock:
+                    registry.requests += 1
+                url = urlparse(self.path)
+                path = unquote(url.path)
+                if path == '/_changes':
+                    try:
+                        return self.send_changes(parse_qs(url.query))
+                    except (BrokenPipeError, ConnectionResetError):
+                        return
+                if path == '/-/v1/search':
+                    size = 20
+                    for param in url.query.split('&'):
+                        if param.startswith('size='):
+                            size = int(param[len('size='):])
+                    return self.send_body(200, json.dumps(registry.search(size)).encode('utf-8'))
+                if '/-/' in path:
+                    if path not in registry.tarballs:
+                        return self.send_body(404, b'{"error": "not found"}')
+                    return self.send_body(200, registry.tarballs[path], 'application/octet-stream')
+                name = path.lstrip('/')
+                if name not in registry.packages:
+                    return self.send_body(404, b'{"error": "not found"}')
+                return self.send_body(200, json.dumps(registry.packument(name)).encode('utf-8'))
+
+        return Handler
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Local stand-in npm registry serving fixture tarballs (for testing collector.py).")
+    parser.add_argument("fixture_dir", help="Folder of package tarballs (package/package.json inside each).")
+    parser.add_argument("--port", type=int, default=4873)
+    parser.add_argument("--generate", type=int, default=0,
+                        help="First create this many small fixture packages (half of them scoped) in fixture_dir.")
+    parser.add_argument("--corrupt", nargs='*', default=[],
+                        help="name@version of packages served with a wrong tarball.")
+    args = parser.parse_args()
+
+    for i in range(args.generate):
+        make_fixture(args.fixture_dir, f"@fixture/pkg-{i}" if i % 2 else f"fixture-pkg-{i}", "1.0.0")
+    registry = FakeRegistry(args.fixture_dir, port=args.port, corrupt=args.corrupt)
+    print(f"Serving {sum(len(versions) for versions in registry.packages.values())} packages at {registry.url}")
+    print(f"Run: python3 collector.py --registry {registry.url} --once --output_root <dir>")
+    try:
+        registry.server.serve_forever()
+    except KeyboardInterrupt:
+        registry.stop()
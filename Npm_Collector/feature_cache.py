@@ -0,0 +1,179 @@
+import os
+import sys
+import json
+import time
+import hashlib
+import sqlite3
+
+
+DEFAULT_CACHE_PATH = "/home/kali/Documents/npm/cache/file_features.sqlite"
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024  # Giới hạn dung lượng dữ liệu trong cache
+EVICT_TARGET_RATIO = 0.9  # Sau khi dọn, cache còn 90% giới hạn
+EVICT_CHECK_INTERVAL = 1000  # Kiểm tra dung lượng sau mỗi 1000 lần ghi
+BUSY_TIMEOUT = 60  # Giây chờ khi process khác đang giữ khoá ghi
+
+# Tăng khi thay đổi cách phân tích một tệp để các kết quả cũ không còn được dùng
+ANALYZER_VERSION = 3
+
+
+class FeatureCache:
+    """
+    Cache trên đĩa (SQLite) cho kết quả phân tích từng tệp, khoá theo digest nội dung.
+    Nhiều process có thể dùng chung một file cache: mỗi process tự mở kết nối riêng,
+    SQLite (chế độ WAL) lo phần khoá. Khi vượt max_bytes, các mục lâu nhất chưa được
+    dùng sẽ bị xoá (LRU).
+    Các lần ghi được gom lại và chỉ ghi xuống đĩa khi gọi flush().
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_bytes=DEFAULT_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._conn = None
+        self._pid = None
+        self._pending = {}
+        self._touched = set()
+        self._puts_since_check = 0
+
+    def _connection(self):
+        # Kết nối SQLite không được dùng chung giữa các process (sau fork)
+        if self._conn is None or self._pid != os.getpid():
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS file_features (
+                    digest TEXT PRIMARY KEY,
+                    result TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    last_access REAL NOT NULL
+                )""")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_file_features_last_access ON file_features(last_access)")
+            conn.execute("CREATE TABLE IF NOT EXISTS cache_stats (id INTEGER PRIMARY KEY CHECK (id = 0), hits INTEGER, misses INTEGER)")
+            conn.execute("INSERT OR IGNORE INTO cache_stats VALUES (0, 0, 0)")
+            self._conn = conn
+            self._pid = os.getpid()
+            self._pending = {}
+            self._touched = set()
+            self.hits = 0
+            self.misses = 0
+        return self._conn
+
+    @staticmethod
+    def digest(data):
+        return f"{ANALYZER_VERSION}:{hashlib.sha256(data).hexdigest()}"
+
+    def get(self, digest):
+        """Trả về (found, result). result có thể là None (tệp không đọc được) nên cần cờ found."""
+        if digest in self._pending:
+            self.hits += 1
+            return True, self._pending[digest]
+
+        row = self._connection().execute("SELECT result FROM file_features WHERE digest = ?", (digest,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return False, None
+
+        self.hits += 1
+        self._touched.add(digest)
+        return True, json.loads(row[0])
+
+    def put(self, digest, result):
+        self._pending[digest] = result
+
+    def flush(self):
+        """Ghi các kết quả mới, cập nhật thời điểm truy cập và bộ đếm hit/miss."""
+        conn = self._connection()
+        now = time.time()
+        rows = []
+        for digest, result in self._pending.items():
+            encoded = json.dumps(result)
+            rows.append((digest, encoded, len(digest) + len(encoded), now))
+
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if rows:
+                conn.executemany("INSERT OR REPLACE INTO file_features VALUES (?, ?, ?, ?)", rows)
+            if self._touched:
+                conn.executemany("UPDATE file_features SET last_access = ? WHERE digest = ?",
+                                 [(now, digest) for digest in self._touched])
+            conn.execute("UPDATE cache_stats SET hits = hits + ?, misses = misses + ? WHERE id = 0",
+                         (self.hits, self.misses))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+        self._puts_since_check += len(rows)
+        self._pending = {}
+        self._touched = set()
+        self.hits = 0
+        self.misses = 0
+
+        if self._puts_since_check >= EVICT_CHECK_INTERVAL:
+            self._puts_since_check = 0
+            self.evict()
+
+    def evict(self):
+        """Xoá các mục ít được dùng gần đây nhất khi cache vượt quá max_bytes."""
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM file_features").fetchone()[0]
+            removed = 0
+            if total > self.max_bytes:
+                target = total - int(self.max_bytes * EVICT_TARGET_RATIO)
+                cutoff = None
+                freed = 0
+                for last_access, size in conn.execute("SELECT last_access, size FROM file_features ORDER BY last_access"):
+                    freed += size
+                    cutoff = last_access
+                    if freed >= target:
+                        break
+                removed = conn.execute("DELETE FROM file_features WHERE last_access <= ?", (cutoff,)).rowcount
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return removed
+
+    def stats(self):
+        """Thống kê toàn bộ cache (cộng dồn từ mọi process đã flush)."""
+        conn = self._connection()
+        hits, misses = conn.execute("SELECT hits, misses FROM cache_stats WHERE id = 0").fetchone()
+        entries, total = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM file_features").fetchone()
+        lookups = hits + misses
+        return {
+            'entries': entries,
+            'bytes': total,
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': hits / lookups if lookups else 0.0,
+        }
+
+    def clear(self):
+        conn = self._connection()
+        conn.execute("DELETE FROM file_features")
+        conn.execute("UPDATE cache_stats SET hits = 0, misses = 0 WHERE id = 0")
+        self._pending = {}
+        self._touched = set()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3 or sys.argv[1] not in ('stats', 'evict', 'clear'):
+        print("Usage: python3 feature_cache.py <stats|evict|clear> <path_to_cache.sqlite>")
+        sys.exit(1)
+
+    cache = FeatureCache(sys.argv[2])
+    if sys.argv[1] == 'evict':
+        print(f"Removed {cache.evict()} entries.")
+    elif sys.argv[1] == 'clear':
+        cache.clear()
+        print("Cache cleared.")
+    stats = cache.stats()
+    print(f"Entries: {stats['entries']} ({stats['bytes'] / 1024 / 1024:.1f} MB)")
+    print(f"Hits: {stats['hits']}, misses: {stats['misses']}, hit rate: {stats['hit_rate']:.1%}")
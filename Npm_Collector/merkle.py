@@ -0,0 +1,241 @@
+import os
+import sys
+import json
+import hashlib
+import sqlite3
+
+
+HASH_MODES = ('md5', 'merkle')  # md5: hash cũ (khớp với malicious_hashes.csv đã có); merkle: gốc cây Merkle
+CHUNK_SIZE = 1024 * 1024  # Đọc tệp theo từng khối 1 MiB thay vì đọc cả tệp vào bộ nhớ
+DIGEST_SIZE = 16  # Cùng độ dài với md5 nên hash_index.py dùng được cho cả hai chế độ
+FILE_DIGEST_SIZE = 8  # Số byte đầu của digest tệp dùng làm dấu vân tay cho so khớp gần đúng
+DEFAULT_CACHE_PATH = "/home/kali/Documents/npm/cache/file_digests.sqlite"
+BUSY_TIMEOUT = 60  # Giây chờ khi process khác đang giữ khoá ghi
+
+
+def canonical_package_json(data):
+    """Chuẩn hoá nội dung package.json (bỏ name/version) trước khi đưa vào hash."""
+    try:
+        pkg = json.loads(data.decode('utf-8'))
+        pkg["name"] = ""
+        pkg["version"] = ""
+        return json.dumps(pkg, sort_keys=True).encode("utf-8")
+    except:
+        # Nếu file json lỗi, hash nội dung gốc
+        return data
+
+
+def new_hasher():
+    return hashlib.blake2b(digest_size=DIGEST_SIZE)
+
+
+def content_digest(data):
+    """Digest (bytes) nội dung của một tệp; là lá của cây Merkle."""
+    return hashlib.blake2b(data, digest_size=DIGEST_SIZE).digest()
+
+
+def short_digest(digest):
+    """Dấu vân tay hex ngắn của một tệp (cột file_digests)."""
+    return digest[:FILE_DIGEST_SIZE].hex()
+
+
+def read_chunks(f):
+    while True:
+        chunk = f.read(CHUNK_SIZE)
+        if not chunk:
+            return
+        yield chunk
+
+
+def stream_digest(f, *extra):
+    """Digest của một tệp đọc theo khối; các hasher trong extra (vd. md5 cũ) được cập nhật cùng lúc."""
+    hasher = new_hasher()
+    for chunk in read_chunks(f):
+        hasher.update(chunk)
+        for other in extra:
+            other.update(chunk)
+    return hasher.digest()
+
+
+def merkle_root(entries):
+    """
+    Gốc cây Merkle từ các (đường dẫn tương đối, digest tệp). Mỗi thư mục có digest riêng
+    tính từ tên và digest của các phần tử con (đã sắp xếp), nên đổi một tệp chỉ làm đổi
+    các nút trên đường từ tệp đó lên gốc.
+    """
+    tree = {}
+    for relpath, digest in entries:
+        node = tree
+        parts = relpath.replace(os.sep, '/').split('/')
+        for part in parts[:-1]:
+            node = node.setdefault(part, {})
+        node[parts[-1]] = digest
+
+    def node_digest(node):
+        hasher = new_hasher()
+        for name in sorted(node):
+            child = node[name]
+            if isinstance(child, dict):
+                hasher.update(b'd' + name.encode('utf-8') + b'\0' + node_digest(child))
+            else:
+                hasher.update(b'f' + name.encode('utf-8') + b'\0' + child)
+        return hasher.digest()
+
+    return node_digest(tree).hex()
+
+
+class DigestCache:
+    """
+    Cache (SQLite) digest của từng tệp theo (đường dẫn, kích thước, mtime): lần quét sau chỉ
+    hash lại các tệp đã thay đổi. Giống FeatureCache, mỗi process mở kết nối riêng và các
+    lần ghi được gom lại tới khi gọi flush().
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._conn = None
+        self._pid = None
+        self._pending = {}
+
+    def _connection(self):
+        if self._conn is None or self._pid != os.getpid():
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS file_digests (
+                    path TEXT PRIMARY KEY,
+                    size INTEGER NOT NULL,
+                    mtime_ns INTEGER NOT NULL,
+                    digest BLOB NOT NULL
+                )""")
+            self._conn = conn
+            self._pid = os.getpid()
+            self._pending = {}
+        return self._conn
+
+    def get(self, path, size, mtime_ns):
+        row = self._pending.get(path)
+        if row is None:
+            row = self._connection().execute(
+                "SELECT size, mtime_ns, digest FROM file_digests WHERE path = ?", (path,)).fetchone()
+        if row is not None and row[0] == size and row[1] == mtime_ns:
+            self.hits += 1
+            return bytes(row[2])
+        self.misses += 1
+        return None
+
+    def put(self, path, size, mtime_ns, digest):
+        self._pending[path] = (size, mtime_ns, digest)
+
+    def flush(self):
+        if not self._pending:
+            return
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany("INSERT OR REPLACE INTO file_digests VALUES (?, ?, ?, ?)",
+                             [(path, *row) for path, row in self._pending.items()])
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        self._pending = {}
+
+    def prune(self):
+        """Xoá các mục của tệp không còn tồn tại."""
+        conn = self._connection()
+        missing = [(path,) for (path,) in conn.execute("SELECT path FROM file_digests") if not os.path.exists(path)]
+        conn.executemany("DELETE FROM file_digests WHERE path = ?", missing)
+        return len(missing)
+
+    def stats(self):
+        entries = self._connection().execute("SELECT COUNT(*) FROM file_digests").fetchone()[0]
+        return {'entries': entries, 'hits': self.hits, 'misses': self.misses}
+
+
+def file_digest_from_path(path, filename, cache=None, *extra):
+    """
+    Digest của một tệp trên đĩa. package.json (nhỏ) được đọc cả tệp để chuẩn hoá;
+    tệp khác đọc theo khối. Không dùng cache khi có hasher trong extra (cần đọc lại nội dung).
+    """
+    if cache is not None and not extra:
+        stat = os.stat(path)
+        key = os.path.abspath(path)
+        digest = cache.get(key, stat.st_size, stat.st_mtime_ns)
+        if digest is not None:
+            return digest
+    with open(path, "rb") as f:
+        if filename == "package.json":
+            content = canonical_package_json(f.read())
+            for other in extra:
+                other.update(content)
+            digest = content_digest(content)
+        else:
+            digest = stream_digest(f, *extra)
+    if cache is not None and not extra:
+        cache.put(key, stat.st_size, stat.st_mtime_ns, digest)
+    return digest
+
+
+def iter_directory_paths(package_path):
+    """Sinh (đường dẫn tương đối, đường dẫn đầy đủ) theo đúng thứ tự của hash_package."""
+    for dirpath, dirnames, filenames in sorted(os.walk(package_path)):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            path = os.path.join(dirpath, filename)
+            yield os.path.relpath(path, package_path), path
+
+
+def directory_digest(package_path, mode='md5', cache=None, file_digests=None):
+    """
+    Hash của một gói đã giải nén, đọc từng tệp theo khối.
+    - mode='md5': giống hệt hash_package cũ (chuỗi md5 qua đường dẫn và nội dung từng tệp).
+    - mode='merkle': gốc cây Merkle; digest từng tệp được lấy từ cache nếu tệp chưa đổi.
+    Nếu truyền vào một set file_digests, dấu vân tay của từng tệp được thêm vào đó.
+    """
+    if mode not in HASH_MODES:
+        raise ValueError(f"Unknown hash mode '{mode}'")
+    m = hashlib.md5() if mode == 'md5' else None
+    entries = []
+    for relpath, path in iter_directory_paths(package_path):
+        filename = os.path.basename(path)
+        if m is not None:
+            m.update(f"{relpath}\n".encode("utf-8"))
+            digest = file_digest_from_path(path, filename, None, m)
+        else:
+            digest = file_digest_from_path(path, filename, cache)
+        entries.append((relpath, digest))
+        if file_digests is not None:
+            file_digests.add(short_digest(digest))
+    if cache is not None:
+        cache.flush()
+    return m.hexdigest() if m is not None else merkle_root(entries)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3 or sys.argv[1] not in HASH_MODES + ('prune',):
+        print("Usage: python3 merkle.py <md5|merkle> <package_dir>... [--cache <file_digests.sqlite>]")
+        print("       python3 merkle.py prune <file_digests.sqlite>")
+        sys.exit(1)
+
+    if sys.argv[1] == 'prune':
+        print(f"Removed {DigestCache(sys.argv[2]).prune()} entries.")
+        sys.exit(0)
+
+    args = sys.argv[2:]
+    cache = None
+    if '--cache' in args:
+        position = args.index('--cache')
+        cache = DigestCache(args[position + 1])
+        del args[position:position + 2]
+    for package_path in args:
+        print(f"{directory_digest(package_path, sys.argv[1], cache)}  {package_path}")
+    if cache is not None:
+        stats = cache.stats()
+        print(f"Digest cache: {stats['hits']} hits, {stats['misses']} misses ({stats['entries']} entries)")
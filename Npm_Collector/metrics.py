@@ -0,0 +1,403 @@
+import os
+import sys
+import json
+import time
+import heapq
+import signal
+import argparse
+import threading
+from contextlib import contextmanager, nullcontext
+from functools import wraps
+
+
+METRIC_PREFIX = "npm_pipeline"
+# Cận trên các bucket (giây) của histogram thời gian mỗi bước, theo kiểu Prometheus
+BUCKETS = (0.0005, 0.002, 0.01, 0.05, 0.25, 1.0, 5.0, 30.0, 120.0)
+TOP_PACKAGES = 20  # Số gói chậm nhất được giữ lại cho báo cáo
+PROFILE_INTERVAL = 0.005  # Giây CPU giữa hai lần lấy mẫu của profiler
+PROFILE_MAX_DEPTH = 64  # Số frame tối đa của một mẫu stack
+
+_NULL = nullcontext()  # Dùng lại một đối tượng: khi tắt, stage() gần như không tốn gì
+_enabled = False
+_lock = threading.Lock()
+_local = threading.local()  # Gói đang được đo của thread hiện tại
+_stages = {}  # tên bước -> [số lần, tổng giây, giây lớn nhất, số lần theo bucket...]
+_counters = {}
+_slowest = []  # Min-heap (giây, thứ tự, bản ghi gói) giữ TOP_PACKAGES gói chậm nhất
+_stacks = {}  # Stack gộp "module:hàm;..." -> số mẫu của profiler
+_sequence = 0
+_profiling = False
+
+
+def enable(flag=True):
+    """Bật/tắt đo đạc trong process hiện tại (mặc định tắt)."""
+    global _enabled
+    _enabled = bool(flag)
+
+
+def enabled():
+    return _enabled
+
+
+def reset():
+    global _stages, _counters, _slowest, _stacks
+    with _lock:
+        _stages, _counters, _slowest, _stacks = {}, {}, [], {}
+
+
+def _after_fork():
+    # Process con không mang theo số liệu của process cha (tránh đếm hai lần khi gộp),
+    # và timer SIGPROF không được kế thừa qua fork
+    global _profiling
+    _profiling = False
+    reset()
+
+
+os.register_at_fork(after_in_child=_after_fork)
+
+
+def _record(name, seconds):
+    with _lock:
+        entry = _stages.get(name)
+        if entry is None:
+            entry = _stages[name] = [0, 0.0, 0.0] + [0] * (len(BUCKETS) + 1)
+        entry[0] += 1
+        entry[1] += seconds
+        if seconds > entry[2]:
+            entry[2] = seconds
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                entry[3 + i] += 1
+                break
+        else:
+            entry[-1] += 1
+    package = getattr(_local, 'package', None)
+    if package is not None:
+        package['stages'][name] = package['stages'].get(name, 0.0) + seconds
+
+
+def observe(name, seconds):
+    """Ghi một lần đo đã có sẵn (ví dụ thời gian build do script báo lại)."""
+    if _enabled:
+        _record(name, seconds)
+
+
+class _Timer:
+    __slots__ = ('name', 'start')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        _record(self.name, time.perf_counter() - self.start)
+        return False
+
+
+def stage(name):
+    """`with stage('parse'):` đo thời gian một bước; khi tắt trả về context rỗng dùng chung."""
+    if not _enabled:
+        return _NULL
+    return _Timer(name)
+
+
+def timed(name):
+    """Decorator đo thời gian cả hàm như một bước."""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            with _Timer(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def timed_iter(name, iterable):
+    """Đo thời gian lấy từng phần tử của iterable (ví dụ đọc tệp trong vòng lặp xử lý)."""
+    if not _enabled:
+        return iterable
+    return _timed_iter(name, iter(iterable))
+
+
+def _timed_iter(name, iterator):
+    while True:
+        start = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            _record(name, time.perf_counter() - start)
+            return
+        _record(name, time.perf_counter() - start)
+        yield item
+
+
+def count(name, value=1):
+    if _enabled:
+        with _lock:
+            _counters[name] = _counters.get(name, 0) + value
+
+
+def _add_package(record):
+    global _sequence
+    _sequence += 1
+    item = (record['seconds'], _sequence, record)
+    if len(_slowest) < TOP_PACKAGES:
+        heapq.heappush(_slowest, item)
+    elif item[0] > _slowest[0][0]:
+        heapq.heapreplace(_slowest, item)
+
+
+@contextmanager
+def _package_timer(name):
+    record = {'package': name, 'seconds': 0.0, 'files': 0, 'bytes': 0, 'stages': {}}
+    _local.package = record
+    start = time.perf_counter()
+    try:
+        yield record
+    finally:
+        record['seconds'] = time.perf_counter() - start
+        _local.package = None
+        _record('package', record['seconds'])
+        with _lock:
+            _add_package(record)
+
+
+def package(name):
+    """`with package(tên):` đo cả một gói; các bước bên trong được cộng vào bản ghi của gói."""
+    if not _enabled:
+        return _NULL
+    return _package_timer(name)
+
+
+def package_size(files, size):
+    """Số tệp và số byte của gói đang được đo (cho báo cáo gói chậm)."""
+    package = getattr(_local, 'package', None) if _enabled else None
+    if package is not None:
+        package['files'] += files
+        package['bytes'] += size
+
+
+def snapshot():
+    """Bản sao số liệu hiện tại, có thể pickle để gửi từ process con về process chính."""
+    with _lock:
+        return {'stages': {name: list(entry) for name, entry in _stages.items()},
+                'counters': dict(_counters),
+                'slowest': [record for _, _, record in _slowest],
+                'stacks': dict(_stacks)}
+
+
+def drain():
+    """snapshot() rồi xoá số liệu của process này (process con gọi sau mỗi gói)."""
+    data = snapshot()
+    reset()
+    return data
+
+
+def merge(data):
+    """Cộng số liệu từ snapshot()/drain() của process khác vào process này."""
+    if not data:
+        return
+    with _lock:
+        for name, other in data['stages'].items():
+            entry = _stages.setdefault(name, [0, 0.0, 0.0] + [0] * (len(BUCKETS) + 1))
+            entry[0] += other[0]
+            entry[1] += other[1]
+            entry[2] = max(entry[2], other[2])
+            for i in range(3, len(entry)):
+                entry[i] += other[i]
+        for name, value in data['counters'].items():
+            _counters[name] = _counters.get(name, 0) + value
+        for record in data['slowest']:
+            _add_package(record)
+        for stack, samples in data['stacks'].items():
+            _stacks[stack] = _stacks.get(stack, 0) + samples
+
+
+def slowest(n=TOP_PACKAGES):
+    """Các gói chậm nhất (mới nhất trước nếu bằng nhau), mỗi gói là một dict."""
+    with _lock:
+        records = sorted(_slowest, reverse=True)
+    return [record for _, _, record in records[:n]]
+
+
+def stage_summary():
+    """tên bước -> {'count', 'sum', 'mean', 'max'} (giây), sắp theo tổng thời gian giảm dần."""
+    with _lock:
+        items = sorted(_stages.items(), key=lambda item: item[1][1], reverse=True)
+    return {name: {'count': entry[0], 'sum': entry[1], 'mean': entry[1] / entry[0] if entry[0] else 0.0, 'max': entry[2]}
+            for name, entry in items}
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def to_prometheus():
+    """Số liệu ở định dạng text của Prometheus (dùng với textfile collector của node_exporter)."""
+    lines = [f"# HELP {METRIC_PREFIX}_stage_seconds Time spent in each pipeline stage.",
+             f"# TYPE {METRIC_PREFIX}_stage_seconds histogram"]
+    with _lock:
+        stages = {name: list(entry) for name, entry in _stages.items()}
+        counters = dict(_counters)
+    for name, entry in sorted(stages.items()):
+        cumulative = 0
+        for bound, hits in zip(BUCKETS + ('+Inf',), entry[3:]):
+            cumulative += hits
+            lines.append(f'{METRIC_PREFIX}_stage_seconds_bucket{{stage="{_label(name)}",le="{bound}"}} {cumulative}')
+        lines.append(f'{METRIC_PREFIX}_stage_seconds_sum{{stage="{_label(name)}"}} {entry[1]:.6f}')
+        lines.append(f'{METRIC_PREFIX}_stage_seconds_count{{stage="{_label(name)}"}} {entry[0]}')
+    lines += [f"# HELP {METRIC_PREFIX}_stage_seconds_max Longest single run of each pipeline stage.",
+              f"# TYPE {METRIC_PREFIX}_stage_seconds_max gauge"]
+    for name, entry in sorted(stages.items()):
+        lines.append(f'{METRIC_PREFIX}_stage_seconds_max{{stage="{_label(name)}"}} {entry[2]:.6f}')
+    lines += [f"# HELP {METRIC_PREFIX}_events_total Pipeline event counters.",
+              f"# TYPE {METRIC_PREFIX}_events_total counter"]
+    for name, value in sorted(counters.items()):
+        lines.append(f'{METRIC_PREFIX}_events_total{{name="{_label(name)}"}} {value}')
+    lines += [f"# HELP {METRIC_PREFIX}_slow_package_seconds Slowest packages processed so far.",
+              f"# TYPE {METRIC_PREFIX}_slow_package_seconds gauge"]
+    for rank, record in enumerate(slowest(), 1):
+        lines.append(f'{METRIC_PREFIX}_slow_package_seconds{{package="{_label(record["package"])}",rank="{rank}",'
+                     f'files="{record["files"]}",bytes="{record["bytes"]}"}} {record["seconds"]:.6f}')
+    return "\n".join(lines) + "\n"
+
+
+def to_json_lines():
+    """Mỗi bước, bộ đếm và gói chậm là một dòng JSON (cùng thời điểm ghi)."""
+    now = time.strftime('%Y-%m-%dT%H:%M:%S')
+    lines = []
+    for name, stats in stage_summary().items():
+        lines.append({'time': now, 'type': 'stage', 'name': name, **stats})
+    with _lock:
+        counters = dict(_counters)
+    for name, value in sorted(counters.items()):
+        lines.append({'time': now, 'type': 'counter', 'name': name, 'value': value})
+    for rank, record in enumerate(slowest(), 1):
+        lines.append({'time': now, 'type': 'slow_package', 'rank': rank, **record})
+    return "".join(json.dumps(line) + "\n" for line in lines)
+
+
+def write_metrics(path):
+    """
+    .prom: ghi đè file (đổi tên nguyên tử, an toàn cho node_exporter đang đọc);
+    đuôi khác: nối thêm các dòng JSON, thành chuỗi thời gian qua các lần ghi.
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    if path.endswith('.prom'):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as f:
+            f.write(to_prometheus())
+        os.replace(tmp_path, path)
+    else:
+        with open(path, 'a') as f:
+            f.write(to_json_lines())
+
+
+def format_size(size):
+    for unit in ('B', 'KB', 'MB'):
+        if size < 1024:
+            return f"{size:.0f}{unit}"
+        size /= 1024
+    return f"{size:.1f}GB"
+
+
+def print_report(top=10):
+    """In thời gian từng bước và các gói chậm nhất kèm số tệp, kích thước và bước tốn nhiều nhất."""
+    summary = stage_summary()
+    if not summary:
+        return
+    width = max(20, *(len(name) for name in summary))
+    print(f"  {'stage':<{width}} {'count':>8} {'total s':>9} {'mean ms':>9} {'max ms':>9}")
+    for name, stats in summary.items():
+        print(f"  {name:<{width}} {stats['count']:>8} {stats['sum']:>9.2f} {stats['mean'] * 1000:>9.2f} {stats['max'] * 1000:>9.1f}")
+    packages = slowest(top)
+    if packages:
+        print(f"  Slowest {len(packages)} packages:")
+        for record in packages:
+            stages = sorted(record['stages'].items(), key=lambda item: item[1], reverse=True)[:3]
+            breakdown = ', '.join(f"{name} {seconds:.2f}s" for name, seconds in stages)
+            print(f"    {record['seconds']:8.2f}s  {record['package']}  ({record['files']} files, "
+                  f"{format_size(record['bytes'])}; {breakdown})")
+
+
+def _sample(signum, frame):
+    parts = []
+    while frame is not None and len(parts) < PROFILE_MAX_DEPTH:
+        code = frame.f_code
+        parts.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+        frame = frame.f_back
+    stack = ';'.join(reversed(parts))
+    # Không lấy _lock trong signal handler (có thể đang bị giữ bởi chính thread này)
+    _stacks[stack] = _stacks.get(stack, 0) + 1
+
+
+def start_profiler(interval=PROFILE_INTERVAL):
+    """
+    Profiler lấy mẫu: cứ mỗi interval giây CPU (SIGPROF) ghi lại stack của thread chính.
+    Chỉ chạy được trong thread chính; mẫu được gộp cùng các số liệu khác (snapshot/merge).
+    """
+    global _profiling
+    if _profiling or threading.current_thread() is not threading.main_thread():
+        return False
+    signal.signal(signal.SIGPROF, _sample)
+    signal.setitimer(signal.ITIMER_PROF, interval, interval)
+    _profiling = True
+    return True
+
+
+def profiling():
+    return _profiling
+
+
+def stop_profiler():
+    global _profiling
+    if _profiling:
+        signal.setitimer(signal.ITIMER_PROF, 0, 0)
+        signal.signal(signal.SIGPROF, signal.SIG_DFL)
+        _profiling = False
+
+
+def write_profile(path):
+    """Ghi các stack đã lấy mẫu dạng "collapsed" (đọc được bằng flamegraph.pl hoặc speedscope)."""
+    with _lock:
+        stacks = sorted(_stacks.items(), key=lambda item: item[1], reverse=True)
+    with open(path, 'w') as f:
+        for stack, samples in stacks:
+            f.write(f"{stack} {samples}\n")
+    return sum(samples for _, samples in stacks)
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Summarize a JSON lines metrics file written by data_processing.py, predict.py or reproduce.py.")
+    parser.add_argument("metrics_file", help="File written with --metrics <file>.jsonl.")
+    parser.add_argument("--top", type=int, default=10, help="Number of slowest packages to show.")
+    args = parser.parse_args()
+
+    # Chỉ dùng lần ghi cuối cùng (số liệu là cộng dồn)
+    with open(args.metrics_file) as f:
+        lines = [json.loads(line) for line in f if line.strip()]
+    if not lines:
+        sys.exit(f"No metrics in '{args.metrics_file}'")
+    last = [line for line in lines if line['time'] == lines[-1]['time']]
+    print(f"Metrics at {lines[-1]['time']}:")
+    width = max([20, *(len(line['name']) for line in last if line['type'] == 'stage')])
+    print(f"  {'stage':<{width}} {'count':>8} {'total s':>9} {'mean ms':>9} {'max ms':>9}")
+    for line in last:
+        if line['type'] == 'stage':
+            print(f"  {line['name']:<{width}} {line['count']:>8} {line['sum']:>9.2f} {line['mean'] * 1000:>9.2f} {line['max'] * 1000:>9.1f}")
+    for line in last:
+        if line['type'] == 'counter':
+            print(f"  {line['name']}: {line['value']}")
+    packages = [line for line in last if line['type'] == 'slow_package'][:args.top]
+    if packages:
+        print(f"  Slowest {len(packages)} packages:")
+        for line in packages:
+            print(f"    {line['seconds']:8.2f}s  {line['package']}  ({line['files']} files, {format_size(line['bytes'])})")
@@ -0,0 +1,121 @@
+import os
+import time
+import sqlite3
+
+
+DEFAULT_INDEX_PATH = "/home/kali/Documents/npm/cache/processed_packages.sqlite"
+BUSY_TIMEOUT = 60
+
+
+def package_entry_name(spec):
+    """
+    'name@version' -> tên thư mục/tarball mà collect_packages.sh tạo ra
+    ('@scope/name@1.0.0' -> '@scope-name-1.0.0').
+    """
+    name, _, version = spec.rpartition('@')
+    return f"{name}-{version}".replace('/', '-')
+
+
+class PackageIndex:
+    """
+    Chỉ mục SQLite các gói đã xử lý (khoá theo tên gói-phiên bản) và vị trí đã đọc
+    của từng file log của collector. Tra cứu dùng khoá chính nên chi phí khởi động
+    và mỗi lần kiểm tra không phụ thuộc số gói đã xử lý trước đó.
+    """
+
+    def __init__(self, path=DEFAULT_INDEX_PATH):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS processed (
+                package_name TEXT PRIMARY KEY,
+                spec TEXT,
+                date TEXT,
+                status TEXT NOT NULL,
+                processed_at REAL NOT NULL
+            )""")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_processed_date ON processed(date)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS log_offsets (log_path TEXT PRIMARY KEY, offset INTEGER NOT NULL)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS seeded_dates (date TEXT PRIMARY KEY)")
+        # Gói làm crash process con: chưa được coi là đã xử lý, được thử lại ở các lần quét sau
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS crashed (
+                package_name TEXT PRIMARY KEY,
+                spec TEXT,
+                date TEXT,
+                attempts INTEGER NOT NULL,
+                crashed_at REAL NOT NULL
+            )""")
+
+    def processed_names(self, package_names):
+        """Trả về tập con của package_names đã có trong chỉ mục."""
+        package_names = list(package_names)
+        found = set()
+        # SQLite giới hạn số tham số trong một câu lệnh
+        for i in range(0, len(package_names), 500):
+            chunk = package_names[i:i + 500]
+            placeholders = ','.join('?' * len(chunk))
+            rows = self.conn.execute(f"SELECT package_name FROM processed WHERE package_name IN ({placeholders})", chunk)
+            found.update(row[0] for row in rows)
+        return found
+
+    def mark_processed(self, package_names, date, status='done', specs=None):
+        specs = specs or {}
+        now = time.time()
+        rows = [(name, specs.get(name), date, status, now) for name in package_names]
+        if rows:
+            with self.conn:
+                self.conn.executemany("INSERT OR REPLACE INTO processed VALUES (?, ?, ?, ?, ?)", rows)
+                self.conn.executemany("DELETE FROM crashed WHERE package_name = ?", [(row[0],) for row in rows])
+
+    def mark_crashed(self, package_names, date, specs=None):
+        """Ghi nhận thêm một lần crash cho mỗi gói. Trả về {tên gói: số lần đã crash}."""
+        specs = specs or {}
+        now = time.time()
+        rows = [(name, specs.get(name), date, now) for name in package_names]
+        if not rows:
+            return {}
+        with self.conn:
+            self.conn.executemany("""
+                INSERT INTO crashed VALUES (?, ?, ?, 1, ?)
+                ON CONFLICT(package_name) DO UPDATE SET attempts = attempts + 1, crashed_at = excluded.crashed_at""", rows)
+        return {name: self.conn.execute("SELECT attempts FROM crashed WHERE package_name = ?", (name,)).fetchone()[0]
+                for name in package_names}
+
+    def crashed_specs(self, date):
+        """Các gói của ngày date đang chờ thử lại sau khi làm crash process con: {tên gói: spec}."""
+        rows = self.conn.execute("SELECT package_name, spec FROM crashed WHERE date = ? ORDER BY package_name", (date,))
+        return dict(rows.fetchall())
+
+    def seed_from_names(self, date, package_names):
+        """
+        Nhập một lần danh sách gói đã có trong CSV của ngày date (khi chuyển từ
+        cách cũ sang chỉ mục), để không xử lý lại các gói đó.
+        """
+        if self.conn.execute("SELECT 1 FROM seeded_dates WHERE date = ?", (date,)).fetchone():
+            return False
+        now = time.time()
+        with self.conn:
+            self.conn.executemany("INSERT OR IGNORE INTO processed VALUES (?, NULL, ?, 'done', ?)",
+                                  [(name, date, now) for name in package_names])
+            self.conn.execute("INSERT INTO seeded_dates VALUES (?)", (date,))
+        return True
+
+    def is_seeded(self, date):
+        return self.conn.execute("SELECT 1 FROM seeded_dates WHERE date = ?", (date,)).fetchone() is not None
+
+    def get_offset(self, log_path):
+        row = self.conn.execute("SELECT offset FROM log_offsets WHERE log_path = ?", (log_path,)).fetchone()
+        return row[0] if row else 0
+
+    def set_offset(self, log_path, offset):
+        with self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO log_offsets VALUES (?, ?)", (log_path, offset))
+
+    def count(self, date=None):
+        if date is None:
+            return self.conn.execute("SELECT COUNT(*) FROM processed").fetchone()[0]
+        return self.conn.execute("SELECT COUNT(*) FROM processed WHERE date = ?", (date,)).fetchone()[0]
@@ -0,0 +1,162 @@
+import os
+import copy
+import resource
+import threading
+import contextlib
+import multiprocessing
+from ast_visitor import scan_api_usage, scan_api_usage_regex
+
+
+MAX_FILE_PARSE_BYTES = 2 * 1024 * 1024  # Tệp lớn hơn không được parse (chỉ regex/entropy)
+MAX_PACKAGE_PARSE_BYTES = 16 * 1024 * 1024  # Tổng số byte được parse của một gói
+PARSE_TIMEOUT = 15  # Giây; parse lâu hơn thì process parse bị kill
+PARSE_MEMORY_HEADROOM = 1024 * 1024 * 1024  # Bộ nhớ ảo process parse được cấp thêm so với lúc khởi động
+MIN_ISOLATED_BYTES = 32 * 1024  # Tệp nhỏ hơn parse ngay trong process hiện tại (gửi qua pipe tốn hơn parse)
+
+
+def _virtual_memory_bytes():
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[0]) * resource.getpagesize()
+
+
+def _serve(conn, memory_headroom):
+    """Vòng lặp của process parse: nhận nội dung tệp, trả về cờ API (None nếu hết bộ nhớ)."""
+    if memory_headroom:
+        try:
+            limit = _virtual_memory_bytes() + memory_headroom
+            resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+        except (OSError, ValueError):
+            pass
+    while True:
+        try:
+            content = conn.recv()
+        except EOFError:
+            return
+        try:
+            flags = scan_api_usage(content)
+        except (MemoryError, RecursionError):
+            flags = None
+        conn.send(flags)
+
+
+class ParseWorker:
+    """
+    Process con giữ lâu dài để parse tệp JavaScript bằng esprima. Nếu parse vượt quá
+    timeout giây (hoặc process chết vì hết bộ nhớ), process bị kill và được tạo lại ở
+    lần gọi sau; scan() trả về None để bên gọi chuyển sang cách không cần parse.
+    Mỗi lúc chỉ một luồng dùng một ParseWorker (xem parse_worker()).
+    """
+
+    def __init__(self, timeout=PARSE_TIMEOUT, memory_headroom=PARSE_MEMORY_HEADROOM):
+        self.timeout = timeout
+        self.memory_headroom = memory_headroom
+        self._process = None
+        self._conn = None
+        self._pid = None
+
+    def _start(self):
+        # Không fork từ process nhiều luồng (ví dụ predict_service): luồng khác có thể đang giữ lock
+        context = multiprocessing.get_context('fork' if threading.active_count() == 1 else 'forkserver')
+        self._conn, child_conn = context.Pipe()
+        self._process = context.Process(target=_serve, args=(child_conn, self.memory_headroom), daemon=True)
+        self._process.start()
+        child_conn.close()
+        self._pid = os.getpid()
+
+    def kill(self):
+        if self._process is not None and self._pid == os.getpid():
+            self._process.kill()
+            self._process.join()
+            self._conn.close()
+        self._process = None
+        self._conn = None
+
+    def scan(self, content):
+        """Cờ API của content, hoặc None nếu hết thời gian/bộ nhớ."""
+        # Process con không dùng được sau fork (ví dụ trong worker của ProcessPoolExecutor)
+        if self._process is None or self._pid != os.getpid() or not self._process.is_alive():
+            self._process = None
+            self._start()
+        try:
+            self._conn.send(content)
+            if self._conn.poll(self.timeout):
+                return self._conn.recv()
+        except (EOFError, OSError):
+            pass
+        self.kill()
+        return None
+
+
+_workers = {}  # (timeout, memory_headroom) -> các ParseWorker đang rảnh
+_workers_lock = threading.Lock()
+
+
+def _reset_workers():
+    # Process con sau fork không dùng được process parse (và lock) của process cha
+    global _workers_lock
+    _workers.clear()
+    _workers_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_workers)
+
+
+@contextlib.contextmanager
+def parse_worker(timeout, memory_headroom=PARSE_MEMORY_HEADROOM):
+    """
+    Mượn một process parse rảnh cho cấu hình này (tạo mới nếu tất cả đang bận), trả lại khi
+    xong. Các luồng không bao giờ dùng chung một pipe, nên cờ không bị lẫn và timeout của
+    luồng này không kill phần parse của luồng khác.
+    """
+    key = (timeout, memory_headroom)
+    with _workers_lock:
+        idle = _workers.setdefault(key, [])
+        worker = idle.pop() if idle else ParseWorker(timeout, memory_headroom)
+    try:
+        yield worker
+    finally:
+        with _workers_lock:
+            _workers.setdefault(key, []).append(worker)
+
+
+class ParseBudget:
+    """
+    Giới hạn tài nguyên khi parse mã của một gói: số byte tối đa được parse mỗi tệp và
+    cả gói, thời gian parse tối đa mỗi tệp (timeout=None: parse trong process hiện tại,
+    không giới hạn thời gian). Dùng for_package() để có bộ đếm riêng cho từng gói.
+    """
+
+    def __init__(self, max_file_bytes=MAX_FILE_PARSE_BYTES, max_package_bytes=MAX_PACKAGE_PARSE_BYTES,
+                 timeout=PARSE_TIMEOUT, memory_headroom=PARSE_MEMORY_HEADROOM):
+        self.max_file_bytes = max_file_bytes
+        self.max_package_bytes = max_package_bytes
+        self.timeout = timeout
+        self.memory_headroom = memory_headroom
+        self.parsed_bytes = 0
+
+    def for_package(self):
+        budget = copy.copy(self)
+        budget.parsed_bytes = 0
+        return budget
+
+    def allow(self, size):
+        """True (và trừ vào hạn mức của gói) nếu được parse một tệp size byte."""
+        if self.max_file_bytes is not None and size > self.max_file_bytes:
+            return False
+        if self.max_package_bytes is not None and self.parsed_bytes + size > self.max_package_bytes:
+            return False
+        self.parsed_bytes += size
+        return True
+
+    def scan(self, content):
+        """(cờ API, timed_out). Hết thời gian thì dùng cờ tìm bằng regex."""
+        if not self.timeout or len(content) < MIN_ISOLATED_BYTES:
+            return scan_api_usage(content), False
+        with parse_worker(self.timeout, self.memory_headroom) as worker:
+            flags = worker.scan(content)
+        if flags is None:
+            return scan_api_usage_regex(content), True
+        return flags, False
+
+
+DEFAULT_BUDGET = ParseBudget()
@@ -0,0 +1,286 @@
+import os
+import re
+import sys
+import glob
+import time
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+
+STORAGE_BACKENDS = ('csv', 'parquet')
+PARTITION_PREFIX = 'date='
+DATE_PATTERN = re.compile(r'(\d{4}-\d{2}-\d{2})')
+
+# Kiểu dữ liệu của các cột khi lưu dạng Parquet
+INT64_COLUMNS = {'total_code_size'}
+FLOAT32_COLUMNS = {'avg_entropy', 'max_entropy', 'max_window_entropy', 'p95_window_entropy', 'probability'}
+STRING_COLUMNS = {'package_name', 'hash', 'file_digests', 'model'}
+# Kết quả dự đoán dạng dài: một dòng cho mỗi gói và model (kể cả các quyết định ensemble_<method>)
+PREDICTION_COLUMNS = ('package_name', 'model', 'label', 'probability')
+
+
+def column_type(name):
+    if pa is None:
+        return None
+    if name in STRING_COLUMNS:
+        return pa.string()
+    if name in INT64_COLUMNS:
+        return pa.int64()
+    if name in FLOAT32_COLUMNS or name.startswith('prob_'):
+        return pa.float32()
+    if name.startswith('has_'):
+        return pa.bool_()
+    if name.startswith('num_'):
+        return pa.int32()
+    if name == 'label':
+        return pa.int8()
+    return None
+
+
+def require_pyarrow():
+    if pa is None:
+        raise ImportError("Parquet storage needs pyarrow. Install it with: pip install pyarrow")
+
+
+def is_csv_target(target):
+    return target.endswith('.csv')
+
+
+def partition_dir(output_dir, date):
+    """Thư mục partition của một ngày: <output_dir>/date=YYYY-MM-DD."""
+    return os.path.join(output_dir, f"{PARTITION_PREFIX}{date}")
+
+
+def output_target(output_dir, date, backend='csv'):
+    """Nơi ghi dữ liệu của một ngày: file <date>.csv hoặc thư mục partition Parquet."""
+    if backend == 'parquet':
+        return partition_dir(output_dir, date)
+    return os.path.join(output_dir, f"{date}.csv")
+
+
+def to_arrow(df):
+    """Chuyển DataFrame sang bảng Arrow với kiểu cột cố định (int32/bool/float32, ...)."""
+    require_pyarrow()
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    fields = []
+    for field in table.schema:
+        dtype = column_type(field.name)
+        fields.append(pa.field(field.name, dtype) if dtype is not None else field)
+    return table.cast(pa.schema(fields))
+
+
+def append_rows(rows, target):
+    """
+    Ghi nối các dòng mới.
+    - target là file .csv: ghi nối vào CSV, chỉ ghi header khi file chưa tồn tại.
+    - target là thư mục partition: ghi thêm một file part Parquet (ghi ra file tạm rồi
+      đổi tên nên người đọc không bao giờ thấy file ghi dở).
+    """
+    df = rows if isinstance(rows, pd.DataFrame) else pd.DataFrame(rows)
+    if df.empty:
+        return
+
+    if is_csv_target(target):
+        write_header = not os.path.exists(target)
+        if not write_header:
+            existing_columns = list(pd.read_csv(target, nrows=0).columns)
+            new_columns = [name for name in df.columns if name not in existing_columns]
+            if new_columns:
+                # Có cột mới (ví dụ nâng cấp giữa ngày): ghi lại cả file với header gộp để không mất cột nào.
+                # Các dòng cũ được đọc dạng chuỗi nên giữ nguyên giá trị, cột mới của chúng để trống.
+                print(f"    -> Adding columns {', '.join(new_columns)} to '{target}'")
+                old = pd.read_csv(target, dtype=str, keep_default_na=False)
+                merged = pd.concat([old, df.astype(object)], ignore_index=True).reindex(columns=existing_columns + new_columns)
+                tmp_path = target + '.tmp'
+                merged.to_csv(tmp_path, index=False)
+                os.replace(tmp_path, target)
+                print(f"    -> Saved {len(df)} samples to '{target}'")
+                return
+            # Giữ đúng thứ tự cột của file đã có
+            df = df.reindex(columns=existing_columns)
+        df.to_csv(target, mode='a', header=write_header, index=False)
+    else:
+        os.makedirs(target, exist_ok=True)
+        part_name = f"part-{time.time_ns()}-{os.getpid()}.parquet"
+        tmp_path = os.path.join(target, f".{part_name}.tmp")
+        pq.write_table(to_arrow(df), tmp_path)
+        os.replace(tmp_path, os.path.join(target, part_name))
+
+    print(f"    -> Saved {len(df)} samples to '{target}'")
+
+
+def prediction_rows(df, model, labels, probabilities=None):
+    """
+    Các dòng kết quả của một model cho các gói trong df (cùng thứ tự). probabilities là None
+    (model không có xác suất) thì cột probability để trống. Cột date của df (nếu có) được giữ lại.
+    """
+    names = df['package_name'] if 'package_name' in df.columns else pd.Series(df.index.astype(str), index=df.index)
+    rows = pd.DataFrame({
+        'package_name': names.to_numpy(),
+        'model': model,
+        'label': pd.Series(labels).to_numpy(dtype='int8'),
+        'probability': pd.Series(probabilities, dtype='float32').to_numpy() if probabilities is not None else float('nan'),
+    })
+    if 'date' in df.columns:
+        rows['date'] = df['date'].astype(object).to_numpy()
+    return rows
+
+
+def write_predictions(rows, output_dir, date, backend='csv'):
+    """
+    Ghi kết quả dự đoán (PREDICTION_COLUMNS) vào dữ liệu theo ngày của output_dir: <date>.csv
+    hoặc partition date=YYYY-MM-DD/. Dòng có cột date (đầu vào gồm nhiều ngày) được ghi vào
+    ngày của nó. Trả về danh sách nơi đã ghi.
+    """
+    df = rows if isinstance(rows, pd.DataFrame) else pd.concat(rows, ignore_index=True)
+    os.makedirs(output_dir, exist_ok=True)
+    days = df['date'].astype(object).fillna(date) if 'date' in df.columns else pd.Series(date, index=df.index)
+    targets = []
+    for day, group in df.groupby(days.astype(str), sort=True):
+        target = output_target(output_dir, day, backend)
+        append_rows(group[list(PREDICTION_COLUMNS)], target)
+        targets.append(target)
+    return targets
+
+
+def date_from_path(path):
+    """Ngày YYYY-MM-DD trong tên file/thư mục (2025-07-03.csv, date=2025-07-03), None nếu không có."""
+    match = DATE_PATTERN.search(os.path.basename(os.path.normpath(path)))
+    return match.group(1) if match else None
+
+
+def compact_partition(target):
+    """Gộp các file part của một partition thành một file duy nhất để đọc nhanh hơn."""
+    require_pyarrow()
+    parts = sorted(glob.glob(os.path.join(target, 'part-*.parquet')))
+    if len(parts) < 2:
+        return len(parts)
+    table = pa.concat_tables([pq.read_table(part) for part in parts], promote_options='default')
+    tmp_path = os.path.join(target, '.compacted.parquet.tmp')
+    pq.write_table(table, tmp_path)
+    os.replace(tmp_path, os.path.join(target, f"part-{time.time_ns()}-{os.getpid()}.parquet"))
+    for part in parts:
+        os.remove(part)
+    return len(parts)
+
+
+def list_dates(output_dir):
+    """Các ngày có dữ liệu trong thư mục (partition Parquet hoặc file <date>.csv)."""
+    dates = set()
+    for name in os.listdir(output_dir):
+        if name.startswith(PARTITION_PREFIX):
+            dates.add(name[len(PARTITION_PREFIX):])
+        elif name.endswith('.csv') and DATE_PATTERN.fullmatch(name[:-4]):
+            dates.add(name[:-4])
+    return sorted(dates)
+
+
+def _read_parquet_dir(path, columns, start_date, end_date):
+    require_pyarrow()
+    # File tạm (bắt đầu bằng '.') bị bỏ qua khi quét thư mục
+    partitioning = ds.partitioning(pa.schema([('date', pa.string())]), flavor='hive')
+    if os.path.basename(os.path.normpath(path)).startswith(PARTITION_PREFIX):
+        dataset = ds.dataset(path, format='parquet', partitioning=partitioning)
+    else:
+        # Chỉ đọc các file part trong partition: thư mục có thể chứa cả <date>.csv
+        parts = sorted(glob.glob(os.path.join(path, f"{PARTITION_PREFIX}*", 'part-*.parquet')))
+        dataset = ds.dataset(parts, format='parquet', partitioning=partitioning, partition_base_dir=path)
+    names = dataset.schema.names
+    if columns is not None:
+        columns = [name for name in columns if name in names]
+    expression = None
+    if 'date' in names:
+        if start_date is not None:
+            expression = ds.field('date') >= start_date
+        if end_date is not None:
+            upper = ds.field('date') <= end_date
+            expression = upper if expression is None else expression & upper
+    return dataset.to_table(columns=columns, filter=expression).to_pandas()
+
+
+def read_table(path, columns=None, start_date=None, end_date=None):
+    """
+    Đọc dữ liệu từ một file CSV/Parquet, một partition, hoặc cả thư mục chứa nhiều ngày
+    (Parquet date=YYYY-MM-DD/ và/hoặc <date>.csv). columns: chỉ đọc các cột cần thiết.
+    start_date/end_date (YYYY-MM-DD) lọc theo ngày khi đọc một thư mục.
+    """
+    if not os.path.exists(path):
+        raise FileNotFoundError(path)
+
+    if os.path.isfile(path):
+        if path.endswith('.parquet'):
+            require_pyarrow()
+            return pq.read_table(path, columns=columns).to_pandas()
+        usecols = (lambda name: name in columns) if columns is not None else None
+        return pd.read_csv(path, usecols=usecols)
+
+    if os.path.basename(os.path.normpath(path)).startswith(PARTITION_PREFIX) or glob.glob(os.path.join(path, 'part-*.parquet')):
+        return _read_parquet_dir(path, columns, None, None)
+
+    frames = []
+    has_partitions = any(name.startswith(PARTITION_PREFIX) for name in os.listdir(path))
+    if has_partitions:
+        frames.append(_read_parquet_dir(path, columns, start_date, end_date))
+
+    csv_columns = None if columns is None else list(columns) + ['date']
+    for date in list_dates(path):
+        csv_path = os.path.join(path, f"{date}.csv")
+        if not os.path.isfile(csv_path):
+            continue
+        if (start_date is not None and date < start_date) or (end_date is not None and date > end_date):
+            continue
+        df = read_table(csv_path, csv_columns)
+        if columns is None or 'date' in columns:
+            df['date'] = date
+        frames.append(df)
+
+    frames = [frame for frame in frames if not frame.empty]
+    if not frames:
+        return pd.DataFrame(columns=columns)
+    return pd.concat(frames, ignore_index=True)
+
+
+def convert_csv_dir(input_dir, output_dir):
+    """Chuyển các file <date>.csv trong input_dir sang partition Parquet trong output_dir."""
+    converted = 0
+    for date in list_dates(input_dir):
+        csv_path = os.path.join(input_dir, f"{date}.csv")
+        if not os.path.isfile(csv_path):
+            continue
+        target = partition_dir(output_dir, date)
+        if os.path.exists(target):
+            continue
+        append_rows(pd.read_csv(csv_path), target)
+        converted += 1
+    return converted
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3 or sys.argv[1] not in ('convert', 'compact', 'info'):
+        print("Usage: python3 storage.py convert <csv_dir> <parquet_dir>")
+        print("       python3 storage.py compact <parquet_dir>")
+        print("       python3 storage.py info <dir_or_file>")
+        sys.exit(1)
+
+    command = sys.argv[1]
+    if command == 'convert' and len(sys.argv) == 4:
+        print(f"Converted {convert_csv_dir(sys.argv[2], sys.argv[3])} days.")
+    elif command == 'compact':
+        for date in list_dates(sys.argv[2]):
+            target = partition_dir(sys.argv[2], date)
+            if os.path.isdir(target):
+                print(f"{date}: merged {compact_partition(target)} parts")
+    elif command == 'info':
+        start = time.perf_counter()
+        df = read_table(sys.argv[2])
+        print(f"Loaded {len(df)} rows, {len(df.columns)} columns in {time.perf_counter() - start:.2f}s")
+        print(df.dtypes.to_string())
+    else:
+        print("Usage: python3 storage.py convert <csv_dir> <parquet_dir>")
+        sys.exit(1)
@@ -0,0 +1,72 @@
+import os
+import time
+import select
+import ctypes
+import ctypes.util
+
+
+POLL_INTERVAL = 5  # Giây giữa hai lần kiểm tra khi không dùng được inotify
+DEBOUNCE_DELAY = 0.5  # Gom các sự kiện đến liền nhau thành một lần xử lý
+
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+
+
+def _init_inotify(directory):
+    """Tạo inotify watch cho directory qua libc. Trả về file descriptor hoặc None nếu không hỗ trợ."""
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+    except (OSError, AttributeError):
+        return None
+    if fd < 0:
+        return None
+    if libc.inotify_add_watch(fd, os.fsencode(directory), WATCH_MASK) < 0:
+        os.close(fd)
+        return None
+    return fd
+
+
+class DirectoryWatcher:
+    """
+    Chờ thay đổi trong một thư mục (tạo/ghi/đổi tên tệp). Dùng inotify trên Linux,
+    nếu không có thì quay về kiểm tra định kỳ mỗi poll_interval giây.
+    """
+
+    def __init__(self, directory, poll_interval=POLL_INTERVAL):
+        self.directory = directory
+        self.poll_interval = poll_interval
+        self.fd = _init_inotify(directory)
+
+    @property
+    def mode(self):
+        return 'inotify' if self.fd is not None else 'polling'
+
+    def wait(self, timeout):
+        """Chờ tối đa timeout giây. Trả về True nếu (có thể) đã có thay đổi."""
+        if self.fd is None:
+            time.sleep(min(timeout, self.poll_interval))
+            return True
+
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return False
+        time.sleep(DEBOUNCE_DELAY)
+        self._drain()
+        return True
+
+    def _drain(self):
+        while True:
+            try:
+                if not os.read(self.fd, 65536):
+                    return
+            except BlockingIOError:
+                return
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
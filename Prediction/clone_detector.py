@@ -1,8 +1,12 @@
-import pandas as pd
 import sys
 import os
 
-def find_clones_in_files(malicious_hashes_csv, new_hashes_csv):
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Npm_Collector'))
+from storage import read_table
+from hash_index import load_index
+from near_clone import NearCloneIndex, find_near_clones, near_clone_path, save_near_clones
+
+def find_clones_in_files(malicious_hashes_csv, new_hashes_csv, near_clone_index=None):
 
     print("--- Start Clone Detection ---")
 
@@ -13,45 +17,58 @@ def find_clones_in_files(malicious_hashes_csv, new_hashes_csv):
             return
 
     try:
-        malicious_df = pd.read_csv(malicious_hashes_csv)
-        # Chuyển hash độc hại vào một set để tra cứu cực nhanh (O(1))
-        malicious_hashes_set = set(malicious_df['hash'])
-        print(f"Loaded {len(malicious_hashes_set)} hash malicious from '{malicious_hashes_csv}'")
+        # Index digest đã sắp xếp (memory-map file .idx nếu có) thay cho set các chuỗi hex
+        malicious_index = load_index(malicious_hashes_csv)
+        print(f"Loaded {len(malicious_index)} hash malicious from '{malicious_index.path or malicious_hashes_csv}'")
         
-        new_hashes_df = pd.read_csv(new_hashes_csv)
+        new_hashes_df = read_table(new_hashes_csv, columns=['package_name', 'hash', 'file_digests'])
         if new_hashes_df.empty:
             print("File new hash is empty ")
             return
         print(f"Loaded {len(new_hashes_df)} new hash from '{new_hashes_csv}'")
     except Exception as e:
-        print(f"Error loading file CSV: {e}")
+        print(f"Error loading hash file: {e}")
         return
 
-    detected_clones = []
-    for index, row in new_hashes_df.iterrows():
-        if row['hash'] in malicious_hashes_set:
-            detected_clones.append(row)
+    # Tra cứu cả lô hash mới một lần
+    is_clone = malicious_index.contains(new_hashes_df['hash'])
+    clones_df = new_hashes_df.loc[is_clone, ['package_name', 'hash']]
 
-    if not detected_clones:
+    if clones_df.empty:
         print("\nNot detect any clone packages.")
     else:
-        print(f"\nALERT: Detected {len(detected_clones)} clone of known malicious packages!")
-        clones_df = pd.DataFrame(detected_clones)   
+        print(f"\nALERT: Detected {len(clones_df)} clone of known malicious packages!")
         print(clones_df.to_string(index=False))
        
-        base_name = os.path.basename(new_hashes_csv)
-        name, ext = os.path.splitext(base_name)
-        output_csv_path = f"../Prediction_Result/{name}_clones_detected{ext}"
+        base_name = os.path.basename(os.path.normpath(new_hashes_csv))
+        name, _ = os.path.splitext(base_name)
+        output_csv_path = f"../Prediction_Result/{name}_clones_detected.csv"
         
         clones_df.to_csv(output_csv_path, index=False)
         print(f"\nSaved to file: '{output_csv_path}'")
 
+    # Bản sao gần đúng (sửa/thêm vài tệp): so chữ ký MinHash với index LSH của các gói độc hại
+    near_clone_index = near_clone_index or near_clone_path(malicious_hashes_csv)
+    if not os.path.exists(near_clone_index):
+        return
+    if 'file_digests' not in new_hashes_df.columns:
+        print(f"\nSkip near-clone detection: '{new_hashes_csv}' has no file_digests column")
+        return
+    near_df = find_near_clones(NearCloneIndex(near_clone_index), new_hashes_df[~is_clone])
+    if near_df.empty:
+        print("\nNot detect any near-clone packages.")
+    else:
+        print(f"\nALERT: Detected {near_df['package_name'].nunique()} near-clone of known malicious packages!")
+        print(near_df.to_string(index=False))
+        print(f"\nSaved to file: '{save_near_clones(near_df, new_hashes_csv)}'")
+
 if __name__ == "__main__":
-    if len(sys.argv) != 3:
-        print("Usage: python3 clone_detector.py <path_to_malicious_hashes.csv> <path_to_new_hashes.csv>")
+    if len(sys.argv) not in (3, 4):
+        print("Usage: python3 clone_detector.py <path_to_malicious_hashes.csv|.idx> <path_to_new_hashes.csv|.parquet|partition_dir> [near_clone_index.lsh]")
         sys.exit(1)
         
     malicious_file = sys.argv[1]
     new_hashes_file = sys.argv[2]
+    near_clone_file = sys.argv[3] if len(sys.argv) == 4 else None
     
-    find_clones_in_files(malicious_file, new_hashes_file)
+    find_clones_in_files(malicious_file, new_hashes_file, near_clone_file)
@@ -0,0 +1,183 @@
+import os
+import sys
+import argparse
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Npm_Collector'))
+from storage import read_table
+
+
+INDEX_SUFFIX = '.idx'
+MAGIC = b'NPMHASH1'
+HEADER_SIZE = 16  # MAGIC + số hash (uint64 little-endian), nên mảng hash bắt đầu ở byte 16
+DIGEST_SIZE = 16  # md5 = 16 byte
+DIGEST_DTYPE = np.dtype(f'S{DIGEST_SIZE}')
+
+
+def to_digests(hashes):
+    """
+    Chuyển danh sách hash hex (md5) sang mảng digest 16 byte.
+    Trả về (digests, valid): valid đánh dấu các hash hợp lệ, digests chỉ gồm các hash đó.
+    """
+    hashes = pd.Series(hashes, dtype=object).astype(str).str.strip().str.lower()
+    valid = hashes.str.fullmatch(f'[0-9a-f]{{{DIGEST_SIZE * 2}}}').to_numpy(dtype=bool)
+    digests = np.frombuffer(bytes.fromhex(''.join(hashes[valid])), dtype=DIGEST_DTYPE)
+    return digests, valid
+
+
+def read_hashes(path):
+    """Đọc cột hash từ file CSV/Parquet hoặc thư mục partition."""
+    return read_table(path, columns=['hash'])['hash'].dropna()
+
+
+def write_index(digests, path):
+    """Ghi các digest (đã sắp xếp, không trùng) ra file index; ghi file tạm rồi đổi tên."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(MAGIC)
+        f.write(np.uint64(len(digests)).tobytes())
+        f.write(np.ascontiguousarray(digests, dtype=DIGEST_DTYPE).tobytes())
+    os.replace(tmp_path, path)
+
+
+def index_path(hashes_path):
+    """File index mặc định nằm cạnh file hash: malicious_hashes.csv -> malicious_hashes.idx."""
+    return os.path.splitext(os.path.normpath(hashes_path))[0] + INDEX_SUFFIX
+
+
+def fresh_index_path(hashes_path):
+    """File index của hashes_path nếu đã có và mới hơn file hash, ngược lại None."""
+    path = index_path(hashes_path)
+    if os.path.isfile(path) and os.path.getmtime(path) >= os.path.getmtime(hashes_path):
+        return path
+    return None
+
+
+class HashIndex:
+    """
+    Tập hash độc hại dạng mảng digest 16 byte đã sắp xếp. File index được đọc bằng np.memmap
+    nên không phải nạp cả tập vào bộ nhớ; tra cứu một lô hash bằng một lần searchsorted.
+    """
+
+    def __init__(self, path=None, digests=None):
+        self.path = path
+        if path is None:
+            self.digests = np.unique(digests) if digests is not None else np.empty(0, dtype=DIGEST_DTYPE)
+            return
+        with open(path, 'rb') as f:
+            header = f.read(HEADER_SIZE)
+        if len(header) != HEADER_SIZE or header[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"'{path}' is not a hash index file")
+        count = int(np.frombuffer(header[len(MAGIC):], dtype='<u8')[0])
+        if os.path.getsize(path) != HEADER_SIZE + count * DIGEST_SIZE:
+            raise ValueError(f"'{path}' is truncated")
+        if count == 0:
+            self.digests = np.empty(0, dtype=DIGEST_DTYPE)
+        else:
+            self.digests = np.memmap(path, dtype=DIGEST_DTYPE, mode='r', offset=HEADER_SIZE, shape=(count,))
+
+    @classmethod
+    def from_hashes(cls, hashes):
+        """Dựng index trong bộ nhớ (không ghi file)."""
+        return cls(digests=to_digests(hashes)[0])
+
+    def __len__(self):
+        return len(self.digests)
+
+    def _lookup(self, digests):
+        if not len(self.digests) or not len(digests):
+            return np.zeros(len(digests), dtype=bool)
+        positions = np.searchsorted(self.digests, digests)
+        positions[positions == len(self.digests)] = 0
+        return self.digests[positions] == digests
+
+    def contains(self, hashes):
+        """Mảng bool: hash nào có trong index. Hash sai định dạng/NaN luôn là False."""
+        digests, valid = to_digests(hashes)
+        found = np.zeros(len(valid), dtype=bool)
+        found[valid] = self._lookup(digests)
+        return found
+
+    def merge(self, hashes, path=None):
+        """
+        Thêm các hash mới và ghi ra path (mặc định là file đang mở). Mảng cũ đã sắp xếp
+        nên các digest mới chỉ cần chèn vào đúng vị trí. Trả về số hash thực sự được thêm.
+        """
+        path = path or self.path
+        new = np.unique(to_digests(hashes)[0])
+        new = new[~self._lookup(new)]
+        merged = np.insert(np.asarray(self.digests), np.searchsorted(self.digests, new), new)
+        write_index(merged, path)
+        # Mảng cũ vẫn trỏ vào file đã bị thay: mở lại file mới
+        self.__init__(path)
+        return len(new)
+
+
+def build_index(sources, path):
+    """Dựng file index mới từ một hoặc nhiều file/thư mục hash."""
+    hashes = pd.concat([read_hashes(source) for source in sources], ignore_index=True)
+    index = HashIndex.from_hashes(hashes)
+    write_index(index.digests, path)
+    return HashIndex(path)
+
+
+def load_index(path):
+    """
+    Mở index cho clone_detector: file .idx được memory-map; với file hash (CSV/Parquet)
+    thì dùng file .idx cạnh nó nếu còn mới, nếu không thì dựng index trong bộ nhớ.
+    """
+    if path.endswith(INDEX_SUFFIX):
+        return HashIndex(path)
+    compiled = fresh_index_path(path) if os.path.isfile(path) else None
+    if compiled:
+        return HashIndex(compiled)
+    return HashIndex.from_hashes(read_hashes(path))
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Build and query the memory-mapped index of known malicious package hashes.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    build_parser = subparsers.add_parser("build", help="Create an index from hash files (CSV/Parquet with a 'hash' column).")
+    build_parser.add_argument("sources", nargs='+', help="Hash files or partition directories.")
+    build_parser.add_argument("-o", "--output", default=None, help="Index file (default: <first source>.idx).")
+
+    merge_parser = subparsers.add_parser("merge", help="Add the hashes of new files to an existing index.")
+    merge_parser.add_argument("index", help="Index file to update (created if missing).")
+    merge_parser.add_argument("sources", nargs='+', help="Hash files or partition directories.")
+
+    query_parser = subparsers.add_parser("query", help="Check hashes (or the 'hash' column of files) against an index.")
+    query_parser.add_argument("index", help="Index file.")
+    query_parser.add_argument("hashes", nargs='+', help="md5 hex digests or hash files.")
+
+    info_parser = subparsers.add_parser("info", help="Show the number of hashes in an index.")
+    info_parser.add_argument("index", help="Index file.")
+
+    args = parser.parse_args()
+
+    if args.command == "build":
+        output = args.output or index_path(args.sources[0])
+        index = build_index(args.sources, output)
+        print(f"Saved {len(index)} hashes to '{output}'")
+    elif args.command == "merge":
+        index = HashIndex(args.index) if os.path.exists(args.index) else HashIndex()
+        added = 0
+        for source in args.sources:
+            added += index.merge(read_hashes(source), args.index)
+        print(f"Added {added} new hashes to '{args.index}' ({len(index)} total)")
+    elif args.command == "query":
+        index = HashIndex(args.index)
+        for value in args.hashes:
+            if os.path.exists(value):
+                df = read_table(value, columns=['package_name', 'hash'])
+                matched = df[index.contains(df['hash'])]
+                print(f"{value}: {len(matched)}/{len(df)} known malicious")
+                if not matched.empty:
+                    print(matched.to_string(index=False))
+            else:
+                print(f"{value}: {'known malicious' if index.contains([value])[0] else 'not found'}")
+    else:
+        index = HashIndex(args.index)
+        print(f"'{args.index}': {len(index)} hashes, {os.path.getsize(args.index)} bytes")
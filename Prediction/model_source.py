@@ -0,0 +1,41 @@
+import os
+import hashlib
+
+
+DIGEST_CHUNK = 1024 * 1024  # Kích thước khối đọc khi tính digest của model
+
+_digests = {}  # (đường dẫn, kích thước, mtime_ns) -> digest, để không đọc lại model chưa đổi
+
+
+def source_digest(model_path):
+    """sha256 nội dung file model (được nhớ lại cho tới khi kích thước hoặc mtime thay đổi)."""
+    stat = os.stat(model_path)
+    key = (os.path.abspath(model_path), stat.st_size, stat.st_mtime_ns)
+    if key not in _digests:
+        m = hashlib.sha256()
+        with open(model_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(DIGEST_CHUNK), b''):
+                m.update(chunk)
+        _digests[key] = m.hexdigest()
+    return _digests[key]
+
+
+def source_info(model_path):
+    """Thông tin về model gốc được ghi vào header của bản biên dịch (.trees) / export (.npz)."""
+    return {
+        'source': os.path.basename(model_path),
+        'source_size': os.path.getsize(model_path),
+        'source_sha256': source_digest(model_path),
+    }
+
+
+def matches_source(header, model_path, artifact_path):
+    """
+    True nếu bản biên dịch/export (header của nó) được tạo từ đúng file model_path: cùng kích
+    thước và digest, nên model được chép lại với mtime cũ (cp -p, rsync, giải nén) vẫn bị phát hiện.
+    File tạo trước khi có các trường này chỉ được so bằng mtime như trước.
+    """
+    if 'source_sha256' not in header:
+        return os.path.getmtime(artifact_path) >= os.path.getmtime(model_path)
+    return (header.get('source_size') == os.path.getsize(model_path)
+            and header['source_sha256'] == source_digest(model_path))
@@ -0,0 +1,298 @@
+import os
+import sys
+import json
+import argparse
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Npm_Collector'))
+from storage import read_table
+
+
+INDEX_SUFFIX = '.lsh'
+MAGIC = b'NPMLSH01'
+FORMAT_VERSION = 1
+ALIGNMENT = 64
+NUM_PERM = 128  # Số hàm băm của chữ ký MinHash
+NUM_BANDS = 32  # 32 band x 4 hàng: cặp gói có Jaccard ~0.42 trở lên có 50% khả năng thành ứng viên
+SIMILARITY_THRESHOLD = 0.5  # Jaccard ước lượng tối thiểu để báo động
+TOP_MATCHES = 5  # Số gói độc hại giống nhất được báo cho mỗi gói mới
+SIGNATURE_CHUNK = 1 << 16  # Số tệp được băm cùng lúc khi tính chữ ký (giới hạn bộ nhớ)
+SEED = 20250703
+
+MIX_1 = np.uint64(0xBF58476D1CE4E5B9)
+MIX_2 = np.uint64(0x94D049BB133111EB)
+
+
+def _mix(values):
+    """Hàm trộn splitmix64 (phép nhân uint64 tự tràn)."""
+    values = values ^ (values >> np.uint64(30))
+    values = values * MIX_1
+    values = values ^ (values >> np.uint64(27))
+    values = values * MIX_2
+    return values ^ (values >> np.uint64(31))
+
+
+def _permutation_seeds(num_perm):
+    return np.random.default_rng(SEED).integers(0, 2 ** 63, size=num_perm, dtype=np.uint64)
+
+
+def parse_file_digests(values):
+    """
+    Cột file_digests (các digest hex 16 ký tự cách nhau bởi dấu cách) -> (mảng digest uint64
+    của mọi gói nối liền nhau, số digest của từng gói).
+    """
+    values = pd.Series(values, dtype=object).fillna('').astype(str).str.strip()
+    counts = (values.str.count(' ') + (values.str.len() > 0)).to_numpy(dtype=np.int64)
+    digests = np.frombuffer(bytes.fromhex(''.join(values).replace(' ', '')), dtype='>u8').astype(np.uint64)
+    if len(digests) != counts.sum():
+        raise ValueError("Malformed file_digests column")
+    return digests, counts
+
+
+def minhash_signatures(digests, counts, num_perm=NUM_PERM):
+    """
+    Chữ ký MinHash (n_packages, num_perm) của các tập digest. Gói không có tệp nào
+    nhận chữ ký toàn giá trị lớn nhất và không bao giờ được so khớp.
+    """
+    seeds = _permutation_seeds(num_perm)
+    signatures = np.full((len(counts), num_perm), np.iinfo(np.uint64).max, dtype=np.uint64)
+    starts = np.concatenate(([0], np.cumsum(counts)))
+    package = 0
+    while package < len(counts):
+        # Gom nhiều gói vào một khối khoảng SIGNATURE_CHUNK tệp (ít nhất một gói)
+        end = max(int(np.searchsorted(starts, starts[package] + SIGNATURE_CHUNK, side='right')) - 1, package + 1)
+        end = min(end, len(counts))
+        block_counts = counts[package:end]
+        non_empty = np.flatnonzero(block_counts)
+        if len(non_empty):
+            hashed = _mix(digests[starts[package]:starts[end], None] ^ seeds)
+            offsets = (starts[package:end] - starts[package])[non_empty]
+            signatures[package + non_empty] = np.minimum.reduceat(hashed, offsets, axis=0)
+        package = end
+    return signatures
+
+
+def band_keys(signatures, num_bands):
+    """Khoá băm của từng band, shape (num_bands, n_packages)."""
+    rows = signatures.shape[1] // num_bands
+    keys = np.zeros((num_bands, len(signatures)), dtype=np.uint64)
+    for row in range(rows):
+        keys = _mix(keys ^ signatures[:, row::rows][:, :num_bands].T)
+    return keys
+
+
+def has_files(signatures):
+    return signatures[:, 0] != np.iinfo(np.uint64).max
+
+
+def read_fingerprints(path):
+    """Đọc package_name và file_digests từ file hash (CSV/Parquet) hoặc thư mục partition."""
+    df = read_table(path, columns=['package_name', 'file_digests'])
+    if 'file_digests' not in df.columns:
+        raise ValueError(f"'{path}' has no file_digests column (re-run data_processing.py/create_hash.py)")
+    return df
+
+
+def near_clone_path(hashes_path):
+    """File index mặc định nằm cạnh file hash độc hại: malicious_hashes.csv -> malicious_hashes.lsh."""
+    return os.path.splitext(os.path.normpath(hashes_path))[0] + INDEX_SUFFIX
+
+
+def write_index(path, names, signatures, num_bands=NUM_BANDS):
+    """Ghi index LSH (header JSON + các mảng căn lề để đọc bằng mmap); ghi file tạm rồi đổi tên."""
+    if signatures.shape[1] % num_bands:
+        raise ValueError(f"{signatures.shape[1]} permutations cannot be split into {num_bands} bands")
+    keys = band_keys(signatures, num_bands)
+    # Mỗi band: khoá đã sắp xếp + chỉ số gói tương ứng, tra cứu bằng searchsorted
+    order = np.argsort(keys, axis=1, kind='stable').astype(np.int32)
+    encoded_names = [name.encode('utf-8') for name in names]
+    arrays = {
+        'signatures': np.ascontiguousarray(signatures, dtype=np.uint64),
+        'band_keys': np.take_along_axis(keys, order, axis=1),
+        'band_order': order,
+        'name_offsets': np.concatenate(([0], np.cumsum([len(name) for name in encoded_names]))).astype(np.int64),
+        'names': np.frombuffer(b''.join(encoded_names), dtype=np.uint8),
+    }
+
+    layout = {}
+    offset = 0
+    for name, array in arrays.items():
+        layout[name] = {'dtype': array.dtype.str, 'shape': list(array.shape), 'offset': offset}
+        offset += -(-array.nbytes // ALIGNMENT) * ALIGNMENT
+    header = {'format_version': FORMAT_VERSION, 'num_bands': num_bands, 'seed': SEED, 'arrays': layout}
+    encoded = json.dumps(header).encode('utf-8')
+    data_start = -(-(len(MAGIC) + 8 + len(encoded)) // ALIGNMENT) * ALIGNMENT
+
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(MAGIC)
+        f.write(len(encoded).to_bytes(8, 'little'))
+        f.write(encoded)
+        for name, array in arrays.items():
+            f.seek(data_start + layout[name]['offset'])
+            f.write(array.tobytes())
+        f.truncate(data_start + offset)
+    os.replace(tmp_path, path)
+
+
+class NearCloneIndex:
+    """
+    Index LSH trên chữ ký MinHash của các gói độc hại đã biết. Mỗi band giữ khoá đã sắp
+    xếp nên một gói mới chỉ được so với các gói trùng ít nhất một band (tra cứu O(log N)
+    mỗi band), rồi được xếp hạng theo Jaccard ước lượng từ chữ ký.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        mapped = np.memmap(path, dtype=np.uint8, mode='r')
+        if bytes(mapped[:len(MAGIC)]) != MAGIC:
+            raise ValueError(f"'{path}' is not a near-clone index")
+        header_size = int.from_bytes(bytes(mapped[len(MAGIC):len(MAGIC) + 8]), 'little')
+        header_end = len(MAGIC) + 8 + header_size
+        header = json.loads(bytes(mapped[len(MAGIC) + 8:header_end]))
+        if header.get('format_version') != FORMAT_VERSION or header.get('seed') != SEED:
+            raise ValueError(f"Unsupported format in '{path}'")
+        data_start = -(-header_end // ALIGNMENT) * ALIGNMENT
+
+        self.num_bands = header['num_bands']
+        for name, spec in header['arrays'].items():
+            dtype = np.dtype(spec['dtype'])
+            start = data_start + spec['offset']
+            count = int(np.prod(spec['shape'], dtype=np.int64))
+            array = mapped[start:start + count * dtype.itemsize].view(dtype).reshape(spec['shape'])
+            setattr(self, name, array.view(np.ndarray))
+        self.num_perm = self.signatures.shape[1]
+
+    def __len__(self):
+        return len(self.signatures)
+
+    def package_name(self, i):
+        return bytes(self.names[self.name_offsets[i]:self.name_offsets[i + 1]]).decode('utf-8')
+
+    def candidates(self, signatures):
+        """Các cặp (chỉ số gói mới, chỉ số gói trong index) trùng ít nhất một band."""
+        if not len(self):
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        keys = band_keys(signatures, self.num_bands)
+        queries, matches = [], []
+        for band in range(self.num_bands):
+            left = np.searchsorted(self.band_keys[band], keys[band], side='left')
+            counts = np.searchsorted(self.band_keys[band], keys[band], side='right') - left
+            total = int(counts.sum())
+            if not total:
+                continue
+            group_starts = np.repeat(np.cumsum(counts) - counts, counts)
+            positions = np.repeat(left, counts) + np.arange(total) - group_starts
+            queries.append(np.repeat(np.arange(len(signatures)), counts))
+            matches.append(self.band_order[band][positions])
+        if not queries:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        pairs = np.unique(np.concatenate(queries).astype(np.int64) * len(self) + np.concatenate(matches))
+        return pairs // len(self), pairs % len(self)
+
+    def query(self, signatures, threshold=SIMILARITY_THRESHOLD, top=TOP_MATCHES):
+        """
+        Xếp hạng các gói độc hại giống nhất cho từng chữ ký.
+        Trả về DataFrame (query, matched_package, similarity), similarity giảm dần trong mỗi query.
+        """
+        signatures = np.asarray(signatures, dtype=np.uint64)
+        if signatures.shape[1] != self.num_perm:
+            raise ValueError(f"Expected {self.num_perm} permutations, got {signatures.shape[1]}")
+        query_ids, match_ids = self.candidates(signatures)
+        valid = has_files(signatures)[query_ids]
+        query_ids, match_ids = query_ids[valid], match_ids[valid]
+        similarity = (signatures[query_ids] == self.signatures[match_ids]).mean(axis=1)
+        keep = similarity >= threshold
+        result = pd.DataFrame({'query': query_ids[keep], 'match': match_ids[keep], 'similarity': similarity[keep]})
+        result = result.sort_values(['query', 'similarity'], ascending=[True, False], kind='stable')
+        result = result.groupby('query', sort=False).head(top)
+        result['matched_package'] = [self.package_name(i) for i in result['match']]
+        return result[['query', 'matched_package', 'similarity']].reset_index(drop=True)
+
+    def merge(self, names, signatures, path=None):
+        """Thêm các gói mới (bỏ gói không có tệp) và ghi lại index; trả về số gói được thêm."""
+        path = path or self.path
+        keep = has_files(signatures)
+        all_names = [self.package_name(i) for i in range(len(self))] + [name for name, k in zip(names, keep) if k]
+        write_index(path, all_names, np.concatenate([self.signatures, signatures[keep]]), self.num_bands)
+        self.__init__(path)
+        return int(keep.sum())
+
+
+def fingerprint_signatures(df):
+    return minhash_signatures(*parse_file_digests(df['file_digests']))
+
+
+def build_index(sources, path):
+    """Dựng index từ một hoặc nhiều file hash có cột file_digests."""
+    df = pd.concat([read_fingerprints(source) for source in sources], ignore_index=True)
+    signatures = fingerprint_signatures(df)
+    keep = has_files(signatures)
+    write_index(path, df['package_name'][keep].astype(str).tolist(), signatures[keep])
+    return NearCloneIndex(path)
+
+
+def find_near_clones(index, new_hashes_df, threshold=SIMILARITY_THRESHOLD, top=TOP_MATCHES):
+    """Bảng các gói mới giống gói độc hại đã biết, xếp theo độ giống giảm dần."""
+    matches = index.query(fingerprint_signatures(new_hashes_df), threshold, top)
+    matches.insert(0, 'package_name', new_hashes_df['package_name'].to_numpy()[matches['query']])
+    matches = matches.drop(columns='query')
+    return matches.sort_values('similarity', ascending=False, kind='stable').reset_index(drop=True)
+
+
+def save_near_clones(matches, new_hashes_path):
+    base_name = os.path.basename(os.path.normpath(new_hashes_path))
+    name, _ = os.path.splitext(base_name)
+    output_csv_path = f"../Prediction_Result/{name}_near_clones_detected.csv"
+    matches.to_csv(output_csv_path, index=False)
+    return output_csv_path
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Find near-duplicate clones of known malicious packages with MinHash LSH over per-file digests.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    build_parser = subparsers.add_parser("build", help="Create an index from hash files with a file_digests column.")
+    build_parser.add_argument("sources", nargs='+', help="Malicious hash files or partition directories.")
+    build_parser.add_argument("-o", "--output", default=None, help="Index file (default: <first source>.lsh).")
+
+    merge_parser = subparsers.add_parser("merge", help="Add more malicious packages to an existing index.")
+    merge_parser.add_argument("index", help="Index file to update.")
+    merge_parser.add_argument("sources", nargs='+', help="Malicious hash files or partition directories.")
+
+    query_parser = subparsers.add_parser("query", help="Rank the known malicious packages most similar to each new package.")
+    query_parser.add_argument("index", help="Index file.")
+    query_parser.add_argument("new_hashes", help="New hash file or partition directory (with file_digests).")
+    query_parser.add_argument("--threshold", type=float, default=SIMILARITY_THRESHOLD, help="Minimum estimated Jaccard similarity.")
+    query_parser.add_argument("--top", type=int, default=TOP_MATCHES, help="Matches reported per new package.")
+
+    info_parser = subparsers.add_parser("info", help="Show the size of an index.")
+    info_parser.add_argument("index", help="Index file.")
+
+    args = parser.parse_args()
+
+    if args.command == "build":
+        output = args.output or near_clone_path(args.sources[0])
+        index = build_index(args.sources, output)
+        print(f"Saved {len(index)} packages to '{output}'")
+    elif args.command == "merge":
+        index = NearCloneIndex(args.index)
+        for source in args.sources:
+            df = read_fingerprints(source)
+            added = index.merge(df['package_name'].astype(str).tolist(), fingerprint_signatures(df))
+            print(f"Added {added} packages from '{source}' ({len(index)} total)")
+    elif args.command == "query":
+        index = NearCloneIndex(args.index)
+        matches = find_near_clones(index, read_fingerprints(args.new_hashes), args.threshold, args.top)
+        if matches.empty:
+            print("Not detect any near-clone packages.")
+        else:
+            print(f"ALERT: {matches['package_name'].nunique()} packages look like known malicious packages:")
+            print(matches.to_string(index=False))
+            print(f"\nSaved to file: '{save_near_clones(matches, args.new_hashes)}'")
+    else:
+        index = NearCloneIndex(args.index)
+        print(f"'{args.index}': {len(index)} packages, {index.num_perm} permutations, {index.num_bands} bands, "
+              f"{os.path.getsize(args.index)} bytes")
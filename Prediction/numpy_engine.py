@@ -0,0 +1,335 @@
+import os
+import sys
+import json
+import zipfile
+import argparse
+import numpy as np
+from model_source import matches_source, source_info
+
+try:
+    import h5py
+except ImportError:
+    h5py = None
+
+
+EXPORT_SUFFIX = '.npz'
+GRAPH_KEY = '__graph__'
+FORMAT_VERSION = 1
+
+# Các lớp không có tác dụng khi suy luận
+IDENTITY_LAYERS = {'Dropout', 'SpatialDropout1D', 'GaussianNoise', 'GaussianDropout', 'AlphaDropout', 'ActivityRegularization'}
+SUPPORTED_LAYERS = {
+    'InputLayer', 'Dense', 'BatchNormalization', 'Activation', 'Add', 'Concatenate', 'Conv1D',
+    'MaxPooling1D', 'AveragePooling1D', 'GlobalMaxPooling1D', 'GlobalAveragePooling1D', 'Flatten', 'Reshape',
+} | IDENTITY_LAYERS
+
+
+def _sigmoid(x):
+    # Tránh tràn số của exp với x âm lớn
+    out = np.empty_like(x)
+    positive = x >= 0
+    out[positive] = 1 / (1 + np.exp(-x[positive]))
+    exp_x = np.exp(x[~positive])
+    out[~positive] = exp_x / (1 + exp_x)
+    return out
+
+
+def _softmax(x):
+    exp_x = np.exp(x - x.max(axis=-1, keepdims=True))
+    return exp_x / exp_x.sum(axis=-1, keepdims=True)
+
+
+ACTIVATIONS = {
+    'linear': lambda x: x,
+    'relu': lambda x: np.maximum(x, 0),
+    'sigmoid': _sigmoid,
+    'tanh': np.tanh,
+    'softmax': _softmax,
+    'elu': lambda x: np.where(x > 0, x, np.expm1(np.minimum(x, 0))),
+    'swish': lambda x: x * _sigmoid(x),
+    'silu': lambda x: x * _sigmoid(x),
+}
+
+
+def _activation_name(config):
+    activation = config.get('activation', 'linear') or 'linear'
+    if isinstance(activation, dict):
+        activation = activation.get('config', {}).get('name') or activation.get('class_name')
+    return activation
+
+
+def _pad_1d(x, size, stride, dilation, padding, fill):
+    """Đệm trục thời gian (axis=1) theo kiểu 'valid' / 'same' / 'causal' của Keras."""
+    span = (size - 1) * dilation + 1
+    if padding == 'same':
+        length = x.shape[1]
+        total = max((-(-length // stride) - 1) * stride + span - length, 0)
+        left, right = total // 2, total - total // 2
+    elif padding == 'causal':
+        left, right = span - 1, 0
+    else:
+        return x
+    return np.pad(x, ((0, 0), (left, right), (0, 0)), constant_values=fill)
+
+
+def _windows_1d(x, size, stride, dilation):
+    """(n, length, channels) -> (n, out_length, channels, size)"""
+    span = (size - 1) * dilation + 1
+    windows = np.lib.stride_tricks.sliding_window_view(x, span, axis=1)
+    return windows[:, ::stride, :, ::dilation]
+
+
+def _first(value):
+    return value[0] if isinstance(value, (list, tuple)) else value
+
+
+def run_layer(layer, inputs, weights):
+    """Tính đầu ra của một lớp (chế độ suy luận) từ các đầu vào đã có."""
+    kind = layer['class_name']
+    config = layer['config']
+    x = inputs[0]
+
+    if kind in IDENTITY_LAYERS or kind == 'InputLayer':
+        return x
+    if kind == 'Dense':
+        out = x @ weights[0]
+        if config.get('use_bias', True):
+            out = out + weights[1]
+        return ACTIVATIONS[_activation_name(config)](out)
+    if kind == 'Activation':
+        return ACTIVATIONS[_activation_name(config)](x)
+    if kind == 'BatchNormalization':
+        i = 0
+        gamma = beta = None
+        if config.get('scale', True):
+            gamma, i = weights[i], i + 1
+        if config.get('center', True):
+            beta, i = weights[i], i + 1
+        mean, variance = weights[i], weights[i + 1]
+        axis = _first(config.get('axis', -1))
+        shape = [1] * x.ndim
+        shape[axis] = -1
+        inv = 1 / np.sqrt(variance + np.float32(config.get('epsilon', 1e-3)))
+        if gamma is not None:
+            inv = inv * gamma
+        out = (x - mean.reshape(shape)) * inv.reshape(shape)
+        return out + beta.reshape(shape) if beta is not None else out
+    if kind == 'Add':
+        out = inputs[0]
+        for other in inputs[1:]:
+            out = out + other
+        return out
+    if kind == 'Concatenate':
+        return np.concatenate(inputs, axis=config.get('axis', -1))
+    if kind == 'Conv1D':
+        size, stride = _first(config['kernel_size']), _first(config.get('strides', 1))
+        dilation = _first(config.get('dilation_rate', 1))
+        x = _pad_1d(x, size, stride, dilation, config.get('padding', 'valid'), 0)
+        out = np.einsum('nlck,kcf->nlf', _windows_1d(x, size, stride, dilation), weights[0])
+        if config.get('use_bias', True):
+            out = out + weights[1]
+        return ACTIVATIONS[_activation_name(config)](out)
+    if kind in ('MaxPooling1D', 'AveragePooling1D'):
+        size = _first(config.get('pool_size', 2))
+        stride = _first(config.get('strides') or size)
+        if kind == 'MaxPooling1D':
+            x = _pad_1d(x, size, stride, 1, config.get('padding', 'valid'), -np.inf)
+            return _windows_1d(x, size, stride, 1).max(axis=-1)
+        if config.get('padding', 'valid') == 'same':
+            # Keras không tính phần đệm vào trung bình
+            counts = _windows_1d(_pad_1d(np.ones_like(x[:1, :, :1]), size, stride, 1, 'same', 0), size, stride, 1).sum(axis=-1)
+            return _windows_1d(_pad_1d(x, size, stride, 1, 'same', 0), size, stride, 1).sum(axis=-1) / counts
+        return _windows_1d(x, size, stride, 1).mean(axis=-1)
+    if kind == 'GlobalMaxPooling1D':
+        return x.max(axis=1)
+    if kind == 'GlobalAveragePooling1D':
+        return x.mean(axis=1)
+    if kind == 'Flatten':
+        return x.reshape(len(x), -1)
+    if kind == 'Reshape':
+        return x.reshape((len(x),) + tuple(config['target_shape']))
+    raise ValueError(f"Unsupported layer type '{kind}'")
+
+
+class NumpyModel:
+    """
+    Chạy lại một model Keras đã export (file .npz) chỉ bằng NumPy. Có input_shape và
+    predict() giống model Keras nên predict.py dùng được như nhau.
+    """
+
+    def __init__(self, path):
+        with np.load(path, allow_pickle=False) as archive:
+            graph = json.loads(str(archive[GRAPH_KEY]))
+            arrays = {key: archive[key] for key in archive.files if key != GRAPH_KEY}
+        if graph.get('format_version') != FORMAT_VERSION:
+            raise ValueError(f"Unsupported export format in '{path}'")
+        self.path = path
+        self.layers = graph['layers']
+        self.inputs = graph['inputs']
+        self.outputs = graph['outputs']
+        self.input_shape = tuple(graph['input_shape'])
+        self.weights = {
+            layer['name']: [arrays[f"{layer['name']}/{i}"] for i in range(layer['num_weights'])]
+            for layer in self.layers
+        }
+
+    def predict(self, X, verbose=0, batch_size=None):
+        values = {self.inputs[0]: np.asarray(X, dtype=np.float32)}
+        for layer in self.layers:
+            if layer['name'] in values:
+                continue
+            values[layer['name']] = run_layer(layer, [values[name] for name in layer['inbound']], self.weights[layer['name']])
+        return values[self.outputs[0]]
+
+
+def _inbound_names(layer):
+    """Tên các lớp đầu vào của một lớp trong model Functional (định dạng Keras 3)."""
+    names = []
+    for node in layer.get('inbound_nodes', [])[:1]:
+        args = node['args'][0] if node.get('args') else []
+        for tensor in (args if isinstance(args, list) else [args]):
+            names.append(tensor['config']['keras_history'][0])
+    return names
+
+
+def _read_weights(weights_file):
+    """model.weights.h5 -> {tên lớp: [các mảng theo đúng thứ tự]}"""
+    weights = {}
+
+    def visit(name, obj):
+        if isinstance(obj, h5py.Group) and name.endswith('vars') and 'name' in obj.attrs:
+            keys = sorted(obj.keys(), key=int)
+            weights[obj.attrs['name']] = [np.asarray(obj[key], dtype=np.float32) for key in keys]
+
+    with h5py.File(weights_file, 'r') as f:
+        f['layers'].visititems(visit)
+    return weights
+
+
+def export_keras(keras_path, output_path=None):
+    """
+    Chuyển file .keras (Keras 3: config.json + model.weights.h5) thành file .npz gồm đồ thị các
+    lớp và trọng số. Không cần TensorFlow, chỉ cần h5py. Lỗi nếu model có lớp chưa hỗ trợ.
+    """
+    if h5py is None:
+        raise ImportError("Exporting .keras models needs h5py. Install it with: pip install h5py")
+    output_path = output_path or os.path.splitext(keras_path)[0] + EXPORT_SUFFIX
+
+    with zipfile.ZipFile(keras_path) as archive:
+        config = json.loads(archive.read('config.json'))
+        with archive.open('model.weights.h5') as weights_file:
+            weights = _read_weights(weights_file)
+
+    model_config = config['config']
+    layers = []
+    previous = None
+    for layer in model_config['layers']:
+        kind = layer['class_name']
+        if kind not in SUPPORTED_LAYERS:
+            raise ValueError(f"Unsupported layer type '{kind}' in '{keras_path}'")
+        activation = _activation_name(layer['config'])
+        if activation not in ACTIVATIONS:
+            raise ValueError(f"Unsupported activation '{activation}' in '{keras_path}'")
+        name = layer['config']['name']
+        if config['class_name'] == 'Sequential':
+            inbound = [previous] if previous else []
+        else:
+            inbound = _inbound_names(layer)
+        layers.append({
+            'name': name,
+            'class_name': kind,
+            'config': {key: value for key, value in layer['config'].items()
+                       if key in ('units', 'activation', 'use_bias', 'axis', 'epsilon', 'center', 'scale',
+                                  'kernel_size', 'strides', 'padding', 'dilation_rate', 'pool_size',
+                                  'target_shape', 'batch_shape')},
+            'inbound': inbound,
+            'num_weights': len(weights.get(name, [])),
+        })
+        previous = name
+
+    if config['class_name'] == 'Sequential':
+        if layers[0]['class_name'] != 'InputLayer':
+            batch_shape = model_config.get('build_input_shape') or layers[0]['config'].get('batch_shape')
+            layers.insert(0, {'name': '__input__', 'class_name': 'InputLayer', 'config': {'batch_shape': batch_shape},
+                              'inbound': [], 'num_weights': 0})
+            layers[1]['inbound'] = ['__input__']
+        inputs, outputs = [layers[0]['name']], [layers[-1]['name']]
+    else:
+        input_layers = model_config['input_layers']
+        output_layers = model_config['output_layers']
+        inputs = [item[0] for item in (input_layers if isinstance(input_layers[0], list) else [input_layers])]
+        outputs = [item[0] for item in (output_layers if isinstance(output_layers[0], list) else [output_layers])]
+    if len(inputs) != 1 or len(outputs) != 1:
+        raise ValueError(f"Only single-input, single-output models are supported ('{keras_path}')")
+
+    input_layer = next(layer for layer in layers if layer['name'] == inputs[0])
+    graph = {
+        'format_version': FORMAT_VERSION,
+        'layers': layers,
+        'inputs': inputs,
+        'outputs': outputs,
+        'input_shape': input_layer['config']['batch_shape'],
+    }
+    arrays = {f"{layer['name']}/{i}": array for layer in layers for i, array in enumerate(weights.get(layer['name'], []))}
+    graph.update(source_info(keras_path))
+    arrays[GRAPH_KEY] = np.array(json.dumps(graph))
+
+    tmp_path = output_path + '.tmp.npz'
+    np.savez_compressed(tmp_path, **arrays)
+    os.replace(tmp_path, output_path)
+    return output_path
+
+
+def exported_path(keras_path):
+    """File .npz export từ đúng file .keras này, hoặc None nếu chưa có hoặc đã cũ (model đã đổi)."""
+    path = os.path.splitext(keras_path)[0] + EXPORT_SUFFIX
+    if not os.path.exists(path):
+        return None
+    try:
+        with np.load(path, allow_pickle=False) as archive:
+            graph = json.loads(str(archive[GRAPH_KEY]))
+    except (OSError, ValueError, KeyError):
+        return None
+    return path if matches_source(graph, keras_path, path) else None
+
+
+def compare_with_keras(keras_path, export_path, X):
+    """Độ lệch lớn nhất giữa Keras và NumPy trên X (cần TensorFlow)."""
+    import tensorflow as tf
+    keras_model = tf.keras.models.load_model(keras_path)
+    numpy_model = NumpyModel(export_path)
+    if len(numpy_model.input_shape) == 3:
+        X = np.expand_dims(X, axis=2)
+    expected = keras_model.predict(X, verbose=0)
+    return float(np.max(np.abs(expected - numpy_model.predict(X))))
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Export .keras models to .npz archives that predict.py runs with NumPy only.")
+    parser.add_argument("models", nargs='+', help=".keras files (or a directory of them) to export next to the original.")
+    parser.add_argument("--check", action="store_true",
+                        help="Compare the exported model with Keras on random inputs (needs TensorFlow).")
+
+    args = parser.parse_args()
+
+    keras_paths = []
+    for path in args.models:
+        if os.path.isdir(path):
+            keras_paths.extend(os.path.join(path, name) for name in sorted(os.listdir(path)) if name.endswith('.keras'))
+        else:
+            keras_paths.append(path)
+
+    failed = 0
+    for keras_path in keras_paths:
+        try:
+            export_path = export_keras(keras_path)
+        except (ValueError, KeyError, OSError) as e:
+            print(f"Error in exporting '{keras_path}': {e}")
+            failed += 1
+            continue
+        print(f"Exported '{keras_path}' -> '{export_path}'")
+        if args.check:
+            X = np.random.default_rng(0).normal(size=(1000, NumpyModel(export_path).input_shape[1])).astype(np.float32)
+            print(f"  -> Max difference from Keras: {compare_with_keras(keras_path, export_path, X):.2e}")
+    sys.exit(1 if failed else 0)
@@ -1,11 +1,116 @@
-import pandas as pd
 import numpy as np
 import joblib
-import tensorflow as tf
 import sys
 import os
+import argparse
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 
-def predict_unified(model_path, scaler_path, input_csv_path):
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Npm_Collector'))
+import metrics
+from storage import STORAGE_BACKENDS, date_from_path, prediction_rows, read_table, write_predictions
+from numpy_engine import NumpyModel, exported_path
+from tree_engine import TreeEnsemble, compiled_path
+
+# Cột lúc huấn luyện -> tên cột tương ứng do Npm_Collector tạo ra
+FEATURE_ALIASES = {'num_files': 'num_js_files'}
+SCALER_FILE = 'scaler.joblib'
+MODEL_SUFFIXES = ('.joblib', '.keras')
+ENSEMBLE_METHODS = ('majority', 'mean', 'weighted')
+THRESHOLD = 0.5
+OUTPUT_DIR = '../Prediction_Result'
+STORAGE_BACKEND = 'csv'  # 'csv' (<date>.csv) hoặc 'parquet' (thư mục date=YYYY-MM-DD/)
+NUM_THREADS = os.cpu_count() or 1
+
+
+def list_model_paths(model_spec):
+    """'a.joblib,b.keras' -> danh sách file; một thư mục -> mọi model trong đó (trừ scaler)."""
+    if os.path.isdir(model_spec):
+        return [os.path.join(model_spec, file_name) for file_name in sorted(os.listdir(model_spec))
+                if file_name != SCALER_FILE and file_name.endswith(MODEL_SUFFIXES)]
+    return [path for path in model_spec.split(',') if path]
+
+
+def model_name_from_path(model_path):
+    return os.path.splitext(os.path.basename(model_path))[0]
+
+
+def fast_model_path(model_path):
+    """Bản export (.npz) hoặc bản biên dịch (.trees) còn mới của một model, nếu có."""
+    if model_path.endswith('.keras'):
+        return exported_path(model_path)
+    if model_path.endswith('.joblib'):
+        return compiled_path(model_path)
+    return None
+
+
+def load_model(model_path):
+    """Nạp model .keras hoặc .joblib. Trả về (model, is_keras_model)."""
+    if model_path.endswith('.keras'):
+        # Có bản export (numpy_engine.py) thì chạy bằng NumPy, không cần TensorFlow
+        export_path = exported_path(model_path)
+        if export_path:
+            return NumpyModel(export_path), True
+        # Chỉ import TensorFlow khi thật sự cần (mất vài giây)
+        import tensorflow as tf
+        return tf.keras.models.load_model(model_path), True
+    if model_path.endswith('.joblib'):
+        # Random forest/LightGBM đã biên dịch (tree_engine.py) được nạp bằng mmap, kết quả giống hệt
+        compiled = compiled_path(model_path)
+        if compiled:
+            return TreeEnsemble(compiled), False
+        return joblib.load(model_path), False
+    raise ValueError(f"Not support this model type '{os.path.splitext(model_path)[1]}'. Only support .keras và .joblib.")
+
+
+def prepare_features(df, scaler):
+    """Sắp xếp cột theo đúng thứ tự lúc huấn luyện rồi chuẩn hoá bằng scaler."""
+    features_df = df.drop(columns=['package_name'], errors='ignore')
+    try:
+        training_features = scaler.get_feature_names_out()
+        for name, alias in FEATURE_ALIASES.items():
+            if name not in features_df.columns and alias in features_df.columns:
+                features_df = features_df.rename(columns={alias: name})
+        features_df = features_df.reindex(columns=training_features, fill_value=0)
+    except AttributeError:
+        print("Warning: Unable to retrieve feature names from the scaler. Make sure dataset's columns match those used during training.")
+    return scaler.transform(features_df)
+
+
+def predict_scaled(model, is_keras_model, X_scaled):
+    """Dự đoán trên dữ liệu đã chuẩn hoá. Trả về (labels, probabilities); probabilities là None nếu model không hỗ trợ."""
+    if is_keras_model:
+        if len(model.input_shape) == 3:
+            X_scaled = np.expand_dims(X_scaled, axis=2)
+        probabilities = np.asarray(model.predict(X_scaled, verbose=0)).reshape(len(X_scaled), -1)[:, -1]
+        return (probabilities > 0.5).astype(int), probabilities
+
+    predictions = np.asarray(model.predict(X_scaled)).flatten()
+    try:
+        probabilities = model.predict_proba(X_scaled)[:, 1]
+    except (AttributeError, NotImplementedError):
+        probabilities = None
+    return predictions, probabilities
+
+
+def timed_predict(name, model, is_keras_model, X_scaled):
+    """predict_scaled, đo thời gian riêng cho từng model (bước predict/<tên model>)."""
+    with metrics.stage(f"predict/{name}"):
+        return predict_scaled(model, is_keras_model, X_scaled)
+
+
+def save_predictions(rows, input_path, output_dir=OUTPUT_DIR, storage_backend=STORAGE_BACKEND):
+    """
+    Ghi kết quả dự đoán (package_name, model, label, probability) vào dữ liệu theo ngày của
+    output_dir thay vì một bản sao đầu vào cho mỗi model. Ngày lấy từ cột date của đầu vào,
+    tên file/partition đầu vào, hoặc hôm nay.
+    """
+    date = date_from_path(input_path) or datetime.now().strftime('%Y-%m-%d')
+    for target in write_predictions(rows, output_dir, date, storage_backend):
+        print(f"Saved result to: '{target}'")
+
+
+def predict_unified(model_path, scaler_path, input_csv_path, output_dir=OUTPUT_DIR, storage_backend=STORAGE_BACKEND):
 
     print(f"Model: {model_path}")
     print(f"Input: {input_csv_path}")
@@ -16,80 +121,193 @@ def predict_unified(model_path, scaler_path, input_csv_path):
             return
 
     try:
-        scaler = joblib.load(scaler_path)
+        with metrics.stage('load_scaler'):
+            scaler = joblib.load(scaler_path)
         print(f"Successfully loading scaler from '{scaler_path}'")
     except Exception as e:
         print(f"Error in loading scaler: {e}")
         return
         
-    is_keras_model = False
     try:
         if model_path.endswith('.keras'):
             print("Loading model Deep Learning...")
-            model = tf.keras.models.load_model(model_path)
-            is_keras_model = True
         elif model_path.endswith('.joblib'):
             print("Loading model Machine Learning...")
-            model = joblib.load(model_path)
-        else:
-            print(f"Error: Not support this model type '{os.path.splitext(model_path)[1]}'. Only support .keras và .joblib.")
-            return
+        with metrics.stage('load_model'):
+            model, is_keras_model = load_model(model_path)
         print("Sunsuccessfully loading model")
+    except ValueError as e:
+        print(f"Error: {e}")
+        return
     except Exception as e:
         print(f"Error in loading model: {e}")
         return
 
 
-    df = pd.read_csv(input_csv_path)
+    # Đầu vào có thể là file CSV, file Parquet hoặc thư mục partition date=YYYY-MM-DD
+    with metrics.stage('read_input'):
+        df = read_table(input_csv_path)
     if df.empty:
         print("File input is empty.")
         return
     print(f"Loaded {len(df)} samples.")
     
-    original_df = df.copy()
-    features_df = df.drop(columns=['package_name'], errors='ignore')
-    
-    try:
-        training_features = scaler.get_feature_names_out()
-        features_df = features_df.reindex(columns=training_features, fill_value=0)
-    except AttributeError:
-        print("Warning: Unable to retrieve feature names from the scaler. Make sure dataset's columns match those used during training.")
-        pass
+    with metrics.stage('scale'):
+        X_scaled = prepare_features(df, scaler)
+
+    if is_keras_model and len(model.input_shape) == 3:
+        print("  -> Detecting model CNN, reshaping dataset...")
+    with metrics.stage('predict'):
+        predictions, probabilities = predict_scaled(model, is_keras_model, X_scaled)
+    metrics.count('packages_scored', len(X_scaled))
 
-    X_scaled = scaler.transform(features_df)
-    
-    if is_keras_model:
-        if len(model.input_shape) == 3:
-            print("  -> Detecting model CNN, reshaping dataset...")
-            X_scaled = np.expand_dims(X_scaled, axis=2)
-            
-        probabilities = model.predict(X_scaled)
-        predictions = (probabilities > 0.5).astype(int)
-    else: 
-        predictions = model.predict(X_scaled)
-        
     print("Finish prediction.")
 
+    model_name = model_name_from_path(model_path)
+    with metrics.stage('write_output'):
+        save_predictions([prediction_rows(df, model_name, predictions, probabilities)], input_csv_path, output_dir, storage_backend)
+    print(f"Malicious: {int(np.sum(predictions))}/{len(df)}")
 
-    original_df['label'] = predictions.flatten() 
-    
-    model_name = os.path.splitext(os.path.basename(model_path))[0]
-    input_base_name = os.path.splitext(os.path.basename(input_csv_path))[0]
-    output_csv_path = f"../Prediction_Result/{input_base_name}_predictions_{model_name}.csv"
-    
-    original_df.to_csv(output_csv_path, index=False)
-    print(f"Saved result to file: '{output_csv_path}'")
+
+def parse_weights(text):
+    """'random_forest_model=2,svm_model=0.5' -> {'random_forest_model': 2.0, 'svm_model': 0.5}"""
+    weights = {}
+    for item in filter(None, (text or '').split(',')):
+        name, _, value = item.partition('=')
+        weights[model_name_from_path(name.strip())] = float(value)
+    return weights
+
+
+def ensemble_decision(method, labels, probabilities, weights=None, threshold=THRESHOLD):
+    """
+    Kết hợp kết quả của nhiều model (dict tên model -> mảng).
+    - majority: số phiếu độc hại >= một nửa số model (hoà thì coi là độc hại).
+    - mean: trung bình xác suất > threshold (model không có xác suất dùng nhãn 0/1).
+    - weighted: như mean nhưng mỗi model có trọng số (mặc định 1).
+    """
+    names = list(labels)
+    if method == 'majority':
+        votes = np.sum([labels[name] for name in names], axis=0)
+        return (votes * 2 >= len(names)).astype(int)
+
+    scores = np.array([probabilities[name] if probabilities[name] is not None else labels[name]
+                       for name in names], dtype=np.float64)
+    if method == 'weighted':
+        weights = weights or {}
+        model_weights = np.array([weights.get(name, 1.0) for name in names], dtype=np.float64)
+    else:
+        model_weights = np.ones(len(names))
+    return (np.average(scores, axis=0, weights=model_weights) > threshold).astype(int)
+
+
+def predict_models(model_paths, scaler_path, input_path, methods=ENSEMBLE_METHODS, weights=None,
+                   threshold=THRESHOLD, num_threads=NUM_THREADS, output_dir=OUTPUT_DIR, storage_backend=STORAGE_BACKEND):
+    """
+    Chạy nhiều model trên cùng một lần đọc và chuẩn hoá dữ liệu, ghi kết quả của từng model
+    và các quyết định ensemble_<method> (mỗi gói một dòng cho mỗi model/quyết định).
+    """
+    print(f"Models: {len(model_paths)}")
+    print(f"Input: {input_path}")
+
+    for f_path in [scaler_path, input_path]:
+        if not os.path.exists(f_path):
+            print(f"Error: Not found file '{f_path}'")
+            return
+
+    with metrics.stage('load_scaler'):
+        scaler = joblib.load(scaler_path)
+    models = {}
+    for model_path in model_paths:
+        name = model_name_from_path(model_path)
+        try:
+            with metrics.stage(f"load_model/{name}"):
+                models[name] = load_model(model_path)
+        except Exception as e:
+            print(f"Error in loading model '{model_path}': {e}")
+    if not models:
+        print("Error: No model could be loaded.")
+        return
+    print(f"Loaded models: {', '.join(models)}")
+
+    with metrics.stage('read_input'):
+        df = read_table(input_path)
+    if df.empty:
+        print("File input is empty.")
+        return
+    print(f"Loaded {len(df)} samples.")
+
+    # Đọc và chuẩn hoá một lần, mọi model dùng chung ma trận này
+    with metrics.stage('scale'):
+        X_scaled = prepare_features(df, scaler)
+    metrics.count('packages_scored', len(X_scaled))
+
+    # Phần lớn thời gian nằm trong sklearn/LightGBM/TensorFlow (nhả GIL) nên chạy các model song song bằng thread
+    with ThreadPoolExecutor(max_workers=max(1, min(num_threads, len(models)))) as executor:
+        futures = {name: executor.submit(timed_predict, name, model, is_keras_model, X_scaled)
+                   for name, (model, is_keras_model) in models.items()}
+        results = {name: future.result() for name, future in futures.items()}
+    print("Finish prediction.")
+
+    labels = {name: np.asarray(result[0]).astype(int) for name, result in results.items()}
+    probabilities = {name: result[1] for name, result in results.items()}
+
+    rows = [prediction_rows(df, name, labels[name], probabilities[name]) for name in models]
+    decisions = {method: ensemble_decision(method, labels, probabilities, weights, threshold) for method in methods}
+    rows.extend(prediction_rows(df, f"ensemble_{method}", decision) for method, decision in decisions.items())
+    with metrics.stage('write_output'):
+        save_predictions(rows, input_path, output_dir, storage_backend)
+    print(f"Malicious by ensemble ({methods[0]}): {int(decisions[methods[0]].sum())}/{len(df)}")
 
 
 if __name__ == "__main__":
-    if len(sys.argv) != 4:
-        print("\nUsage: python3 predict.py <path_to_model> <path_to_scaler.joblib> <path_to_input_features.csv>")
-        print("Example (ML): python3 predict.py random_forest_model.joblib scaler.joblib ../features_extract/2025-07-03.csv")
-        print("Example (DL): python3 predict.py cnn_model.keras scaler.joblib ../features_extract/2025-07-03.csv")
-        sys.exit(1)
-        
-    model_file = sys.argv[1]
-    scaler_file = sys.argv[2]
-    input_file = sys.argv[3]
-    
-    predict_unified(model_file, scaler_file, input_file)
+
+    parser = argparse.ArgumentParser(
+        description="Predict malicious packages with one model, or with several models and ensemble voting.",
+        epilog="Example (ML): python3 predict.py random_forest_model.joblib scaler.joblib ../features_extract/2025-07-03.csv\n"
+               "Example (DL): python3 predict.py cnn_model.keras scaler.joblib ../features_extract/2025-07-03.csv\n"
+               "Example (all models): python3 predict.py ../Trained_Model scaler.joblib ../features_extract/2025-07-03.csv",
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("model", help="A .keras/.joblib model, a comma-separated list of models, or a directory of models.")
+    parser.add_argument("scaler", help="Path to scaler.joblib.")
+    parser.add_argument("input", help="Features as a .csv/.parquet file or a date=YYYY-MM-DD partition directory.")
+    parser.add_argument("--ensemble", nargs='+', choices=ENSEMBLE_METHODS, default=list(ENSEMBLE_METHODS),
+                        help="Ensemble decisions to compute with several models (the first one is printed).")
+    parser.add_argument("--weights", default=None,
+                        help="Model weights for the weighted ensemble, e.g. random_forest_model=2,svm_model=0.5 (default 1).")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD,
+                        help="Probability threshold for the mean and weighted ensembles.")
+    parser.add_argument("--threads", type=int, default=NUM_THREADS,
+                        help="Number of models run at the same time.")
+    parser.add_argument("--output_dir", default=OUTPUT_DIR,
+                        help="Where predictions are appended: one row per package and model (package_name, model, label, probability) in the file/partition of the input's date.")
+    parser.add_argument("--storage", choices=STORAGE_BACKENDS, default=STORAGE_BACKEND,
+                        help="Output format: one CSV per day, or date-partitioned Parquet directories.")
+    parser.add_argument("--measure", action="store_true",
+                        help="Print the time spent loading, reading, scaling, predicting (per model) and writing.")
+    parser.add_argument("--metrics", default=None,
+                        help="Also write the timings: Prometheus text if the file ends with .prom, otherwise appended JSON lines (implies --measure).")
+    parser.add_argument("--profile", default=None,
+                        help="Run a sampling profiler and write collapsed stacks (flamegraph.pl/speedscope) to this file (implies --measure).")
+
+    args = parser.parse_args()
+
+    if args.measure or args.metrics or args.profile:
+        metrics.enable()
+    if args.profile:
+        metrics.start_profiler()
+
+    model_paths = list_model_paths(args.model)
+    if len(model_paths) == 1 and not os.path.isdir(args.model):
+        predict_unified(model_paths[0], args.scaler, args.input, args.output_dir, args.storage)
+    else:
+        predict_models(model_paths, args.scaler, args.input, args.ensemble, parse_weights(args.weights),
+                       args.threshold, args.threads, args.output_dir, args.storage)
+
+    if metrics.enabled():
+        metrics.print_report()
+        if args.metrics:
+            metrics.write_metrics(args.metrics)
+            print(f"Metrics saved to '{args.metrics}'")
+        if args.profile:
+            metrics.stop_profiler()
+            print(f"{metrics.write_profile(args.profile)} profiler samples saved to '{args.profile}'")
@@ -0,0 +1,394 @@
+import os
+import sys
+import json
+import time
+import queue
+import signal
+import argparse
+import threading
+import tarfile
+import socketserver
+import numpy as np
+import pandas as pd
+import joblib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from predict import SCALER_FILE, MODEL_SUFFIXES, fast_model_path, load_model, prepare_features, predict_scaled
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Npm_Collector'))
+from extractor import package_name_from_path, process_package
+
+
+MODEL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Trained_Model')
+DEFAULT_MODEL = 'random_forest_model'
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+MAX_BATCH_SIZE = 512  # Số dòng tối đa trong một lô gửi vào model
+MAX_LATENCY = 0.01  # Giây chờ tối đa để gom thêm yêu cầu trước khi chạy một lô
+RELOAD_INTERVAL = 10  # Giây giữa hai lần kiểm tra file model thay đổi
+REQUEST_TIMEOUT = 60
+LISTEN_BACKLOG = 128  # Nhiều client gửi cùng lúc thì mới có lô để gom
+PACKAGE_ROOT = "/home/kali/Documents/npm/dataset"  # Chỉ trích xuất đặc tính của các gói nằm trong thư mục này
+
+
+class PendingRequest:
+    def __init__(self, X_scaled):
+        self.X_scaled = X_scaled
+        self.labels = None
+        self.probabilities = None
+        self.error = None
+        self.done = threading.Event()
+
+
+class BatcherStopped(Exception):
+    """Batcher đã dừng (model vừa được nạp lại hoặc bị xoá): yêu cầu phải gửi sang batcher mới."""
+
+
+class MicroBatcher:
+    """
+    Gom các yêu cầu đến gần nhau thành một lô để model chỉ chạy một lần.
+    Một lô được chạy khi đủ max_batch_size dòng hoặc khi yêu cầu đầu tiên đã chờ max_latency giây.
+    Chỉ thread của batcher gọi model nên model không cần an toàn đa luồng.
+    """
+
+    def __init__(self, model, is_keras_model, max_batch_size=MAX_BATCH_SIZE, max_latency=MAX_LATENCY):
+        self.model = model
+        self.is_keras_model = is_keras_model
+        self.max_batch_size = max_batch_size
+        self.max_latency = max_latency
+        self.queue = queue.Queue()
+        self.stopped = False
+        self.lock = threading.Lock()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def submit(self, X_scaled):
+        request = PendingRequest(X_scaled)
+        # Xếp hàng cùng khoá với stop(): yêu cầu không bao giờ nằm sau None mà không được xử lý
+        with self.lock:
+            if self.stopped:
+                raise BatcherStopped()
+            self.queue.put(request)
+        if not request.done.wait(REQUEST_TIMEOUT):
+            raise TimeoutError("Prediction timed out")
+        if request.error is not None:
+            raise request.error
+        return request.labels, request.probabilities
+
+    def stop(self):
+        # Các yêu cầu đã xếp hàng trước None vẫn được xử lý hết, yêu cầu đến sau bị từ chối ngay
+        with self.lock:
+            self.stopped = True
+            self.queue.put(None)
+
+    def _collect(self, first):
+        batch = [first]
+        rows = len(first.X_scaled)
+        deadline = time.monotonic() + self.max_latency
+        while rows < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                request = self.queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if request is None:
+                self.queue.put(None)
+                break
+            batch.append(request)
+            rows += len(request.X_scaled)
+        return batch
+
+    def _run(self):
+        while True:
+            first = self.queue.get()
+            if first is None:
+                return
+            batch = self._collect(first)
+            try:
+                labels, probabilities = predict_scaled(self.model, self.is_keras_model,
+                                                       np.concatenate([request.X_scaled for request in batch]))
+                start = 0
+                for request in batch:
+                    end = start + len(request.X_scaled)
+                    request.labels = labels[start:end]
+                    request.probabilities = probabilities[start:end] if probabilities is not None else None
+                    start = end
+            except Exception as e:
+                for request in batch:
+                    request.error = e
+            for request in batch:
+                request.done.set()
+
+
+class ModelRegistry:
+    """
+    Giữ scaler và các model trong model_dir trong bộ nhớ. reload() nạp lại những file có
+    thời điểm sửa đổi mới; model mới được nạp xong mới thay thế model cũ, nên các yêu cầu
+    đang chạy không bị gián đoạn. Nếu file mới bị lỗi, model cũ vẫn được giữ lại.
+    """
+
+    def __init__(self, model_dir=MODEL_DIR, max_batch_size=MAX_BATCH_SIZE, max_latency=MAX_LATENCY):
+        self.model_dir = model_dir
+        self.max_batch_size = max_batch_size
+        self.max_latency = max_latency
+        self.scaler = None
+        self.scaler_mtime = None
+        self.slots = {}  # tên model -> (mtime, batcher)
+        self.lock = threading.Lock()
+        self.reload_lock = threading.Lock()
+
+    def reload(self):
+        with self.reload_lock:
+            changed = []
+            scaler_path = os.path.join(self.model_dir, SCALER_FILE)
+            mtime = os.path.getmtime(scaler_path)
+            if mtime != self.scaler_mtime:
+                try:
+                    self.scaler = joblib.load(scaler_path)
+                    self.scaler_mtime = mtime
+                    changed.append(SCALER_FILE)
+                except Exception as e:
+                    print(f"Error in loading scaler: {e}")
+
+            found = {}
+            for file_name in sorted(os.listdir(self.model_dir)):
+                if file_name == SCALER_FILE or not file_name.endswith(MODEL_SUFFIXES):
+                    continue
+                found[os.path.splitext(file_name)[0]] = os.path.join(self.model_dir, file_name)
+
+            for model_name, model_path in found.items():
+                mtime = os.path.getmtime(model_path)
+                fast_path = fast_model_path(model_path)
+                if fast_path:
+                    # Export/biên dịch lại cũng là một lần thay model
+                    mtime = max(mtime, os.path.getmtime(fast_path))
+                old = self.slots.get(model_name)
+                if old is not None and old[0] == mtime:
+                    continue
+                try:
+                    model, is_keras_model = load_model(model_path)
+                except Exception as e:
+                    print(f"Error in loading model '{model_path}': {e}")
+                    continue
+                batcher = MicroBatcher(model, is_keras_model, self.max_batch_size, self.max_latency)
+                with self.lock:
+                    self.slots[model_name] = (mtime, batcher)
+                if old is not None:
+                    old[1].stop()
+                changed.append(model_name)
+
+            for model_name in set(self.slots) - set(found):
+                with self.lock:
+                    _, batcher = self.slots.pop(model_name)
+                batcher.stop()
+                changed.append(model_name)
+
+            if changed:
+                print(f"Loaded: {', '.join(changed)} ({len(self.slots)} models ready)")
+            return changed
+
+    def model_names(self):
+        with self.lock:
+            return sorted(self.slots)
+
+    def predict(self, model_name, df):
+        while True:
+            with self.lock:
+                slot = self.slots.get(model_name)
+                scaler = self.scaler
+            if slot is None:
+                raise KeyError(model_name)
+            X_scaled = np.asarray(prepare_features(df, scaler), dtype=np.float64)
+            try:
+                return slot[1].submit(X_scaled)
+            except BatcherStopped:
+                # reload() vừa thay model: gửi lại cho batcher mới (hoặc KeyError nếu model bị xoá)
+                continue
+
+
+def features_from_packages(paths, package_root):
+    """
+    Trích xuất đặc tính của các gói (thư mục hoặc tarball) ngay trong service. Chỉ nhận
+    đường dẫn nằm trong package_root (client không được đọc file bất kỳ của máy chủ).
+    ValueError nếu đường dẫn không hợp lệ hoặc không đọc được.
+    """
+    if not package_root:
+        raise ValueError("Scoring packages by path is disabled (start the service with --package_root)")
+    if not isinstance(paths, list) or not all(isinstance(path, str) for path in paths):
+        raise ValueError("'packages' must be a list of paths")
+    root = os.path.realpath(package_root)
+    rows = []
+    for path in paths:
+        real_path = os.path.realpath(path)
+        if os.path.commonpath([root, real_path]) != root:
+            raise ValueError(f"'{path}' is outside the package root")
+        try:
+            features = process_package(real_path)
+        except (OSError, tarfile.TarError, UnicodeDecodeError) as e:
+            raise ValueError(f"Cannot read package '{path}': {e}")
+        if features:
+            features['package_name'] = package_name_from_path(path)
+            rows.append(features)
+    return rows
+
+
+def rows_from_request(request, package_root):
+    """Các dòng đặc tính của một yêu cầu /predict. ValueError nếu yêu cầu không hợp lệ."""
+    if not isinstance(request, dict):
+        raise ValueError("The body must be a JSON object")
+    rows = request.get('rows')
+    if rows is None and 'packages' in request:
+        rows = features_from_packages(request['packages'], package_root)
+    if not isinstance(rows, list) or not rows:
+        raise ValueError("Provide a non-empty 'rows' or 'packages' list")
+    if not all(isinstance(row, dict) for row in rows):
+        raise ValueError("Each row must be an object of feature values")
+    return rows
+
+
+class PredictionHandler(BaseHTTPRequestHandler):
+    """
+    GET  /models   -> danh sách model đã nạp
+    POST /predict  -> {"model": "...", "rows": [{...}, ...]} hoặc {"model": "...", "packages": ["/path", ...]}
+    POST /reload   -> nạp lại các file model đã thay đổi
+    """
+    registry = None
+    package_root = PACKAGE_ROOT
+
+    def address_string(self):
+        # Unix socket không có địa chỉ client
+        return self.client_address[0] if self.client_address else 'unix'
+
+    def send_json(self, status, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == '/models':
+            self.send_json(200, {'models': self.registry.model_names()})
+        else:
+            self.send_json(404, {'error': 'Not found'})
+
+    def do_POST(self):
+        if self.path == '/reload':
+            self.send_json(200, {'reloaded': self.registry.reload()})
+            return
+        if self.path != '/predict':
+            self.send_json(404, {'error': 'Not found'})
+            return
+
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            request = json.loads(self.rfile.read(length) or b'{}')
+        except (ValueError, json.JSONDecodeError):
+            self.send_json(400, {'error': 'Invalid JSON body'})
+            return
+
+        try:
+            rows = rows_from_request(request, self.package_root)
+            df = pd.DataFrame(rows)
+        except (ValueError, TypeError) as e:
+            self.send_json(400, {'error': str(e)})
+            return
+
+        model_name = request.get('model', DEFAULT_MODEL)
+        try:
+            labels, probabilities = self.registry.predict(model_name, df)
+        except KeyError:
+            self.send_json(404, {'error': f"Model '{model_name}' is not loaded", 'models': self.registry.model_names()})
+            return
+        except Exception as e:
+            self.send_json(500, {'error': str(e)})
+            return
+
+        names = df['package_name'].tolist() if 'package_name' in df.columns else [None] * len(df)
+        results = []
+        for i, name in enumerate(names):
+            results.append({
+                'package_name': name,
+                'label': int(labels[i]),
+                'probability': float(probabilities[i]) if probabilities is not None else None,
+            })
+        self.send_json(200, {'model': model_name, 'results': results})
+
+    def log_message(self, format, *args):
+        pass
+
+
+class PredictionHTTPServer(ThreadingHTTPServer):
+    request_queue_size = LISTEN_BACKLOG
+
+
+class ThreadingUnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+    request_queue_size = LISTEN_BACKLOG
+
+
+def watch_models(registry, interval):
+    while True:
+        time.sleep(interval)
+        try:
+            registry.reload()
+        except OSError as e:
+            print(f"Error in checking models: {e}")
+
+
+def main(model_dir, host, port, socket_path, max_batch_size, max_latency, reload_interval, package_root=PACKAGE_ROOT):
+    registry = ModelRegistry(model_dir, max_batch_size, max_latency)
+    registry.reload()
+    PredictionHandler.registry = registry
+    PredictionHandler.package_root = package_root
+
+    if reload_interval > 0:
+        threading.Thread(target=watch_models, args=(registry, reload_interval), daemon=True).start()
+    # kill -HUP <pid> để nạp lại model ngay lập tức
+    signal.signal(signal.SIGHUP, lambda signum, frame: threading.Thread(target=registry.reload, daemon=True).start())
+    # Dừng bằng systemd/kill: thoát bình thường để còn dọn Unix socket
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+    if socket_path:
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        server = ThreadingUnixHTTPServer(socket_path, PredictionHandler)
+        print(f"--- Prediction service listening on unix:{socket_path} ---")
+    else:
+        server = PredictionHTTPServer((host, port), PredictionHandler)
+        print(f"--- Prediction service listening on http://{host}:{port} ---")
+    print(f"--- Models: {', '.join(registry.model_names()) or 'none'} ---")
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if socket_path and os.path.exists(socket_path):
+            os.remove(socket_path)
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Serve predictions from the trained models without reloading them for every request.")
+    parser.add_argument("--model_dir", default=MODEL_DIR, help="Directory containing scaler.joblib and the .joblib/.keras models.")
+    parser.add_argument("--host", default=DEFAULT_HOST, help="Address to listen on.")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="TCP port to listen on.")
+    parser.add_argument("--socket", default=None, help="Listen on this Unix socket instead of TCP.")
+    parser.add_argument("--max_batch_size", type=int, default=MAX_BATCH_SIZE,
+                        help="Maximum number of rows scored in one model call.")
+    parser.add_argument("--max_latency_ms", type=float, default=MAX_LATENCY * 1000,
+                        help="How long the first request of a batch waits for more requests.")
+    parser.add_argument("--reload_interval", type=float, default=RELOAD_INTERVAL,
+                        help="Seconds between checks for changed model files (0 = only on SIGHUP or POST /reload).")
+    parser.add_argument("--package_root", default=PACKAGE_ROOT,
+                        help="Only package paths under this directory are accepted in 'packages' ('' = disable 'packages').")
+
+    args = parser.parse_args()
+
+    main(args.model_dir, args.host, args.port, args.socket, args.max_batch_size, args.max_latency_ms / 1000, args.reload_interval,
+         args.package_root)
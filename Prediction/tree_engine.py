@@ -0,0 +1,446 @@
+import os
+import sys
+import json
+import math
+import argparse
+import numpy as np
+import joblib
+from model_source import matches_source, source_info
+
+
+COMPILED_SUFFIX = '.trees'
+MAGIC = b'NPMTREE1'
+FORMAT_VERSION = 1
+ALIGNMENT = 64
+ROW_CHUNK = 256  # Số dòng được tính cùng lúc (bảng bitmask của cả lô vừa trong cache)
+ALL_ONES = np.uint64(0xFFFFFFFFFFFFFFFF)
+
+# Cách xử lý giá trị thiếu tại mỗi nút (giống LightGBM; cây sklearn dùng MISSING_NAN)
+MISSING_NONE = 0
+MISSING_ZERO = 1
+MISSING_NAN = 2
+ZERO_THRESHOLD = float(np.float32(1e-35))  # kZeroThreshold của LightGBM
+
+
+class FlatTrees:
+    """Gom các nút của nhiều cây vào các mảng phẳng; nút lá trỏ về chính nó."""
+
+    def __init__(self, n_values):
+        self.n_values = n_values
+        self.feature = []
+        self.threshold = []
+        self.left = []
+        self.right = []
+        self.missing_type = []
+        self.default_left = []
+        self.value = []
+        self.roots = []
+
+    def add_node(self, feature=-1, threshold=0.0, missing_type=MISSING_NAN, default_left=False, value=None):
+        index = len(self.feature)
+        self.feature.append(feature)
+        self.threshold.append(threshold)
+        self.left.append(index)
+        self.right.append(index)
+        self.missing_type.append(missing_type)
+        self.default_left.append(int(default_left))
+        self.value.append(value if value is not None else [0.0] * self.n_values)
+        return index
+
+    def arrays(self):
+        return {
+            'feature': np.asarray(self.feature, dtype=np.int32),
+            'threshold': np.asarray(self.threshold, dtype=np.float64),
+            'left': np.asarray(self.left, dtype=np.int32),
+            'right': np.asarray(self.right, dtype=np.int32),
+            'missing_type': np.asarray(self.missing_type, dtype=np.uint8),
+            'default_left': np.asarray(self.default_left, dtype=np.bool_),
+            'value': np.asarray(self.value, dtype=np.float64).reshape(len(self.value), self.n_values),
+            'roots': np.asarray(self.roots, dtype=np.int32),
+        }
+
+
+def _flatten_forest(model):
+    """RandomForestClassifier / ExtraTreesClassifier -> (header, arrays)"""
+    if getattr(model, 'n_outputs_', 1) != 1:
+        raise ValueError("Only single-output forests are supported")
+    flat = FlatTrees(len(model.classes_))
+    max_depth = 0
+    for estimator in model.estimators_:
+        tree = estimator.tree_
+        offset = len(flat.feature)
+        missing_left = getattr(tree, 'missing_go_to_left', np.zeros(tree.node_count, dtype=np.uint8))
+        values = tree.value[:, 0, :len(model.classes_)]
+        for node in range(tree.node_count):
+            is_leaf = tree.children_left[node] == -1
+            flat.add_node(-1 if is_leaf else int(tree.feature[node]), float(tree.threshold[node]),
+                          MISSING_NAN, bool(missing_left[node]), values[node].tolist())
+            if not is_leaf:
+                flat.left[-1] = offset + int(tree.children_left[node])
+                flat.right[-1] = offset + int(tree.children_right[node])
+        flat.roots.append(offset)
+        max_depth = max(max_depth, tree.max_depth)
+    header = {
+        'kind': 'forest',
+        'classes': model.classes_.tolist(),
+        'n_features': int(model.n_features_in_),
+        'max_depth': int(max_depth),
+    }
+    return header, flat.arrays()
+
+
+def _flatten_lightgbm(model):
+    """LGBMClassifier (binary) -> (header, arrays)"""
+    booster = model.booster_
+    dump = booster.dump_model()
+    objective = dump['objective'].split()
+    if objective[0] != 'binary' or dump['num_class'] != 1:
+        raise ValueError(f"Only binary LightGBM models are supported (objective '{dump['objective']}')")
+    sigmoid = 1.0
+    for option in objective[1:]:
+        if option.startswith('sigmoid:'):
+            sigmoid = float(option.split(':', 1)[1])
+
+    tree_info = dump['tree_info']
+    best_iteration = getattr(model, 'best_iteration_', 0) or 0
+    if best_iteration > 0:
+        # predict_proba của LightGBM chỉ dùng tới best_iteration khi có early stopping
+        tree_info = tree_info[:best_iteration * dump['num_tree_per_iteration']]
+
+    flat = FlatTrees(1)
+    max_depth = 0
+    missing_types = {'None': MISSING_NONE, 'Zero': MISSING_ZERO, 'NaN': MISSING_NAN}
+    for info in tree_info:
+        root = info['tree_structure']
+        stack = [(root, None, False, 0)]
+        while stack:
+            node, parent, is_left, depth = stack.pop()
+            max_depth = max(max_depth, depth)
+            if 'leaf_value' in node:
+                index = flat.add_node(value=[float(node['leaf_value'])])
+            else:
+                if node['decision_type'] != '<=':
+                    raise ValueError("Categorical splits are not supported")
+                index = flat.add_node(int(node['split_feature']), float(node['threshold']),
+                                      missing_types[node['missing_type']], node['default_left'])
+                stack.append((node['right_child'], index, False, depth + 1))
+                stack.append((node['left_child'], index, True, depth + 1))
+            if parent is None:
+                flat.roots.append(index)
+            elif is_left:
+                flat.left[parent] = index
+            else:
+                flat.right[parent] = index
+    header = {
+        'kind': 'lightgbm',
+        'classes': model.classes_.tolist(),
+        'n_features': int(dump['max_feature_idx']) + 1,
+        'max_depth': int(max_depth),
+        'sigmoid': sigmoid,
+        'average_output': bool(dump.get('average_output', False)),
+    }
+    return header, flat.arrays()
+
+
+def _leaf_bitmasks(arrays, n_features):
+    """
+    Bảng bitmask kiểu QuickScorer. Lá của mỗi cây được đánh số từ trái sang phải, mỗi cây
+    dùng một số word 64 bit. Với mỗi đặc tính f, các ngưỡng được sắp xếp tăng dần; hàng r của
+    bảng là AND các mask của mọi nút trên f có ngưỡng nằm trong r ngưỡng nhỏ nhất (các nút mà
+    x > ngưỡng, tức đi sang phải: mask xoá các lá ở cây con trái). Lá ra của một cây là bit 1
+    thấp nhất sau khi AND bảng của mọi đặc tính.
+    """
+    feature, left, right = arrays['feature'], arrays['left'], arrays['right']
+
+    # Đánh số lá theo thứ tự từ trái sang phải và ghi lại khoảng lá của cây con trái mỗi nút
+    leaf_slot = {}
+    left_range = {}
+    tree_words = [0]
+    for root in arrays['roots']:
+        first_leaf = {}
+        last_leaf = {}
+        count = 0
+        stack = [(int(root), False)]
+        while stack:
+            node, children_done = stack.pop()
+            if feature[node] < 0:
+                leaf_slot[node] = 64 * tree_words[-1] + count
+                first_leaf[node] = last_leaf[node] = count
+                count += 1
+            elif children_done:
+                first_leaf[node] = first_leaf[int(left[node])]
+                last_leaf[node] = last_leaf[int(right[node])]
+                left_range[node] = (tree_words[-1], first_leaf[int(left[node])], last_leaf[int(left[node])])
+            else:
+                stack.extend([(node, True), (int(right[node]), False), (int(left[node]), False)])
+        tree_words.append(tree_words[-1] + -(-count // 64))
+    n_words = tree_words[-1]
+
+    leaf_nodes = np.zeros(64 * n_words, dtype=np.int32)
+    for node, slot in leaf_slot.items():
+        leaf_nodes[slot] = node
+
+    thresholds = []
+    split_offsets = [0]
+    tables = []
+    mask_offsets = [0]
+    internal = np.flatnonzero(feature >= 0)
+    for f in range(n_features):
+        nodes = internal[feature[internal] == f]
+        nodes = nodes[np.argsort(arrays['threshold'][nodes], kind='stable')]
+        unique = np.unique(arrays['threshold'][nodes])
+        table = np.full((len(unique) + 1, n_words), ALL_ONES)
+        current = np.full(n_words, ALL_ONES)
+        j = 0
+        for rank, value in enumerate(unique):
+            while j < len(nodes) and arrays['threshold'][nodes[j]] == value:
+                word_start, first, last = left_range[int(nodes[j])]
+                cleared = (1 << (last + 1)) - (1 << first)
+                for word in range(first // 64, last // 64 + 1):
+                    current[word_start + word] &= ~np.uint64((cleared >> (64 * word)) & 0xFFFFFFFFFFFFFFFF)
+                j += 1
+            table[rank + 1] = current
+        thresholds.append(unique)
+        split_offsets.append(split_offsets[-1] + len(unique))
+        tables.append(table)
+        mask_offsets.append(mask_offsets[-1] + len(table))
+
+    zero_features = np.zeros(n_features, dtype=np.bool_)
+    zero_nodes = internal[arrays['missing_type'][internal] == MISSING_ZERO]
+    zero_features[feature[zero_nodes]] = True
+    return {
+        'split_thresholds': np.concatenate(thresholds).astype(np.float64),
+        'split_offsets': np.asarray(split_offsets, dtype=np.int64),
+        'masks': np.concatenate(tables),
+        'mask_offsets': np.asarray(mask_offsets, dtype=np.int64),
+        'tree_words': np.asarray(tree_words, dtype=np.int64),
+        'leaf_nodes': leaf_nodes,
+        'zero_features': zero_features,
+    }
+
+
+def compile_model(model_path, output_path=None):
+    """Biên dịch một model .joblib (random forest hoặc LightGBM nhị phân) thành file .trees đọc bằng mmap."""
+    output_path = output_path or os.path.splitext(model_path)[0] + COMPILED_SUFFIX
+    model = joblib.load(model_path)
+    if hasattr(model, 'booster_'):
+        header, arrays = _flatten_lightgbm(model)
+    elif hasattr(model, 'estimators_') and all(hasattr(estimator, 'tree_') for estimator in model.estimators_):
+        header, arrays = _flatten_forest(model)
+    else:
+        raise ValueError(f"Model type '{type(model).__name__}' cannot be compiled")
+    arrays.update(_leaf_bitmasks(arrays, header['n_features']))
+    header['format_version'] = FORMAT_VERSION
+    header.update(source_info(model_path))
+
+    # Mỗi mảng bắt đầu ở vị trí chia hết cho ALIGNMENT để đọc thẳng từ mmap
+    layout = {}
+    offset = 0
+    for name, array in arrays.items():
+        layout[name] = {'dtype': array.dtype.str, 'shape': list(array.shape), 'offset': offset}
+        offset += -(-array.nbytes // ALIGNMENT) * ALIGNMENT
+    header['arrays'] = layout
+    encoded = json.dumps(header).encode('utf-8')
+    data_start = -(-(len(MAGIC) + 8 + len(encoded)) // ALIGNMENT) * ALIGNMENT
+
+    tmp_path = output_path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(MAGIC)
+        f.write(len(encoded).to_bytes(8, 'little'))
+        f.write(encoded)
+        for name, array in arrays.items():
+            f.seek(data_start + layout[name]['offset'])
+            f.write(np.ascontiguousarray(array).tobytes())
+        f.truncate(data_start + offset)
+    os.replace(tmp_path, output_path)
+    return output_path
+
+
+def read_header(path):
+    """Header JSON của một file .trees."""
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"'{path}' is not a compiled tree ensemble")
+        header_size = int.from_bytes(f.read(8), 'little')
+        return json.loads(f.read(header_size))
+
+
+def compiled_path(model_path):
+    """File .trees biên dịch từ đúng file .joblib này, hoặc None nếu chưa có hoặc đã cũ (model đã đổi)."""
+    path = os.path.splitext(model_path)[0] + COMPILED_SUFFIX
+    if not os.path.exists(path):
+        return None
+    try:
+        header = read_header(path)
+    except (OSError, ValueError):
+        return None
+    return path if matches_source(header, model_path, path) else None
+
+
+class TreeEnsemble:
+    """
+    Chạy một ensemble cây đã biên dịch. Các mảng được đọc trực tiếp từ file bằng mmap.
+    predict()/predict_proba() cho kết quả giống hệt từng bit với model gốc (forest với n_jobs=1).
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._mmap = np.memmap(path, dtype=np.uint8, mode='r')
+        if bytes(self._mmap[:len(MAGIC)]) != MAGIC:
+            raise ValueError(f"'{path}' is not a compiled tree ensemble")
+        header_size = int.from_bytes(bytes(self._mmap[len(MAGIC):len(MAGIC) + 8]), 'little')
+        header_end = len(MAGIC) + 8 + header_size
+        header = json.loads(bytes(self._mmap[len(MAGIC) + 8:header_end]))
+        if header.get('format_version') != FORMAT_VERSION:
+            raise ValueError(f"Unsupported format in '{path}'")
+        data_start = -(-header_end // ALIGNMENT) * ALIGNMENT
+
+        self.kind = header['kind']
+        self.classes_ = np.asarray(header['classes'])
+        self.n_features_in_ = header['n_features']
+        self.max_depth = header['max_depth']
+        self.sigmoid = header.get('sigmoid', 1.0)
+        self.average_output = header.get('average_output', False)
+        for name, spec in header['arrays'].items():
+            dtype = np.dtype(spec['dtype'])
+            start = data_start + spec['offset']
+            count = int(np.prod(spec['shape'], dtype=np.int64))
+            # View ndarray thường (vẫn trỏ vào mmap): truy cập memmap qua Python chậm hơn nhiều
+            array = self._mmap[start:start + count * dtype.itemsize].view(dtype).reshape(spec['shape'])
+            setattr(self, name, array.view(np.ndarray))
+        self.tree_starts = self.tree_words[:-1]
+        self.max_tree_words = int(np.diff(self.tree_words).max())
+
+    def apply(self, X):
+        """Chỉ số nút lá (toàn cục) của từng dòng trong từng cây, shape (n_trees, n_samples)."""
+        # Giá trị thiếu (NaN, hoặc gần 0 ở nút LightGBM xử lý 0 riêng) đi theo nhánh mặc định
+        # nên không dùng được bảng ngưỡng: các dòng đó được duyệt từng nút
+        special = np.isnan(X).any(axis=1)
+        if self.zero_features.any():
+            zero_band = X[:, self.zero_features]
+            special |= ((zero_band > -ZERO_THRESHOLD) & (zero_band <= ZERO_THRESHOLD)).any(axis=1)
+        leaves = np.empty((len(self.roots), len(X)), dtype=np.int32)
+        regular = np.flatnonzero(~special)
+        for start in range(0, len(regular), ROW_CHUNK):
+            rows = regular[start:start + ROW_CHUNK]
+            leaves[:, rows] = self._apply_bitmasks(X[rows])
+        if special.any():
+            leaves[:, special] = self._apply_nodes(X[special])
+        return leaves
+
+    def _apply_bitmasks(self, X):
+        ranks = []
+        for f in range(self.n_features_in_):
+            start, end = self.split_offsets[f], self.split_offsets[f + 1]
+            if start == end:
+                continue
+            # Số ngưỡng < x = số nút trên f đi sang phải (so sánh bằng float64 như sklearn/LightGBM)
+            rank = np.searchsorted(self.split_thresholds[start:end], X[:, f].astype(np.float64), side='left')
+            ranks.append(rank + self.mask_offsets[f])
+
+        masks = np.take(self.masks, ranks[0], axis=0)
+        for rank in ranks[1:]:
+            masks &= np.take(self.masks, rank, axis=0)
+
+        # Word đầu tiên khác 0 của mỗi cây (luôn có: lá phải cùng không bao giờ bị xoá),
+        # rồi bit 1 thấp nhất trong word đó
+        first_word = np.broadcast_to(self.tree_starts, (len(X), len(self.tree_starts)))
+        words = masks if self.max_tree_words == 1 else masks[:, self.tree_starts]
+        for k in range(1, self.max_tree_words):
+            empty = words == 0
+            if not empty.any():
+                break
+            candidate = np.minimum(self.tree_starts + k, self.tree_words[1:] - 1)
+            words = np.where(empty, masks[:, candidate], words)
+            first_word = np.where(empty, candidate, first_word)
+        lowest = words & (~words + np.uint64(1))
+        # Bit duy nhất của lowest là luỹ thừa của 2: đọc thẳng số mũ của nó dưới dạng float64
+        bit = (lowest.astype(np.float64).view(np.int64) >> 52) - 1023
+        return self.leaf_nodes[64 * first_word + bit].T
+
+    def _apply_nodes(self, X):
+        n_samples = len(X)
+        nodes = np.repeat(self.roots[:, None], n_samples, axis=1).ravel()
+        active = np.flatnonzero(self.feature[nodes] >= 0)
+        rows = active % n_samples
+        # Mỗi vòng đưa mọi (cây, dòng) chưa tới lá xuống thêm một tầng
+        while len(active):
+            node = nodes[active]
+            x = X[rows, self.feature[node]]
+            missing_type = self.missing_type[node]
+            is_nan = np.isnan(x)
+            # LightGBM coi NaN là 0 ở các nút không xử lý NaN riêng
+            x = np.where(is_nan & (missing_type != MISSING_NAN), 0.0, x)
+            use_default = ((missing_type == MISSING_NAN) & is_nan) | \
+                          ((missing_type == MISSING_ZERO) & (x > -ZERO_THRESHOLD) & (x <= ZERO_THRESHOLD))
+            go_left = np.where(use_default, self.default_left[node], x <= self.threshold[node])
+            node = np.where(go_left, self.left[node], self.right[node])
+            nodes[active] = node
+            still_active = self.feature[node] >= 0
+            active = active[still_active]
+            rows = rows[still_active]
+        return nodes.reshape(len(self.roots), n_samples)
+
+    def _accumulate(self, X):
+        leaves = self.apply(X)
+        if self.kind == 'forest':
+            # Cộng lần lượt từng cây như sklearn để tổng giống hệt từng bit
+            proba = np.zeros((len(X), self.value.shape[1]))
+            for tree_leaves in leaves:
+                proba += self.value[tree_leaves]
+            proba /= len(self.roots)
+            return proba
+
+        score = np.zeros(len(X))
+        for tree_leaves in leaves:
+            score += self.value[tree_leaves, 0]
+        if self.average_output:
+            score /= len(self.roots)
+        # math.exp dùng exp của libm giống LightGBM (np.exp có thể lệch 1 ulp)
+        positive = np.array([1.0 / (1.0 + math.exp(-self.sigmoid * value)) for value in score.tolist()])
+        return np.vstack((1.0 - positive, positive)).transpose()
+
+    def predict_proba(self, X):
+        X = np.asarray(X)
+        # sklearn chuyển dữ liệu sang float32 trước khi duyệt cây; LightGBM dùng float64
+        X = X.astype(np.float32 if self.kind == 'forest' else np.float64, copy=False)
+        if X.ndim != 2 or X.shape[1] != self.n_features_in_:
+            raise ValueError(f"Expected {self.n_features_in_} features, got shape {X.shape}")
+        if not len(X):
+            return np.zeros((0, len(self.classes_)))
+        return self._accumulate(X)
+
+    def predict(self, X):
+        return self.classes_.take(np.argmax(self.predict_proba(X), axis=1), axis=0)
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Compile random forest / LightGBM .joblib models into memory-mappable .trees files.")
+    parser.add_argument("models", nargs='+', help=".joblib models to compile (the .trees file is written next to each one).")
+    parser.add_argument("--check", type=int, default=0, metavar="N",
+                        help="Compare with the original model on N random rows (must be bit-identical).")
+
+    args = parser.parse_args()
+
+    failed = 0
+    for model_path in args.models:
+        try:
+            output_path = compile_model(model_path)
+        except (ValueError, OSError) as e:
+            print(f"Error in compiling '{model_path}': {e}")
+            failed += 1
+            continue
+        print(f"Compiled '{model_path}' -> '{output_path}'")
+        if args.check:
+            original = joblib.load(model_path)
+            if hasattr(original, 'n_jobs'):
+                original.n_jobs = 1  # Thứ tự cộng cố định để so sánh từng bit
+            compiled = TreeEnsemble(output_path)
+            X = np.random.default_rng(0).normal(size=(args.check, compiled.n_features_in_))
+            X[::7, ::3] = 0.0
+            same_proba = np.array_equal(original.predict_proba(X), compiled.predict_proba(X))
+            same_labels = np.array_equal(original.predict(X), compiled.predict(X))
+            print(f"  -> Identical probabilities: {same_proba}, identical labels: {same_labels}")
+            failed += not (same_proba and same_labels)
+    sys.exit(1 if failed else 0)
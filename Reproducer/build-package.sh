@@ -18,7 +18,18 @@ git rev-parse HEAD
 # we sort the paths so that shallower ones are preferred over deeper ones
 pkgDir=$(find . -name package.json | while read pkg; do test $(jq -r .name $pkg) = "$pkgName" && echo $pkg; done | xargs dirname | sort | head -n 1)
 
+# bytes in npm's content cache: it only grows when an install has to download something
+cache_bytes() {
+  if [ -n "$npm_config_cache" ] && [ -d "$npm_config_cache/_cacache/content-v2" ]; then
+    du -sb "$npm_config_cache/_cacache/content-v2" | cut -f1
+  else
+    echo 0
+  fi
+}
+
 # first install dependencies in the root
+cache_before=$(cache_bytes)
+install_start=$(date +%s.%N)
 npm install --production=false || echo "Dependency installation failed; continuing."
 
 # then install dependencies in the package directory (if different from root)
@@ -27,10 +38,23 @@ if ! [ -z "$pkgDir" ] && [ "$pkgDir" != "." ]; then
   npm install --production=false || echo "Dependency installation failed; continuing."
 fi
 
+# report the install time so reproduce.py can estimate what the npm cache saved:
+# the install was warm (a cache hit) only if nothing had to be downloaded into the cache
+# (downloads by other workers sharing the cache can make a warm install look cold, never the reverse)
+if [ -n "$REPRODUCE_STATS" ]; then
+  install_seconds=$(awk -v start="$install_start" -v end="$(date +%s.%N)" 'BEGIN { printf "%.3f", end - start }')
+  fetched_bytes=$(( $(cache_bytes) - cache_before ))
+  if [ -n "$npm_config_cache" ] && [ "$fetched_bytes" -le 0 ]; then hit=true; else hit=false; fi
+  printf '{"step": "install", "key": "%s", "seconds": %s, "hit": %s, "fetched_bytes": %s}\n' "$pkgName" "$install_seconds" "$hit" "$fetched_bytes" >> "$REPRODUCE_STATS"
+fi
+
 # attempt to set the time to the time of publication
+# (the clock is shared, so parallel reproductions set REPRODUCE_SKIP_DATE=1)
 now=$(date)
-(npm view "$pkgName" time --json | jq ".[\"$version\"]" | xargs sudo -n date -s) || \
-  (echo "Failed to set date; continuing.")
+if [ -z "$REPRODUCE_SKIP_DATE" ]; then
+  (npm view "$pkgName" time --json | jq ".[\"$version\"]" | xargs sudo -n date -s) || \
+    (echo "Failed to set date; continuing.")
+fi
 
 # run a few possible build scripts under a 10-minute timeout
 for target in compile build pack webpack; do
@@ -41,7 +65,9 @@ done
 tarball=$(npm pack | tail -n 1)
 
 # reset time
-sudo -n date -s "$now" || echo "Failed to reset time; continuing."
+if [ -z "$REPRODUCE_SKIP_DATE" ]; then
+  sudo -n date -s "$now" || echo "Failed to reset time; continuing."
+fi
 
 mkdir -p "$outdir"
 tar xf "$tarball" -C "$outdir" --strip-components=1
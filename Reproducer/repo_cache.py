@@ -0,0 +1,277 @@
+import os
+import re
+import json
+import time
+import fcntl
+import shutil
+import hashlib
+import argparse
+import subprocess
+from contextlib import contextmanager
+
+DEFAULT_CACHE_DIR = "cache"
+MAX_GIT_BYTES = 20 * 1024 ** 3  # Giới hạn dung lượng các git mirror
+MAX_NPM_BYTES = 10 * 1024 ** 3  # Giới hạn dung lượng npm cache
+EVICT_TARGET_RATIO = 0.9  # Sau khi dọn, cache còn 90% giới hạn
+# Bước -> khoá trong baselines.json chứa thời gian lâu nhất của lần chạy không dùng được cache
+# (clone mirror mới / npm install phải tải về). 'install_cold' thay cho mốc 'install' cũ, vốn
+# lẫn cả thời gian của các lần install đã có cache
+BASELINE_KEYS = {'clone': 'clone', 'install': 'install_cold'}
+GIT_TIMEOUT = 900  # Giây tối đa cho một lần clone/fetch mirror
+
+
+def normalize_repo_url(url):
+    """
+    Chuẩn hoá URL repository để các cách viết khác nhau dùng chung một mirror:
+    git+https://, git://, ssh://git@, git@host:owner/repo, đuôi .git, chữ hoa của host.
+    Trả về (clone_url, key) với key dạng host/owner/repo.
+    """
+    url = url.strip()
+    url = re.sub(r'^git\+', '', url)
+    if url.startswith('file://') or os.path.isdir(url):
+        # Repository cục bộ: giữ nguyên đường dẫn
+        path = os.path.abspath(url[len('file://'):] if url.startswith('file://') else url).rstrip('/')
+        return path, "local" + re.sub(r'\.git$', '', path)
+    match = re.match(r'^[\w.-]+@([\w.-]+):(.+)$', url)  # git@github.com:owner/repo.git
+    if match:
+        host, path = match.groups()
+    else:
+        match = re.match(r'^[a-z]+://(?:[^@/]+@)?([^/:]+)(?::\d+)?/(.+)$', url, re.IGNORECASE)
+        if not match:
+            raise ValueError(f"Unsupported repository url '{url}'")
+        host, path = match.groups()
+    host = host.lower()
+    path = re.sub(r'[#?].*$', '', path).strip('/')
+    path = re.sub(r'\.git$', '', path)
+    return f"https://{host}/{path}", f"{host}/{path}"
+
+
+def directory_size(path):
+    total = 0
+    for dirpath, _, filenames in os.walk(path):
+        for filename in filenames:
+            try:
+                total += os.lstat(os.path.join(dirpath, filename)).st_size
+            except OSError:
+                pass
+    return total
+
+
+@contextmanager
+def file_lock(path, exclusive=True, blocking=True):
+    """flock trên path; với blocking=False, trả về None nếu process khác đang giữ khoá."""
+    with open(path, 'a') as f:
+        flags = (fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH) | (0 if blocking else fcntl.LOCK_NB)
+        try:
+            fcntl.flock(f, flags)
+        except BlockingIOError:
+            yield None
+            return
+        try:
+            yield f
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def record_step(step, key, seconds, hit):
+    """Ghi thời gian một bước vào file REPRODUCE_STATS (nếu có) để reproduce.py tính thời gian tiết kiệm."""
+    stats_path = os.environ.get('REPRODUCE_STATS')
+    if stats_path:
+        with open(stats_path, 'a') as f:
+            f.write(json.dumps({'step': step, 'key': key, 'seconds': seconds, 'hit': hit}) + "\n")
+
+
+class RepoCache:
+    """
+    Cache dùng chung giữa các lần tái tạo gói:
+    - git/<key>.git: bare mirror của từng repository, lần sau chỉ fetch phần mới
+      rồi clone cục bộ (hardlink) thay vì clone lại qua mạng;
+    - npm/: thư mục cache của npm (npm_config_cache) cho mọi lần npm install.
+    Mỗi mirror có file khoá riêng nên nhiều worker/process dùng chung được; npm cache chỉ
+    bị dọn khi không có lần chạy nào khác đang giữ khoá dùng chung của cả cache.
+    """
+
+    def __init__(self, root=DEFAULT_CACHE_DIR):
+        self.root = os.path.abspath(root)
+        self.git_dir = os.path.join(self.root, "git")
+        self.npm_dir = os.path.join(self.root, "npm")
+        self.lock_path = os.path.join(self.root, ".lock")
+        self.baselines_path = os.path.join(self.root, "baselines.json")
+        os.makedirs(self.git_dir, exist_ok=True)
+        os.makedirs(self.npm_dir, exist_ok=True)
+
+    def mirror_path(self, key):
+        # Tên thư mục đọc được + một đoạn hash để không trùng sau khi thay ký tự
+        readable = re.sub(r'[^A-Za-z0-9._-]+', '_', key)[:100]
+        return os.path.join(self.git_dir, f"{readable}-{hashlib.sha1(key.encode('utf-8')).hexdigest()[:10]}.git")
+
+    def npm_env(self, env=None):
+        """Biến môi trường để npm install dùng cache chung (ưu tiên bản đã có trong cache)."""
+        env = dict(os.environ if env is None else env)
+        env['npm_config_cache'] = self.npm_dir
+        env['npm_config_prefer_offline'] = 'true'
+        env['REPRODUCE_CACHE_DIR'] = self.root
+        return env
+
+    def _update_mirror(self, clone_url, mirror):
+        """Tạo mirror nếu chưa có, ngược lại fetch. Trả về True nếu mirror đã có sẵn (cache hit)."""
+        if os.path.isdir(mirror):
+            result = subprocess.run(["git", "--git-dir", mirror, "fetch", "--prune", "--tags", "origin"],
+                                    capture_output=True, text=True, timeout=GIT_TIMEOUT)
+            if result.returncode == 0:
+                return True
+            print(f"Fetching mirror '{mirror}' failed, cloning again: {result.stderr.strip()}")
+            shutil.rmtree(mirror, ignore_errors=True)
+        tmp_mirror = f"{mirror}.tmp"
+        shutil.rmtree(tmp_mirror, ignore_errors=True)
+        subprocess.run(["git", "clone", "--mirror", clone_url, tmp_mirror], check=True, timeout=GIT_TIMEOUT)
+        os.replace(tmp_mirror, mirror)
+        return False
+
+    def clone(self, url, dest):
+        """Clone repository vào dest thông qua mirror; trả về (cache hit, số giây)."""
+        start = time.monotonic()
+        clone_url, key = normalize_repo_url(url)
+        mirror = self.mirror_path(key)
+        with file_lock(f"{mirror}.lock"):
+            hit = self._update_mirror(clone_url, mirror)
+            subprocess.run(["git", "clone", "--quiet", mirror, dest], check=True, timeout=GIT_TIMEOUT)
+            os.utime(mirror)  # Thời điểm dùng gần nhất cho LRU
+        # Bản clone trỏ về repository gốc như khi clone trực tiếp
+        subprocess.run(["git", "-C", dest, "remote", "set-url", "origin", clone_url], check=True)
+        seconds = time.monotonic() - start
+        record_step('clone', key, seconds, hit)
+        return hit, seconds
+
+    def evict_git(self, max_bytes=MAX_GIT_BYTES):
+        """Xoá các mirror lâu nhất chưa được dùng khi tổng dung lượng vượt max_bytes; bỏ qua mirror đang bận."""
+        mirrors = []
+        for name in os.listdir(self.git_dir):
+            path = os.path.join(self.git_dir, name)
+            if name.endswith('.git') and os.path.isdir(path):
+                mirrors.append((os.path.getmtime(path), directory_size(path), path))
+        total = sum(size for _, size, _ in mirrors)
+        removed = 0
+        if total <= max_bytes:
+            return removed
+        target = int(max_bytes * EVICT_TARGET_RATIO)
+        for _, size, path in sorted(mirrors):
+            if total <= target:
+                break
+            with file_lock(f"{path}.lock", blocking=False) as lock:
+                if lock is None:
+                    continue
+                # File khoá được giữ lại: process khác có thể đang chờ trên chính file đó
+                shutil.rmtree(path, ignore_errors=True)
+            total -= size
+            removed += 1
+        return removed
+
+    def evict_npm(self, max_bytes=MAX_NPM_BYTES):
+        """
+        Xoá toàn bộ npm cache khi vượt max_bytes. Chỉ làm khi giữ được khoá độc quyền của
+        cache (không có lần chạy nào khác đang dùng), vì npm đọc cache trong suốt lần build.
+        """
+        if directory_size(self.npm_dir) <= max_bytes:
+            return False
+        with file_lock(self.lock_path, blocking=False) as lock:
+            if lock is None:
+                return False
+            shutil.rmtree(self.npm_dir, ignore_errors=True)
+            os.makedirs(self.npm_dir, exist_ok=True)
+        # Cache trống: lần install tới của mỗi gói sẽ đo lại mốc "cache nguội"
+        self.update_baselines(lambda baselines: baselines.pop(BASELINE_KEYS['install'], None))
+        return True
+
+    @contextmanager
+    def in_use(self):
+        """Giữ khoá dùng chung của cả cache trong suốt một lần chạy reproduce.py."""
+        with file_lock(self.lock_path, exclusive=False) as lock:
+            yield lock
+
+    def update_baselines(self, update):
+        with file_lock(f"{self.baselines_path}.lock"):
+            try:
+                with open(self.baselines_path) as f:
+                    baselines = json.load(f)
+            except (OSError, ValueError):
+                baselines = {}
+            result = update(baselines)
+            tmp_path = f"{self.baselines_path}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(baselines, f)
+            os.replace(tmp_path, self.baselines_path)
+        return result
+
+    def account(self, steps):
+        """
+        Ước lượng số giây cache đã tiết kiệm cho các bước của một gói. Chỉ bước dùng được
+        cache (mirror có sẵn / npm install không phải tải gì) được so với thời gian lâu nhất
+        của các lần không dùng được cache, của cùng repository (clone) / cùng gói (npm install).
+        Trả về {'clone': giây, 'install': giây}.
+        """
+        def update(baselines):
+            saved = {'clone': 0.0, 'install': 0.0}
+            for step in steps:
+                kind = step['step']
+                if kind not in saved:
+                    continue
+                known = baselines.setdefault(BASELINE_KEYS[kind], {})
+                baseline = known.get(step['key'])
+                if step['hit']:
+                    if baseline is not None:
+                        saved[kind] += max(0.0, baseline - step['seconds'])
+                else:
+                    known[step['key']] = max(baseline or 0.0, step['seconds'])
+            return saved
+        return self.update_baselines(update)
+
+    def stats(self):
+        mirrors = [name for name in os.listdir(self.git_dir) if name.endswith('.git')]
+        return {'mirrors': len(mirrors), 'git_bytes': directory_size(self.git_dir), 'npm_bytes': directory_size(self.npm_dir)}
+
+
+def read_steps(stats_path):
+    """Các bước đã ghi trong file REPRODUCE_STATS của một gói."""
+    steps = []
+    if not os.path.exists(stats_path):
+        return steps
+    with open(stats_path) as f:
+        for line in f:
+            try:
+                steps.append(json.loads(line))
+            except ValueError:
+                continue
+    return steps
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Shared git mirror / npm cache used by the reproducer.")
+    parser.add_argument("--cache_dir", default=os.environ.get('REPRODUCE_CACHE_DIR', DEFAULT_CACHE_DIR),
+                        help="Cache root (git mirrors in git/, npm cache in npm/).")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    clone_parser = subparsers.add_parser("clone", help="Clone a repository through its local mirror.")
+    clone_parser.add_argument("url", help="Repository URL.")
+    clone_parser.add_argument("dest", help="Directory to clone into.")
+
+    evict_parser = subparsers.add_parser("evict", help="Remove least recently used mirrors / the npm cache when over the size limits.")
+    evict_parser.add_argument("--max_git_gb", type=float, default=MAX_GIT_BYTES / 1024 ** 3, help="Size limit of the git mirrors.")
+    evict_parser.add_argument("--max_npm_gb", type=float, default=MAX_NPM_BYTES / 1024 ** 3, help="Size limit of the npm cache.")
+
+    subparsers.add_parser("stats", help="Show the cache size.")
+
+    args = parser.parse_args()
+    cache = RepoCache(args.cache_dir)
+
+    if args.command == "clone":
+        hit, seconds = cache.clone(args.url, args.dest)
+        print(f"Cloned {args.url} from {'existing' if hit else 'new'} mirror in {seconds:.1f}s")
+    elif args.command == "evict":
+        removed = cache.evict_git(int(args.max_git_gb * 1024 ** 3))
+        cleared = cache.evict_npm(int(args.max_npm_gb * 1024 ** 3))
+        print(f"Removed {removed} mirrors{', cleared npm cache' if cleared else ''}.")
+    else:
+        stats = cache.stats()
+        print(f"Mirrors: {stats['mirrors']} ({stats['git_bytes'] / 1024 ** 2:.1f} MB), npm cache: {stats['npm_bytes'] / 1024 ** 2:.1f} MB")
@@ -6,6 +6,8 @@ SCRIPT_DIR="$( cd "$( dirname "${BASH_SOURCE[0]}" )" &> /dev/null && pwd )"
 
 spec="$1"
 outdir=$(readlink -f "$2")
+# Optional clone directory (one per worker when reproducing in parallel)
+workdir="${3:-working}"
 
 package="${spec%@*}"
 version="${spec##*@}"
@@ -23,13 +25,18 @@ if [ -z "$repoUrl" ]; then
   echo "Could not find git repository for $spec."
   exit 1
 fi
-repoUrl=$(node -e "console.log(require('./node_modules/normalize-git-url')('$repoUrl').url)")
+repoUrl=$(node -e "console.log(require('$SCRIPT_DIR/node_modules/normalize-git-url')('$repoUrl').url)")
 # replace ssh:// with https://
 repoUrl=$(echo "$repoUrl" | sed 's#^ssh://#https://#')
-git clone "$repoUrl" working
+if [ -n "$REPRODUCE_CACHE_DIR" ]; then
+  # Clone through the shared bare mirror (fetch instead of a full clone)
+  python3 "$SCRIPT_DIR/repo_cache.py" --cache_dir "$REPRODUCE_CACHE_DIR" clone "$repoUrl" "$workdir"
+else
+  git clone "$repoUrl" "$workdir"
+fi
 
 # Check out right commit
-cd working
+cd "$workdir"
 ref=$(npm view "$spec" gitHead)
 if [ -z "$ref" ]; then
   # typical branch names for $version
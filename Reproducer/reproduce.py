@@ -1,106 +1,441 @@
 import os
 import sys
+import json
+import time
 import shutil
+import signal
+import threading
 import subprocess
 import pandas as pd
 from datetime import datetime
 import argparse
+from contextlib import nullcontext
+from repo_cache import DEFAULT_CACHE_DIR, MAX_GIT_BYTES, MAX_NPM_BYTES, RepoCache, read_steps
 
-def run_reproduce_package(package, version, output_dir_for_package):
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Npm_Collector'))
+import metrics
 
-    working_dir = "working"  
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+JOB_TIMEOUT = 1200  # Timeout 20 phút cho mỗi gói
+KILL_GRACE = 10  # Giây chờ sau SIGTERM trước khi SIGKILL cả nhóm process
+NUM_WORKERS = min(4, os.cpu_count() or 1)
+WORK_ROOT = "working"  # Mỗi worker dùng thư mục riêng working/worker-<i>
+SLOW_JOB_SECONDS = 300  # Gói từng chạy quá 5 phút (hoặc bị timeout) được coi là gói chậm
+JOURNAL_NAME = "journal.jsonl"  # Nhật ký kết quả của một ngày, trong <output_dir>/<date>/
+MAX_ATTEMPTS = 3  # Số lần thử tối đa của một gói thất bại, tính cả các lần chạy trước
+STATUS_COLUMNS = ["name", "status", "reason", "wall_time", "worker", "cache_saved", "attempts"]
+
+
+def parse_spec(pkg_spec):
+    # Tách tên và phiên bản từ chuỗi "name@version"
+    # Xử lý các scoped package như @angular/core@14.0.0
+    if pkg_spec.startswith('@'):
+        parts = pkg_spec[1:].split('@')
+        return f"@{parts[0]}", parts[1]
+    package, version = pkg_spec.split('@')
+    return package, version
+
+
+def kill_process_group(proc):
+    """
+    Dừng cả nhóm process của script (git, npm, node, ...): SIGTERM, chờ tối đa KILL_GRACE
+    giây cho tới khi nhóm không còn process nào, rồi SIGKILL.
+    """
+    try:
+        os.killpg(proc.pid, signal.SIGTERM)
+    except (ProcessLookupError, PermissionError):
+        proc.wait()
+        return
+    deadline = time.monotonic() + KILL_GRACE
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            try:
+                os.killpg(proc.pid, 0)
+            except (ProcessLookupError, PermissionError):
+                return
+        time.sleep(0.1)
+    try:
+        os.killpg(proc.pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
+    proc.wait()
+
+
+def run_reproduce_package(package, version, output_dir_for_package, working_dir=WORK_ROOT,
+                          timeout=JOB_TIMEOUT, log_path=None, env=None, on_start=None):
+    """
+    Chạy reproduce-package.sh trong working_dir riêng (được dọn trước mỗi lần chạy).
+    Kết quả được build vào working_dir/out rồi mới chuyển sang output_dir_for_package
+    khi thành công. Trả về lý do kết thúc: 'ok', 'exit_<code>', 'timeout' hoặc 'error'.
+    """
     if os.path.exists(working_dir):
-        print(f"  Cleaning up old '{working_dir}' directory...")
         shutil.rmtree(working_dir, ignore_errors=True)
-        
+    os.makedirs(working_dir, exist_ok=True)
+    staging_dir = os.path.join(working_dir, "out")
+    command = ["bash", os.path.join(SCRIPT_DIR, "reproduce-package.sh"), f"{package}@{version}",
+               staging_dir, os.path.join(working_dir, "repo")]
+
+    log_file = open(log_path, 'w') if log_path else subprocess.DEVNULL
+    try:
+        # Nhóm process riêng để timeout dừng được cả các process con
+        proc = subprocess.Popen(command, cwd=SCRIPT_DIR, stdout=log_file, stderr=subprocess.STDOUT,
+                                stdin=subprocess.DEVNULL, env=env, start_new_session=True)
+    except OSError:
+        if log_path:
+            log_file.close()
+        return 'error'
+
+    if on_start:
+        on_start(proc)
     try:
-        # Tạo command gọi file reproduce-package.sh với 2 tham số
-        # Script shell của bạn không cần tham số thứ 3 cho working_dir
-        command = ["bash", "reproduce-package.sh", f"{package}@{version}", output_dir_for_package]
-        
-        # Thực thi lệnh
-        subprocess.run(
-            command,
-            capture_output=True,
-            check=True,  # Gây ra lỗi CalledProcessError nếu script shell thất bại
-            text=True,
-            timeout=1200 # Timeout 20 phút
-        )
-        return True # Trả về True nếu thành công
-        
-    except (subprocess.CalledProcessError, subprocess.TimeoutExpired):
-        return False # Trả về False nếu thất bại
-
-def main(target_date, output_dir, output_csv):
+        proc.wait(timeout=timeout)
+        reason = 'ok' if proc.returncode == 0 else f"exit_{proc.returncode}"
+    except subprocess.TimeoutExpired:
+        reason = 'timeout'
+    finally:
+        # Dọn cả những process nền còn sót lại sau khi script kết thúc
+        kill_process_group(proc)
+        if log_path:
+            log_file.close()
+
+    if reason == 'ok':
+        shutil.rmtree(output_dir_for_package, ignore_errors=True)
+        os.makedirs(os.path.dirname(os.path.abspath(output_dir_for_package)), exist_ok=True)
+        shutil.move(staging_dir, output_dir_for_package)
+    shutil.rmtree(working_dir, ignore_errors=True)
+    return reason
+
+
+def output_size(path):
+    """(số tệp, số byte) của thư mục kết quả một gói, cho báo cáo gói chậm."""
+    files = size = 0
+    for root, _, filenames in os.walk(path):
+        for filename in filenames:
+            try:
+                size += os.lstat(os.path.join(root, filename)).st_size
+                files += 1
+            except OSError:
+                continue
+    return files, size
+
 
+def load_history(path):
+    """Thời gian chạy và lý do kết thúc của các gói từ file trạng thái lần chạy trước."""
+    if not path or not os.path.exists(path):
+        return {}
+    try:
+        df = pd.read_csv(path)
+    except (pd.errors.EmptyDataError, pd.errors.ParserError):
+        return {}
+    if 'wall_time' not in df.columns:
+        return {}
+    reasons = df['reason'] if 'reason' in df.columns else [''] * len(df)
+    return {name: (wall_time, reason) for name, wall_time, reason in zip(df['name'], df['wall_time'], reasons)}
+
+
+def append_journal(journal_path, entry):
+    """Ghi thêm kết quả của một gói vào journal và fsync ngay, để dừng đột ngột cũng không mất."""
+    entry = dict(entry, finished_at=datetime.now().isoformat(timespec='seconds'))
+    with open(journal_path, 'a') as f:
+        f.write(json.dumps(entry) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def read_journal(journal_path):
+    """Các bản ghi của journal theo thứ tự ghi; bỏ qua dòng ghi dở khi process bị dừng giữa chừng."""
+    entries = []
+    if not os.path.exists(journal_path):
+        return entries
+    with open(journal_path) as f:
+        for line in f:
+            try:
+                entries.append(json.loads(line))
+            except ValueError:
+                continue
+    return entries
+
+
+def journal_state(entries):
+    """{tên gói: (bản ghi mới nhất, số lần đã thử)}."""
+    state = {}
+    for entry in entries:
+        _, attempts = state.get(entry['name'], (None, 0))
+        state[entry['name']] = (entry, attempts + 1)
+    return state
+
+
+def journal_status(entries, pkg_specs=None):
+    """
+    Trạng thái cuối của từng gói (bản ghi mới nhất trong journal), theo thứ tự pkg_specs nếu có.
+    Đây cũng là nội dung file trạng thái CSV, nên có thể dựng lại bất cứ lúc nào.
+    """
+    state = journal_state(entries)
+    names = [name for name in pkg_specs if name in state] if pkg_specs is not None else list(state)
+    rows = [dict(state[name][0], attempts=state[name][1]) for name in names]
+    return pd.DataFrame(rows, columns=STATUS_COLUMNS)
+
+
+def read_packages(target_date):
+    """Danh sách gói (không trùng) trong file log của collector, hoặc None nếu không có file."""
     collector_log_file = os.path.join("dataset", f"date-{target_date}.log")
-    
     if not os.path.exists(collector_log_file):
         print(f"Error: Not found file log of collector '{collector_log_file}'.")
-        return
-
+        return None
     # THAY ĐỔI: Đọc danh sách gói từ file log (thay vì file CSV)
     with open(collector_log_file, 'r') as f:
-        packages_to_process = [line.strip() for line in f if line.strip()]
-        
+        # Bỏ dòng trùng: hai worker không được build cùng một gói vào cùng thư mục
+        return list(dict.fromkeys(line.strip() for line in f if line.strip()))
+
+
+def write_status(target_date, output_dir, output_csv):
+    """Dựng file trạng thái CSV từ journal mà không chạy lại gói nào."""
+    journal_path = os.path.join(output_dir, target_date, JOURNAL_NAME)
+    results_df = journal_status(read_journal(journal_path), read_packages(target_date))
+    results_df.to_csv(output_csv, index=False)
+    return results_df
+
+
+class JobScheduler:
+    """
+    Hàng đợi gói cho các worker. Gói đã biết là chậm (theo lần chạy trước) chỉ được chiếm
+    tối đa max_slow worker cùng lúc, nên các worker còn lại luôn xử lý được các gói nhanh;
+    khi chỉ còn gói chậm thì mọi worker đều nhận.
+    """
+
+    def __init__(self, pkg_specs, history, num_workers):
+        self.lock = threading.Lock()
+        self.fast = []
+        self.slow = []
+        for pkg_spec in pkg_specs:
+            wall_time, reason = history.get(pkg_spec, (None, None))
+            if reason == 'timeout' or (wall_time is not None and wall_time >= SLOW_JOB_SECONDS):
+                self.slow.append((wall_time, pkg_spec))
+            else:
+                self.fast.append(pkg_spec)
+        # Gói chậm nhất bắt đầu sớm nhất để không kéo dài phần cuối của lượt chạy
+        self.slow = [pkg_spec for _, pkg_spec in sorted(self.slow, key=lambda item: -(item[0] or 0))]
+        self.max_slow = num_workers // 2
+        self.slow_running = 0
+
+    def next_job(self):
+        """Trả về (pkg_spec, is_slow) hoặc None khi hết gói."""
+        with self.lock:
+            if self.slow and (self.slow_running < self.max_slow or not self.fast):
+                self.slow_running += 1
+                return self.slow.pop(0), True
+            if self.fast:
+                return self.fast.pop(0), False
+            return None
+
+    def finish(self, is_slow):
+        if is_slow:
+            with self.lock:
+                self.slow_running -= 1
+
+
+def main(target_date, output_dir, output_csv, num_workers=NUM_WORKERS, timeout=JOB_TIMEOUT, history_csv=None,
+         cache_dir=DEFAULT_CACHE_DIR, max_git_bytes=MAX_GIT_BYTES, max_npm_bytes=MAX_NPM_BYTES,
+         max_attempts=MAX_ATTEMPTS, metrics_path=None):
+
+    packages_to_process = read_packages(target_date)
+    if packages_to_process is None:
+        return
+
     if not packages_to_process:
         print("Nothing to reproduce!")
         return
-        
-    print(f"Found {len(packages_to_process)} packages needed to reproduce...")
-
-    all_results = []
-    for i, pkg_spec in enumerate(packages_to_process):
-        print(f"\n[ {i+1}/{len(packages_to_process)} ] Reproducing: {pkg_spec}")
-        
-        # Tách tên và phiên bản từ chuỗi "name@version"
-        # Xử lý các scoped package như @angular/core@14.0.0
-        if pkg_spec.startswith('@'):
-            parts = pkg_spec[1:].split('@')
-            package = f"@{parts[0]}"
-            version = parts[1]
-        else:
-            package, version = pkg_spec.split('@')
-
-        # Tạo thư mục đầu ra riêng cho từng gói
-        sanitized_name = package.replace('/', '-')
-        package_output_dir = os.path.join(output_dir, target_date, f"{sanitized_name}-{version}")
-        os.makedirs(package_output_dir, exist_ok=True)
-            
-        success = run_reproduce_package(package, version, package_output_dir)
-        
-        # Chuyển đổi trạng thái thành 0 (thành công) hoặc 1 (thất bại)
-        status_code = 0 if success else 1
-        
-        print(f"  -> Status: {'SUCCESS' if success else 'FAILURE'} (Code: {status_code})")
-        
-        # Thêm kết quả vào danh sách
-        all_results.append({"name": pkg_spec, "status": status_code})
-
-    # Tạo DataFrame và lưu ra file CSV với 2 cột yêu cầu
-    results_df = pd.DataFrame(all_results)
+
+    # Tiếp tục từ journal: bỏ qua gói đã thành công, chỉ thử lại gói thất bại còn lượt
+    journal_path = os.path.join(output_dir, target_date, JOURNAL_NAME)
+    os.makedirs(os.path.dirname(journal_path), exist_ok=True)
+    state = journal_state(read_journal(journal_path))
+    done = [name for name in packages_to_process if name in state and state[name][0]['status'] == 0]
+    exhausted = [name for name in packages_to_process
+                 if name in state and state[name][0]['status'] != 0 and state[name][1] >= max_attempts]
+    skipped = set(done) | set(exhausted)
+    pending = [name for name in packages_to_process if name not in skipped]
+
+    print(f"Found {len(packages_to_process)} packages needed to reproduce with {num_workers} workers...")
+    if state:
+        print(f"Resuming from '{journal_path}': {len(done)} already reproduced, "
+              f"{len(exhausted)} failed {max_attempts} times, {len(pending)} left")
+
+    env = os.environ.copy()
+    if num_workers > 1:
+        # Đồng hồ hệ thống dùng chung: không đổi ngày giờ khi nhiều gói build cùng lúc
+        env['REPRODUCE_SKIP_DATE'] = '1'
+
+    # Cache git mirror / npm dùng chung; dọn trước khi giữ khoá dùng chung của lần chạy này
+    cache = None
+    if cache_dir:
+        cache = RepoCache(cache_dir)
+        removed = cache.evict_git(max_git_bytes)
+        cleared = cache.evict_npm(max_npm_bytes)
+        if removed or cleared:
+            print(f"Cache eviction: removed {removed} git mirrors{', cleared npm cache' if cleared else ''}.")
+        env = cache.npm_env(env)
+
+    # Thời gian chạy trong journal mới hơn file trạng thái của lần chạy trước
+    history = load_history(history_csv or output_csv)
+    history.update({name: (entry['wall_time'], entry['reason']) for name, (entry, _) in state.items()})
+    scheduler = JobScheduler(pending, history, num_workers)
+    log_dir = os.path.join(output_dir, target_date, "logs")
+    os.makedirs(log_dir, exist_ok=True)
+    results = {}
+    saved_total = {'clone': 0.0, 'install': 0.0}
+    running = {}
+    lock = threading.Lock()
+    stopping = threading.Event()
+
+    def worker(worker_id):
+        working_dir = os.path.abspath(os.path.join(WORK_ROOT, f"worker-{worker_id}"))
+        # Thời gian clone/install của từng gói, ghi bởi các script (nằm ngoài working_dir vì thư mục đó bị xoá)
+        stats_path = os.path.abspath(os.path.join(WORK_ROOT, f"worker-{worker_id}.stats"))
+        worker_env = dict(env, REPRODUCE_STATS=stats_path) if cache or metrics.enabled() else env
+        while not stopping.is_set():
+            job = scheduler.next_job()
+            if job is None:
+                return
+            pkg_spec, is_slow = job
+            try:
+                package, version = parse_spec(pkg_spec)
+            except (ValueError, IndexError):
+                with lock:
+                    results[pkg_spec] = {"name": pkg_spec, "status": 1, "reason": "invalid_spec", "wall_time": 0.0, "worker": worker_id, "cache_saved": 0.0}
+                    append_journal(journal_path, results[pkg_spec])
+                    print(f"[ {len(results)}/{len(pending)} ] {pkg_spec} -> FAILURE (Code: 1, invalid_spec)")
+                scheduler.finish(is_slow)
+                continue
+
+            # Thư mục đầu ra riêng cho từng gói
+            sanitized_name = package.replace('/', '-')
+            package_output_dir = os.path.join(output_dir, target_date, f"{sanitized_name}-{version}")
+            log_path = os.path.join(log_dir, f"{sanitized_name}-{version}.log")
+
+            def on_start(proc):
+                running[worker_id] = proc
+
+            if os.path.exists(stats_path):
+                os.remove(stats_path)
+            start = time.monotonic()
+            with metrics.package(pkg_spec):
+                reason = run_reproduce_package(package, version, package_output_dir, working_dir, timeout, log_path, worker_env, on_start)
+                # Thời gian clone/npm install do các script ghi lại
+                steps = read_steps(stats_path)
+                for step in steps:
+                    metrics.observe(step['step'], step['seconds'])
+                metrics.count(f"reproduce_{reason}")
+                if metrics.enabled():
+                    metrics.package_size(*output_size(package_output_dir))
+            wall_time = time.monotonic() - start
+            saved = {'clone': 0.0, 'install': 0.0}
+            if cache:
+                saved = cache.account(steps)
+            if os.path.exists(stats_path):
+                os.remove(stats_path)
+            running.pop(worker_id, None)
+            scheduler.finish(is_slow)
+            if stopping.is_set():
+                return
+
+            # Chuyển đổi trạng thái thành 0 (thành công) hoặc 1 (thất bại)
+            status_code = 0 if reason == 'ok' else 1
+            with lock:
+                results[pkg_spec] = {"name": pkg_spec, "status": status_code, "reason": reason,
+                                     "wall_time": round(wall_time, 1), "worker": worker_id,
+                                     "cache_saved": round(saved['clone'] + saved['install'], 1)}
+                append_journal(journal_path, results[pkg_spec])
+                for step in saved_total:
+                    saved_total[step] += saved[step]
+                print(f"[ {len(results)}/{len(pending)} ] {pkg_spec} -> "
+                      f"{'SUCCESS' if status_code == 0 else 'FAILURE'} (Code: {status_code}, {reason}) "
+                      f"in {wall_time:.1f}s [worker {worker_id}]")
+
+    os.makedirs(WORK_ROOT, exist_ok=True)
+    threads = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(num_workers)]
+    # Khoá dùng chung: process khác không xoá npm cache khi lần chạy này đang dùng
+    with cache.in_use() if cache else nullcontext():
+        for thread in threads:
+            thread.start()
+        try:
+            while any(thread.is_alive() for thread in threads):
+                for thread in threads:
+                    thread.join(timeout=1)
+        except KeyboardInterrupt:
+            print("\nStopping: killing running builds...")
+            stopping.set()
+            for proc in list(running.values()):
+                kill_process_group(proc)
+
+    # File trạng thái được dựng từ journal (gồm cả kết quả các lần chạy trước), theo thứ tự trong log
+    results_df = journal_status(read_journal(journal_path), packages_to_process)
     results_df.to_csv(output_csv, index=False)
-    
+
     print("\nFinish reproducing!")
+    if not results_df.empty:
+        print(results_df['reason'].value_counts().to_string())
+    if results:
+        print(f"Total build time {sum(result['wall_time'] for result in results.values()):.0f}s in this run")
+    if cache:
+        print(f"Cache saved ~{saved_total['clone']:.0f}s of clone time and ~{saved_total['install']:.0f}s of npm install time")
+    if metrics.enabled():
+        metrics.print_report()
+        if metrics_path:
+            metrics.write_metrics(metrics_path)
+            print(f"Metrics saved to '{metrics_path}'")
     print(f"Reproductiopn status file is saved at: '{output_csv}'")
 
 
 if __name__ == "__main__":
-    
-    parser = argparse.ArgumentParser(description="Reproduce npm packages sequentially from a daily log.")
-    
+
+    parser = argparse.ArgumentParser(description="Reproduce npm packages from a daily log with parallel workers.")
+
     parser.add_argument("target_date", nargs='?', default=datetime.now().strftime('%Y-%m-%d'),
                         help="Target date in YYYY-MM-DD format (defaults to today).")
-                        
+
     parser.add_argument("--output_dir", default="reproduced_packages",
                         help="Root directory to save reproduction results.")
     parser.add_argument("--output_csv", default="prediction_result/reproduction_status.csv",
                         help="Output CSV file to log status.")
-    
+    parser.add_argument("--workers", type=int, default=NUM_WORKERS,
+                        help="Number of packages reproduced at the same time (each in its own working directory).")
+    parser.add_argument("--timeout", type=float, default=JOB_TIMEOUT,
+                        help="Seconds before a build and all of its child processes are killed.")
+    parser.add_argument("--history_csv", default=None,
+                        help="Status CSV of a previous run used to schedule slow packages (defaults to --output_csv).")
+    parser.add_argument("--cache_dir", default=DEFAULT_CACHE_DIR,
+                        help="Shared cache of bare git mirrors and the npm cache (safe to share between concurrent runs).")
+    parser.add_argument("--no_cache", action="store_true",
+                        help="Clone and install without the shared cache.")
+    parser.add_argument("--max_git_cache_gb", type=float, default=MAX_GIT_BYTES / 1024 ** 3,
+                        help="Least recently used git mirrors are removed above this size.")
+    parser.add_argument("--max_npm_cache_gb", type=float, default=MAX_NPM_BYTES / 1024 ** 3,
+                        help="The npm cache is cleared above this size (only when no other run is using it).")
+    parser.add_argument("--max_attempts", type=int, default=MAX_ATTEMPTS,
+                        help="Failed packages are retried on later runs of the same date until they were tried this many times.")
+    parser.add_argument("--status_only", action="store_true",
+                        help="Only rebuild the status CSV from the journal of the date, without reproducing anything.")
+    parser.add_argument("--measure", action="store_true",
+                        help="Print clone/install/total time per stage and the slowest packages at the end.")
+    parser.add_argument("--metrics", default=None,
+                        help="Also write the metrics: Prometheus text if the file ends with .prom, otherwise appended JSON lines (implies --measure).")
+
     args = parser.parse_args()
 
     # Tạo các thư mục output nếu chưa tồn tại
     os.makedirs(os.path.dirname(args.output_csv), exist_ok=True)
 
+    if args.status_only:
+        status_df = write_status(args.target_date, args.output_dir, args.output_csv)
+        print(f"{len(status_df)} packages in the journal, status file is saved at: '{args.output_csv}'")
+        sys.exit(0)
+
+    if args.measure or args.metrics:
+        metrics.enable()
+
     # Chạy chương trình
-    main(args.target_date, args.output_dir, args.output_csv)
+    main(args.target_date, args.output_dir, args.output_csv, max(1, args.workers), args.timeout, args.history_csv,
+         None if args.no_cache else args.cache_dir,
+         int(args.max_git_cache_gb * 1024 ** 3), int(args.max_npm_cache_gb * 1024 ** 3), max(1, args.max_attempts),
+         args.metrics)
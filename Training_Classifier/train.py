@@ -0,0 +1,509 @@
+import os
+import sys
+import json
+import time
+import shutil
+import hashlib
+import argparse
+import tempfile
+import contextlib
+import multiprocessing
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+import pandas as pd
+import joblib
+from sklearn.model_selection import train_test_split
+from sklearn.preprocessing import StandardScaler
+from sklearn.metrics import accuracy_score, confusion_matrix, f1_score, precision_score, recall_score, roc_auc_score
+
+try:
+    from threadpoolctl import threadpool_limits
+except ImportError:
+    threadpool_limits = None
+
+TRAIN_DIR = os.path.dirname(os.path.abspath(__file__))
+BASE_DIR = os.path.join(TRAIN_DIR, '..')
+sys.path.append(os.path.join(BASE_DIR, 'Npm_Collector'))
+sys.path.append(os.path.join(BASE_DIR, 'Prediction'))
+from storage import read_table
+from predict import SCALER_FILE, predict_scaled
+from tree_engine import compile_model
+from numpy_engine import export_keras
+
+DEFAULT_DATASET = os.path.join(BASE_DIR, 'Dataset', 'npm_shuffled.csv')
+DEFAULT_OUTPUT_DIR = os.path.join(BASE_DIR, 'Trained_Model')
+DEFAULT_LOG_DIR = os.path.join(BASE_DIR, 'DL_Log')
+SUMMARY_FILE = 'training_summary.json'
+LABEL_COLUMN = 'label'
+NAME_COLUMN = 'package_name'
+TEST_SIZE = 0.2
+RANDOM_STATE = 42
+NUM_THREADS = os.cpu_count() or 1
+DIGEST_CHUNK = 1024 * 1024  # Kích thước khối đọc khi tính digest của dữ liệu
+DATASET_SUFFIXES = ('.csv', '.parquet')  # File được đọc (và tính digest) khi dữ liệu là một thư mục
+
+# Cấu hình huấn luyện các model Keras (giống các notebook)
+EPOCHS = 100
+PATIENCE = 5  # Dừng sau 5 epoch nếu val_loss không cải thiện
+LEARNING_RATE = 5e-5
+VALIDATION_SPLIT = 0.1
+
+
+def build_random_forest(threads):
+    from sklearn.ensemble import RandomForestClassifier
+    return RandomForestClassifier(n_estimators=100, random_state=RANDOM_STATE, class_weight='balanced', n_jobs=threads)
+
+
+def build_svm(threads):
+    from sklearn.svm import SVC
+    return SVC(kernel='rbf', class_weight='balanced', probability=True, random_state=RANDOM_STATE)
+
+
+def build_light_gbm(threads):
+    import lightgbm as lgb
+    return lgb.LGBMClassifier(objective='binary', random_state=RANDOM_STATE, n_jobs=threads, verbose=-1)
+
+
+def build_knn(threads):
+    from sklearn.neighbors import KNeighborsClassifier
+    return KNeighborsClassifier(n_neighbors=5, weights='distance', n_jobs=threads)
+
+
+def build_log_reg(threads):
+    from sklearn.linear_model import LogisticRegression
+    return LogisticRegression(solver='liblinear', class_weight='balanced', random_state=RANDOM_STATE)
+
+
+def build_mlp(tf, input_dim):
+    return tf.keras.models.Sequential([
+        tf.keras.layers.Input(shape=(input_dim,)),
+        tf.keras.layers.Dense(64, activation='relu'),
+        tf.keras.layers.Dropout(0.3),
+        tf.keras.layers.Dense(32, activation='relu'),
+        tf.keras.layers.Dropout(0.2),
+        tf.keras.layers.Dense(1, activation='sigmoid'),
+    ])
+
+
+def build_widedeep(tf, input_dim):
+    inputs = tf.keras.layers.Input(shape=(input_dim,))
+    deep_path = tf.keras.layers.Dense(128, activation='relu')(inputs)
+    deep_path = tf.keras.layers.BatchNormalization()(deep_path)
+    deep_path = tf.keras.layers.Dropout(0.3)(deep_path)
+    deep_path = tf.keras.layers.Dense(64, activation='relu')(deep_path)
+    deep_path = tf.keras.layers.BatchNormalization()(deep_path)
+    deep_path = tf.keras.layers.Dropout(0.2)(deep_path)
+    # Nhánh "wide" chính là đầu vào đi thẳng tới lớp đầu ra
+    merged_path = tf.keras.layers.concatenate([inputs, deep_path])
+    outputs = tf.keras.layers.Dense(1, activation='sigmoid')(merged_path)
+    return tf.keras.Model(inputs=inputs, outputs=outputs)
+
+
+def residual_block(tf, x, units, dropout_rate=0.3):
+    fx = tf.keras.layers.Dense(units, activation='relu')(x)
+    fx = tf.keras.layers.BatchNormalization()(fx)
+    fx = tf.keras.layers.Dropout(dropout_rate)(fx)
+    fx = tf.keras.layers.Dense(units)(fx)
+    # Số unit khác nhau thì cần một lớp Dense để kết nối tắt cùng kích thước
+    if x.shape[-1] != units:
+        x = tf.keras.layers.Dense(units)(x)
+    output = tf.keras.layers.add([x, fx])
+    output = tf.keras.layers.Activation('relu')(output)
+    return tf.keras.layers.BatchNormalization()(output)
+
+
+def build_resnet(tf, input_dim):
+    inputs = tf.keras.layers.Input(shape=(input_dim,))
+    x = tf.keras.layers.Dense(64, activation='relu')(inputs)
+    x = residual_block(tf, x, units=64)
+    x = residual_block(tf, x, units=64)
+    outputs = tf.keras.layers.Dense(1, activation='sigmoid')(x)
+    return tf.keras.Model(inputs=inputs, outputs=outputs)
+
+
+def build_cnn(tf, input_dim):
+    return tf.keras.models.Sequential([
+        tf.keras.layers.Input(shape=(input_dim, 1)),
+        tf.keras.layers.Conv1D(filters=32, kernel_size=3, activation='relu'),
+        tf.keras.layers.MaxPooling1D(pool_size=2),
+        tf.keras.layers.Dropout(0.3),
+        tf.keras.layers.Conv1D(filters=64, kernel_size=3, activation='relu'),
+        tf.keras.layers.GlobalMaxPooling1D(),
+        tf.keras.layers.Dropout(0.3),
+        tf.keras.layers.Dense(32, activation='relu'),
+        tf.keras.layers.Dense(1, activation='sigmoid'),
+    ])
+
+
+# Tên model -> (file model, hàm tạo model, huấn luyện được bằng nhiều luồng).
+# Thứ tự là thứ tự đưa vào pool: model chậm nhất đứng trước để tổng thời gian ngắn nhất.
+MODELS = {
+    'svm': ('svm_model.joblib', build_svm, False),
+    'cnn': ('cnn_model.keras', build_cnn, True),
+    'mlp': ('mlp_model.keras', build_mlp, True),
+    'resnet': ('resnet_model.keras', build_resnet, True),
+    'widedeep': ('widedeep_model.keras', build_widedeep, True),
+    'random_forest': ('random_forest_model.joblib', build_random_forest, True),
+    'light_gbm': ('light_gbm_model.joblib', build_light_gbm, True),
+    # KNN chỉ dựng cây tìm kiếm khi fit; n_jobs chỉ có tác dụng lúc dự đoán
+    'knn': ('knn_model.joblib', build_knn, False),
+    'log_reg': ('log_reg_model.joblib', build_log_reg, False),
+}
+# Model Keras -> (batch size, hậu tố của file log trong DL_Log)
+KERAS_MODELS = {
+    'mlp': (16, 'MLP'),
+    'widedeep': (32, 'WD'),
+    'resnet': (32, 'RN'),
+    'cnn': (16, 'CNN'),
+}
+# Model cây được biên dịch thành .trees bằng tree_engine.py khi dùng --compile
+TREE_MODELS = ('random_forest', 'light_gbm')
+# Giá trị n_jobs được lưu trong model sau khi huấn luyện (dùng lúc dự đoán, như các notebook)
+PREDICT_N_JOBS = {'random_forest': -1, 'light_gbm': -1, 'knn': -1}
+
+
+def dataset_files(path):
+    """Các file dữ liệu (.csv/.parquet) của path; bỏ qua cache .npy và workspace nằm trong thư mục dữ liệu."""
+    if os.path.isfile(path):
+        return [path]
+    return sorted(os.path.join(root, name) for root, _, names in os.walk(path) for name in names
+                  if name.endswith(DATASET_SUFFIXES) and not name.startswith('.'))
+
+
+def dataset_digest(path):
+    """Digest nội dung của file/thư mục dữ liệu, dùng làm khoá cho các mảng đã cache."""
+    m = hashlib.sha256()
+    for file_path in dataset_files(path):
+        m.update(f"{os.path.relpath(file_path, path)}\n".encode('utf-8'))
+        with open(file_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(DIGEST_CHUNK), b''):
+                m.update(chunk)
+    return m.hexdigest()[:16]
+
+
+def load_dataset(path, cache_dir):
+    """
+    Đọc dữ liệu huấn luyện (CSV/Parquet hoặc thư mục theo ngày) thành mảng float32.
+    Mảng được lưu thành .npy trong cache_dir (khoá theo nội dung dữ liệu) và được mở
+    lại bằng mmap ở các lần sau, không cần parse lại CSV.
+    Trả về (X, y, tên các đặc tính, digest).
+    """
+    digest = dataset_digest(path)
+    entry = os.path.join(cache_dir, digest)
+    if not os.path.isdir(entry):
+        df = read_table(path)
+        if LABEL_COLUMN not in df.columns:
+            raise ValueError(f"'{path}' has no '{LABEL_COLUMN}' column")
+        # Cột thiếu ở một số ngày (dữ liệu ghép từ nhiều partition) được coi là 0, như lúc dự đoán
+        features = df.drop(columns=[LABEL_COLUMN, NAME_COLUMN, 'date'], errors='ignore').fillna(0)
+        tmp_entry = tempfile.mkdtemp(prefix=f"{digest}.", dir=cache_dir)
+        np.save(os.path.join(tmp_entry, 'X.npy'), features.to_numpy(dtype=np.float32))
+        np.save(os.path.join(tmp_entry, 'y.npy'), df[LABEL_COLUMN].to_numpy(dtype=np.int64))
+        with open(os.path.join(tmp_entry, 'columns.json'), 'w') as f:
+            json.dump(list(features.columns), f)
+        try:
+            os.rename(tmp_entry, entry)
+        except OSError:
+            # Một process khác vừa tạo xong cùng entry
+            shutil.rmtree(tmp_entry, ignore_errors=True)
+
+    X = np.load(os.path.join(entry, 'X.npy'), mmap_mode='r')
+    y = np.load(os.path.join(entry, 'y.npy'), mmap_mode='r')
+    with open(os.path.join(entry, 'columns.json')) as f:
+        feature_names = json.load(f)
+    return X, y, feature_names, digest
+
+
+def prepare_training_data(X, y, feature_names, workspace):
+    """
+    Chia train/test (giống train_test_split của các notebook) và chuẩn hoá bằng một
+    StandardScaler duy nhất. Các mảng đã chuẩn hoá được ghi vào workspace để các process
+    huấn luyện mở bằng mmap. Trả về (scaler, số dòng train, số dòng test).
+    """
+    train_index, test_index = train_test_split(np.arange(len(y)), test_size=TEST_SIZE,
+                                               random_state=RANDOM_STATE, stratify=y)
+    # Scaler được fit trên DataFrame để giữ tên cột (predict.py dùng để sắp xếp lại cột)
+    X_train = pd.DataFrame(X[train_index], columns=feature_names, dtype=np.float64)
+    X_test = pd.DataFrame(X[test_index], columns=feature_names, dtype=np.float64)
+    scaler = StandardScaler().fit(X_train)
+    np.save(os.path.join(workspace, 'X_train.npy'), scaler.transform(X_train).astype(np.float32))
+    np.save(os.path.join(workspace, 'X_test.npy'), scaler.transform(X_test).astype(np.float32))
+    np.save(os.path.join(workspace, 'y_train.npy'), y[train_index])
+    np.save(os.path.join(workspace, 'y_test.npy'), y[test_index])
+    return scaler, len(train_index), len(test_index)
+
+
+def thread_budget(names, threads, jobs):
+    """
+    Số luồng cho từng model: model chỉ chạy một luồng (SVM, KNN, Logistic Regression) nhận 1,
+    model đa luồng nhận phần chia đều của tổng số luồng cho các process chạy cùng lúc.
+    """
+    per_job = max(1, threads // max(1, jobs))
+    return {name: per_job if MODELS[name][2] else 1 for name in names}
+
+
+def import_tensorflow(threads):
+    """Import TensorFlow với số luồng đã định (phải đặt trước khi TensorFlow chạy phép tính nào)."""
+    try:
+        import tensorflow as tf
+    except ImportError:
+        raise ImportError("Training Keras models needs TensorFlow. Install it with: pip install tensorflow")
+    tf.config.threading.set_intra_op_parallelism_threads(threads)
+    tf.config.threading.set_inter_op_parallelism_threads(1)
+    tf.keras.utils.set_random_seed(RANDOM_STATE)
+    return tf
+
+
+def fit_keras(name, X_train, y_train, threads, log_dir):
+    """Huấn luyện một model Keras với early stopping. Trả về (model, số epoch đã chạy)."""
+    tf = import_tensorflow(threads)
+    batch_size, log_suffix = KERAS_MODELS[name]
+    model = MODELS[name][1](tf, X_train.shape[1])
+    model.compile(optimizer=tf.keras.optimizers.Adam(learning_rate=LEARNING_RATE),
+                  loss='binary_crossentropy', metrics=['accuracy'])
+    callbacks = [tf.keras.callbacks.EarlyStopping(monitor='val_loss', patience=PATIENCE, restore_best_weights=True)]
+    if log_dir:
+        os.makedirs(log_dir, exist_ok=True)
+        log_name = datetime.now().strftime("%Hh%Mp__%d-%m-%Y") + f"_{log_suffix}.csv"
+        callbacks.append(tf.keras.callbacks.CSVLogger(os.path.join(log_dir, log_name), append=True))
+    if len(model.input_shape) == 3:
+        X_train = np.expand_dims(X_train, axis=2)
+    history = model.fit(X_train, y_train, epochs=EPOCHS, batch_size=batch_size,
+                        validation_split=VALIDATION_SPLIT, verbose=0, callbacks=callbacks)
+    return model, len(history.history['loss'])
+
+
+def save_model(model, is_keras_model, model_path):
+    """Ghi model vào thư mục staging (chỉ được chép sang output_dir bằng publish())."""
+    if is_keras_model:
+        model.save(model_path)
+    else:
+        joblib.dump(model, model_path)
+
+
+def publish(staging_dir, output_dir):
+    """
+    Chép scaler, các model và bản biên dịch từ staging_dir sang output_dir: ghi ra file tạm rồi
+    đổi tên (predict_service.py không nạp phải file ghi dở), giữ nguyên mtime nên bản .trees/.npz
+    vẫn mới hơn model của nó. Scaler được chép cuối cùng. Trả về tên các file đã chép.
+    """
+    names = sorted(os.listdir(staging_dir), key=lambda name: name == SCALER_FILE)
+    for file_name in names:
+        target = os.path.join(output_dir, file_name)
+        shutil.copy2(os.path.join(staging_dir, file_name), target + '.tmp')
+        os.replace(target + '.tmp', target)
+    return names
+
+
+def same_scaler(scaler, scaler_path):
+    """True nếu scaler_path chứa scaler giống hệt (cùng cột, cùng mean/scale)."""
+    try:
+        old = joblib.load(scaler_path)
+    except Exception:
+        return False
+    return (list(getattr(old, 'feature_names_in_', [])) == list(scaler.feature_names_in_)
+            and np.array_equal(old.mean_, scaler.mean_) and np.array_equal(old.scale_, scaler.scale_))
+
+
+def evaluate(y_true, labels, probabilities):
+    tn, fp, fn, tp = confusion_matrix(y_true, labels, labels=[0, 1]).ravel()
+    result = {
+        'accuracy': accuracy_score(y_true, labels),
+        'precision': precision_score(y_true, labels, zero_division=0),
+        'recall': recall_score(y_true, labels, zero_division=0),
+        'f1': f1_score(y_true, labels, zero_division=0),
+        'roc_auc': roc_auc_score(y_true, probabilities) if probabilities is not None else None,
+    }
+    result = {key: round(float(value), 6) if value is not None else None for key, value in result.items()}
+    result['confusion'] = {'tn': int(tn), 'fp': int(fp), 'fn': int(fn), 'tp': int(tp)}
+    return result
+
+
+def train_model(name, workspace, staging_dir, threads, log_dir=None, compile_fast=False):
+    """
+    Chạy trong một process của pool: huấn luyện một model trên dữ liệu đã chuẩn hoá
+    (mở bằng mmap), đánh giá trên tập test, lưu model vào staging_dir và trả về kết quả.
+    """
+    X_train = np.load(os.path.join(workspace, 'X_train.npy'), mmap_mode='r')
+    y_train = np.load(os.path.join(workspace, 'y_train.npy'))
+    X_test = np.load(os.path.join(workspace, 'X_test.npy'), mmap_mode='r')
+    y_test = np.load(os.path.join(workspace, 'y_test.npy'))
+    file_name, builder, _ = MODELS[name]
+    is_keras_model = name in KERAS_MODELS
+    result = {'file': file_name, 'threads': threads}
+
+    # Giới hạn cả các thread pool của BLAS/OpenMP trong process này
+    limits = threadpool_limits(threads) if threadpool_limits is not None else contextlib.nullcontext()
+    with limits:
+        start = time.perf_counter()
+        if is_keras_model:
+            model, result['epochs'] = fit_keras(name, X_train, y_train, threads, log_dir)
+        else:
+            model = builder(threads)
+            model.fit(X_train, y_train)
+            if name in PREDICT_N_JOBS:
+                model.set_params(n_jobs=PREDICT_N_JOBS[name])
+        result['fit_s'] = round(time.perf_counter() - start, 3)
+
+        start = time.perf_counter()
+        labels, probabilities = predict_scaled(model, is_keras_model, np.asarray(X_test))
+        result['eval_s'] = round(time.perf_counter() - start, 3)
+    result.update(evaluate(y_test, labels, probabilities))
+
+    model_path = os.path.join(staging_dir, file_name)
+    save_model(model, is_keras_model, model_path)
+    if compile_fast:
+        # Bản .trees/.npz cho predict.py (mới hơn model nên được dùng thay cho model gốc)
+        try:
+            if name in TREE_MODELS:
+                result['compiled'] = os.path.basename(compile_model(model_path))
+            elif is_keras_model:
+                result['compiled'] = os.path.basename(export_keras(model_path))
+        except (ImportError, ValueError) as e:
+            result['compile_error'] = str(e)
+    return result
+
+
+def train_models(names, dataset, output_dir, cache_dir, threads=NUM_THREADS, jobs=None, log_dir=DEFAULT_LOG_DIR,
+                 compile_fast=False, force=False):
+    """
+    Đọc dữ liệu một lần, chia train/test và chuẩn hoá một lần, rồi huấn luyện các model
+    trong names song song trên một process pool. Scaler và các model được ghi vào thư mục
+    staging, chỉ chép sang output_dir khi mọi model đều huấn luyện xong (một model lỗi thì
+    output_dir giữ nguyên). Khi chỉ huấn luyện một phần các model mà scaler mới khác scaler
+    đang có trong output_dir, các model còn lại sẽ không khớp scaler: báo lỗi ValueError
+    trước khi huấn luyện, trừ khi force=True.
+    Trả về bản tổng kết (thời gian từng bước, kết quả đánh giá từng model).
+    """
+    jobs = max(1, min(jobs or threads, len(names)))
+    os.makedirs(output_dir, exist_ok=True)
+    os.makedirs(cache_dir, exist_ok=True)
+    timings = {}
+
+    start = time.perf_counter()
+    X, y, feature_names, digest = load_dataset(dataset, cache_dir)
+    timings['load_s'] = round(time.perf_counter() - start, 3)
+    print(f"[1/3] Loaded {len(y)} samples with {len(feature_names)} features from '{dataset}'.")
+
+    workspace = tempfile.mkdtemp(prefix='train-', dir=cache_dir)
+    try:
+        start = time.perf_counter()
+        scaler, train_rows, test_rows = prepare_training_data(X, y, feature_names, workspace)
+        scaler_path = os.path.join(output_dir, SCALER_FILE)
+        if (set(names) != set(MODELS) and not force and os.path.exists(scaler_path)
+                and not same_scaler(scaler, scaler_path)):
+            raise ValueError(f"The new scaler differs from '{scaler_path}', so the models not retrained would no longer "
+                             f"match it. Retrain all models or pass --force to replace it anyway.")
+        staging_dir = os.path.join(workspace, 'output')
+        os.makedirs(staging_dir)
+        joblib.dump(scaler, os.path.join(staging_dir, SCALER_FILE))
+        timings['split_scale_s'] = round(time.perf_counter() - start, 3)
+        print(f"[2/3] Split into {train_rows} training and {test_rows} evaluating samples.")
+
+        budget = thread_budget(names, threads, jobs)
+        print(f"[3/3] Training {len(names)} models with {jobs} processes ({threads} threads in total)...")
+        results = {}
+        start = time.perf_counter()
+        # spawn: process con không thừa hưởng thread pool của OpenMP/BLAS đã khởi tạo trong process cha
+        with ProcessPoolExecutor(max_workers=jobs, mp_context=multiprocessing.get_context('spawn')) as executor:
+            futures = {executor.submit(train_model, name, workspace, staging_dir, budget[name], log_dir, compile_fast): name
+                       for name in names}
+            for future in as_completed(futures):
+                name = futures[future]
+                try:
+                    results[name] = future.result()
+                except Exception as e:
+                    results[name] = {'file': MODELS[name][0], 'threads': budget[name], 'error': f"{type(e).__name__}: {e}"}
+                    print(f"  -> {name}: failed ({results[name]['error']})")
+                    continue
+                print(f"  -> {name}: trained in {results[name]['fit_s']:.1f}s, accuracy {results[name]['accuracy']:.4f}")
+        timings['train_s'] = round(time.perf_counter() - start, 3)
+
+        failed = [name for name in names if 'error' in results[name]]
+        if failed:
+            published = []
+            print(f"Nothing written to '{output_dir}': {', '.join(failed)} failed.")
+        else:
+            published = publish(staging_dir, output_dir)
+            print(f"Scaler and models ({', '.join(names)}) written to '{output_dir}'.")
+    finally:
+        shutil.rmtree(workspace, ignore_errors=True)
+
+    return {
+        'time': datetime.now().isoformat(timespec='seconds'),
+        'dataset': os.path.abspath(dataset),
+        'dataset_digest': digest,
+        'samples': len(y),
+        'features': feature_names,
+        'train_samples': train_rows,
+        'test_samples': test_rows,
+        'threads': threads,
+        'jobs': jobs,
+        'timings': timings,
+        'published': published,
+        'models': {name: results[name] for name in names},
+    }
+
+
+def print_summary(summary):
+    timings = summary['timings']
+    print(f"\nLoad {timings['load_s']:.2f}s, split/scale {timings['split_scale_s']:.2f}s, training {timings['train_s']:.2f}s")
+    print(f"{'model':<15} {'threads':>7} {'fit s':>8} {'eval s':>7} {'accuracy':>9} {'precision':>9} {'recall':>7} {'f1':>7} {'roc_auc':>8}")
+    for name, result in summary['models'].items():
+        if 'error' in result:
+            print(f"{name:<15} {result['threads']:>7} failed: {result['error']}")
+            continue
+        roc_auc = f"{result['roc_auc']:.4f}" if result['roc_auc'] is not None else '-'
+        print(f"{name:<15} {result['threads']:>7} {result['fit_s']:>8.2f} {result['eval_s']:>7.2f} {result['accuracy']:>9.4f} "
+              f"{result['precision']:>9.4f} {result['recall']:>7.4f} {result['f1']:>7.4f} {roc_auc:>8}")
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(
+        description="Train the classifiers from the feature dataset in one run: the dataset is loaded, split and scaled once, "
+                    "then the models are trained in parallel processes. Writes scaler.joblib, the models and a summary.",
+        epilog="Example: python3 train.py --models random_forest,light_gbm --threads 8",
+    )
+    parser.add_argument("--dataset", default=DEFAULT_DATASET,
+                        help="Labelled features as a .csv/.parquet file or a directory of dated files.")
+    parser.add_argument("--models", default=','.join(MODELS),
+                        help=f"Comma-separated models to train ({', '.join(MODELS)}). Nothing is written unless all of them "
+                             "train successfully.")
+    parser.add_argument("--output_dir", default=DEFAULT_OUTPUT_DIR, help="Where scaler.joblib and the models are written.")
+    parser.add_argument("--cache_dir", default=None,
+                        help="Where the dataset is cached as memory-mapped .npy arrays (default: cache/ next to the dataset).")
+    parser.add_argument("--log_dir", default=DEFAULT_LOG_DIR, help="Where the per-epoch CSV logs of the Keras models are written.")
+    parser.add_argument("--threads", type=int, default=NUM_THREADS, help="Total number of threads shared by all models.")
+    parser.add_argument("--jobs", type=int, default=None,
+                        help="Models trained at the same time (default: as many as threads allow).")
+    parser.add_argument("--compile", action="store_true",
+                        help="Also compile tree models to .trees and export Keras models to .npz for predict.py.")
+    parser.add_argument("--force", action="store_true",
+                        help="Replace scaler.joblib even when only some models are retrained and the new scaler differs, "
+                             "leaving the other models in output_dir unmatched.")
+    parser.add_argument("--summary", default=None, help=f"Where the JSON summary is written (default: <output_dir>/{SUMMARY_FILE}).")
+
+    args = parser.parse_args()
+
+    names = [name for name in args.models.split(',') if name]
+    unknown = [name for name in names if name not in MODELS]
+    if unknown:
+        sys.exit(f"Unknown model(s): {', '.join(unknown)}. Choose from: {', '.join(MODELS)}")
+    if not os.path.exists(args.dataset):
+        sys.exit(f"Error: Cannot find this file '{args.dataset}'.")
+    dataset_dir = args.dataset if os.path.isdir(args.dataset) else os.path.dirname(os.path.abspath(args.dataset))
+    cache_dir = args.cache_dir or os.path.join(dataset_dir, 'cache')
+
+    try:
+        summary = train_models(names, args.dataset, args.output_dir, cache_dir, max(1, args.threads), args.jobs,
+                               args.log_dir, args.compile, args.force)
+    except ValueError as e:
+        sys.exit(f"Error: {e}")
+    print_summary(summary)
+    summary_path = args.summary or os.path.join(args.output_dir, SUMMARY_FILE)
+    with open(summary_path, 'w') as f:
+        json.dump(summary, f, indent=2)
+    print(f"\nSummary saved to '{summary_path}'.")
+    sys.exit(1 if any('error' in result for result in summary['models'].values()) else 0)
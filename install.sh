@@ -1,4 +1,5 @@
 #!/bin/bash
 
 conda install -c conda-forge numpy pandas dask dask-ml matplotlib scikit-learn
-conda install -c conda-forge pyarrow
\ No newline at end of file
+conda install -c conda-forge pyarrow
+conda install -c conda-forge aiohttp